@@ -1,4 +1,8 @@
 echo Installing CLI commands
+cd cli-common
+pip uninstall -y cli-common
+pip install -e .
+cd ..
 cd llm-cli
 pip uninstall -y llm-cli
 pip install -e .
@@ -11,5 +15,13 @@ cd tts-cli
 pip uninstall -y tts-cli
 pip install -e .
 cd ..
+cd agent-cli
+pip uninstall -y agent-cli
+pip install -e .
+cd ..
+cd voice-cli
+pip uninstall -y voice-cli
+pip install -e .
+cd ..
 
 echo Installation of CLI commands finished
\ No newline at end of file
@@ -0,0 +1,3 @@
+@echo off
+cli-agent
+cmd
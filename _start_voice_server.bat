@@ -0,0 +1,3 @@
+@echo off
+voice-server
+cmd
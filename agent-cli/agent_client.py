@@ -0,0 +1,162 @@
+"""
+Thin client of the resident cli-agent, imported by the llm, stt and tts
+entry points before anything heavy.
+
+Only stdlib modules are used. socket and json are not loaded at
+interpreter start-up and take a few milliseconds to import; beyond that,
+trying the agent costs a failed connect() when it is not running. The
+invocation is sent as one JSON line; the agent answers with JSON lines:
+
+    {"out": text}       write to stdout
+    {"err": text}       write to stderr
+    {"queue": {...}}    queue position update of an llm request
+    {"exit": code}      done, exit with this code
+    {"fallback": why}   the agent cannot serve this invocation, run it directly
+
+llm requests are served by the agent itself over a warm llm_server
+connection, with stdin and stdout relayed through this socket. stt and tts
+need the terminal and the audio devices, so on unix their stdin, stdout and
+stderr file descriptors are passed to the agent (SCM_RIGHTS), which runs the
+tool in a child forked from its already imported process. Ctrl+C is
+forwarded as {"signal": "INT"}.
+
+Where there are no unix sockets (Windows), the agent listens on a loopback
+TCP port instead, which other local users can reach too. There every
+request carries the token that the agent wrote to a file only the current
+user can read, see token_path().
+"""
+import io
+import json
+import os
+import socket
+import sys
+
+AGENT_ENV = "CLI_AGENT"  # set to "off" to always run the tools directly
+SOCKET_ENV = "CLI_AGENT_SOCKET"  # socket path (unix) or host:port (Windows)
+DEFAULT_PORT = 5099
+CONNECT_TIMEOUT = 0.5
+
+# Tools run in a forked child with the caller's stdio, which needs fd passing
+FORKED_TOOLS = {"stt", "tts"}
+CAN_PASS_FDS = hasattr(socket, "send_fds") and os.name != "nt"
+
+
+def agent_address():
+    """Socket family and address the agent listens on."""
+    configured = os.environ.get(SOCKET_ENV)
+    if os.name == "nt" or not hasattr(socket, "AF_UNIX"):
+        host, _, port = (configured or "").rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port or DEFAULT_PORT))
+    if configured:
+        return socket.AF_UNIX, configured
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    return socket.AF_UNIX, os.path.join(directory, f"cli-agent-{os.getuid()}.sock")
+
+
+def token_path():
+    """File with the token of an agent listening on TCP."""
+    _, (_, port) = agent_address()
+    directory = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(directory, f".cli-agent-{port}.token")
+
+
+def read_token():
+    try:
+        with open(token_path(), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def connect():
+    """Connected socket to the agent, or None if it is not running."""
+    if os.environ.get(AGENT_ENV, "").lower() in ("0", "off", "no"):
+        return None
+    family, address = agent_address()
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)
+    return sock
+
+
+def write(stream, text):
+    try:
+        stream.write(text)
+    except UnicodeEncodeError:
+        stream.write(text.encode(stream.encoding or "utf-8", errors="replace").decode(stream.encoding or "utf-8"))
+    stream.flush()
+
+
+def show_queue(update, state):
+    if sys.stderr.isatty():
+        print(f"\rWaiting in queue: position {update['position']}, ~{update['eta']:.0f}s", end="", flush=True, file=sys.stderr)
+        state["queue_shown"] = True
+
+
+def handoff(tool, argv):
+    """
+    Run `tool argv` through the agent. Returns the exit code, or None when
+    the caller should run the tool itself (no agent, or a fallback answer).
+    """
+    if tool in FORKED_TOOLS and not CAN_PASS_FDS:
+        return None
+    sock = connect()
+    if sock is None:
+        return None
+
+    request = {"tool": tool, "argv": argv, "cwd": os.getcwd()}
+    if sock.family != getattr(socket, "AF_UNIX", None):
+        request["token"] = read_token()
+    stdin_text = None
+    with sock:
+        try:
+            if tool in FORKED_TOOLS:
+                socket.send_fds(sock, [(json.dumps(request) + "\n").encode("utf-8")], [0, 1, 2])
+            else:
+                if not sys.stdin.isatty():
+                    stdin_text = sys.stdin.read()
+                request.update(stdin=stdin_text, stdout_tty=sys.stdout.isatty())
+                sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        except OSError:
+            return restore_stdin(stdin_text)
+
+        state = {"queue_shown": False, "output": False}
+        replies = sock.makefile("r", encoding="utf-8", newline="\n")
+        while True:
+            try:
+                for line in replies:
+                    reply = json.loads(line)
+                    if "out" in reply or "err" in reply:
+                        if state["queue_shown"]:
+                            print("\r\033[K", end="", flush=True, file=sys.stderr)
+                            state["queue_shown"] = False
+                        state["output"] = True
+                        write(sys.stdout if "out" in reply else sys.stderr, reply.get("out", reply.get("err")))
+                    elif "queue" in reply:
+                        show_queue(reply["queue"], state)
+                    elif "exit" in reply:
+                        return reply["exit"]
+                    elif "fallback" in reply:
+                        return restore_stdin(stdin_text)
+                break
+            except KeyboardInterrupt:
+                try:
+                    sock.sendall(b'{"signal": "INT"}\n')
+                except OSError:
+                    return 130
+            except (OSError, ValueError):
+                break
+        # The agent went away; rerun directly unless part of the answer was already shown
+        return 1 if state["output"] else restore_stdin(stdin_text)
+
+
+def restore_stdin(text):
+    """Put stdin that was read for the agent back for the direct path."""
+    if text is not None:
+        sys.stdin = io.StringIO(text)
+    return None
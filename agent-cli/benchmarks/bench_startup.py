@@ -0,0 +1,148 @@
+"""
+Startup-to-first-byte of the llm command with and without cli-agent.
+
+Starts the offline fake provider (llm-cli/benchmarks/fake_provider.py), an
+llm_server pointed at it and a cli-agent on a private socket, then runs
+`llm` through its entry point as a fresh process several times in each mode
+with the prompt on stdin, and reports the time from spawning the process to the first byte of the
+answer on its stdout, and to its exit, as JSON:
+
+    python agent-cli/benchmarks/bench_startup.py --runs 20 --ttft 0.05
+
+"bare_interpreter" is `python -c "print(1)"`, the floor neither mode can go below.
+stt and tts need audio devices and their servers' models, so only llm is
+measured; their handoff saves the same interpreter start and imports.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+AGENT_DIR = os.path.join(ROOT, "agent-cli")
+LLM_DIR = os.path.join(ROOT, "llm-cli")
+COMMON_DIR = os.path.join(ROOT, "cli-common")
+sys.path.insert(0, os.path.join(LLM_DIR, "benchmarks"))
+sys.path.insert(0, LLM_DIR)
+
+from hedging import percentile
+import fake_provider
+from load_test import free_port, wait_for_port
+
+
+def summarize(samples):
+    return {
+        "median": round(statistics.median(samples), 4),
+        "p95": round(percentile(samples, 0.95), 4),
+        "min": round(min(samples), 4),
+    }
+
+
+async def time_command(command, env, stdin=b""):
+    """Seconds from spawning `command` to its first stdout byte and to its exit."""
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *command, env=env, stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    process.stdin.write(stdin)
+    process.stdin.close()
+    first = await process.stdout.read(1)
+    first_byte = time.perf_counter() - started
+    rest = await process.stdout.read()
+    stderr = await process.stderr.read()
+    await process.wait()
+    if not first or process.returncode != 0:
+        raise RuntimeError(f"{command} failed ({process.returncode}): {stderr.decode(errors='replace')[-500:]}")
+    return first_byte, time.perf_counter() - started, len(first + rest)
+
+
+async def measure(command, env, runs, stdin=b""):
+    first_bytes, totals = [], []
+    for _ in range(runs):
+        first_byte, total, _ = await time_command(command, env, stdin)
+        first_bytes.append(first_byte)
+        totals.append(total)
+    return {"first_byte": summarize(first_bytes), "exit": summarize(totals)}
+
+
+async def wait_for_socket(path, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"cli-agent did not create {path}")
+        await asyncio.sleep(0.05)
+
+
+async def main_async(args):
+    provider = fake_provider.from_arguments(args)
+    provider_port = free_port()
+    provider_server = await provider.start("localhost", provider_port)
+    server_port = free_port()
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "offline")
+    env["PYTHONPATH"] = os.pathsep.join([AGENT_DIR, LLM_DIR, COMMON_DIR] + [path for path in [env.get("PYTHONPATH")] if path])
+    if os.name == "nt":
+        agent_port = free_port()
+        env["CLI_AGENT_SOCKET"] = f"127.0.0.1:{agent_port}"
+    else:
+        env["CLI_AGENT_SOCKET"] = os.path.join(tempfile.mkdtemp(), "agent.sock")
+
+    server_command = [sys.executable, os.path.join(LLM_DIR, "llm_server.py"), "--port", str(server_port),
+                      "--metrics-port", "0", "--log-level", "WARNING"]
+    for override in fake_provider.endpoint_overrides("localhost", provider_port):
+        server_command += ["--endpoint", override]
+    server = await asyncio.create_subprocess_exec(*server_command, env=env, stdout=asyncio.subprocess.DEVNULL)
+    agent = None
+    try:
+        await wait_for_port("localhost", server_port)
+        llm = [sys.executable, os.path.join(LLM_DIR, "llm_entry.py"), "--server", f"ws://localhost:{server_port}",
+               "--provider", args.provider, "--no-cache"]
+        prompt = args.prompt.encode("utf-8")
+
+        report = {
+            "runs": args.runs,
+            "provider_ttft": args.ttft,
+            "bare_interpreter": (await measure([sys.executable, "-c", "print(1)"], env, args.runs))["first_byte"],
+            "direct": await measure(llm, dict(env, CLI_AGENT="off"), args.runs, prompt),
+        }
+
+        agent = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(AGENT_DIR, "cli_agent.py"), "--tools", "llm", "--log-level", "WARNING", env=env)
+        if os.name == "nt":
+            await wait_for_port("127.0.0.1", agent_port)
+        else:
+            await wait_for_socket(env["CLI_AGENT_SOCKET"])
+        await time_command(llm, env, prompt)  # opens the agent's warm connection
+        report["agent"] = await measure(llm, env, args.runs, prompt)
+        report["first_byte_speedup"] = round(report["direct"]["first_byte"]["median"] / report["agent"]["first_byte"]["median"], 2)
+        return report
+    finally:
+        for process in (agent, server):
+            if process is not None and process.returncode is None:
+                process.terminate()
+                await process.wait()
+        provider_server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-to-first-byte of llm with and without cli-agent")
+    parser.add_argument("--runs", type=int, default=10, help="Invocations per mode")
+    parser.add_argument("--provider", default="openai", help="Provider to request")
+    parser.add_argument("--prompt", default="Explain quantum computing.", help="User message")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    fake_provider.add_arguments(parser)
+    parser.set_defaults(ttft=0.0, tokens=20, token_rate=0.0)
+    args = parser.parse_args()
+    report = asyncio.run(main_async(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Cold start budget check for the llm, stt and tts entry points.
+
+Runs `<tool> --help` through each entry point in fresh interpreters under
+`python -X importtime` (best of --runs) and exits with 1 when one of them
+imports a heavy module (asyncio, websockets, pyaudio, numpy, ...) or when
+the imports done by the entry point take longer than --budget-ms. The
+interpreter's own startup (site, encodings) is not counted, it is the same
+for every command. The import time of each client module, i.e. what a real
+invocation pays on top, is reported as well and checked against
+--client-budget-ms when given; clients whose dependencies are not installed
+are skipped.
+
+This is the regression check for start-up time. Run it from the
+repository root after changing an entry point or anything it imports;
+every problem is printed as a FAIL line and the exit status is 1. Timings
+depend on the machine, --budget-ms 0 checks only which modules --help
+imports, which is the same everywhere:
+
+    python agent-cli/benchmarks/check_startup.py --budget-ms 25
+    python agent-cli/benchmarks/check_startup.py --budget-ms 0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TOOLS = {"llm": "llm-cli", "stt": "stt-cli", "tts": "tts-cli"}
+HEAVY_MODULES = {"asyncio", "websockets", "websocket", "pyaudio", "numpy", "colorama", "subprocess"}
+
+
+def import_times(tool, code):
+    """Modules imported after interpreter startup as (name, cumulative us, top level), or an error."""
+    env = dict(os.environ, CLI_AGENT="off")
+    paths = [os.path.join(ROOT, TOOLS[tool]), os.path.join(ROOT, "cli-common"), env.get("PYTHONPATH")]
+    env["PYTHONPATH"] = os.pathsep.join(path for path in paths if path)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    errors = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        top_level = len(name) - len(name.lstrip()) == 1
+        if top_level and name.strip() == "site":
+            modules = []  # everything before belongs to interpreter startup
+            continue
+        modules.append((name.strip(), int(cumulative), top_level))
+    if result.returncode != 0:
+        return None, "\n".join(errors[-3:])
+    return modules, None
+
+
+def measure(tool, code, runs):
+    best = None
+    for _ in range(runs):
+        modules, error = import_times(tool, code)
+        if modules is None:
+            return None, error
+        total = sum(cumulative for _, cumulative, top_level in modules if top_level)
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best, None
+
+
+def check_tool(tool, args):
+    report = {}
+    failures = []
+
+    help_code = f"import sys; sys.argv = [{tool!r}, '--help']\ntry:\n    from {tool}_entry import main; main()\nexcept SystemExit:\n    pass"
+    best, error = measure(tool, help_code, args.runs)
+    if best is None:
+        return {"error": error}, [f"{tool} --help failed: {error}"]
+    total, modules = best
+    heavy = sorted({name.split(".")[0] for name, _, _ in modules} & HEAVY_MODULES)
+    report["help_imports_ms"] = round(total / 1000, 1)
+    report["help_heavy_modules"] = heavy
+    if heavy:
+        failures.append(f"{tool} --help imports {', '.join(heavy)}")
+    if args.budget_ms and total / 1000 > args.budget_ms:
+        failures.append(f"{tool} --help imports take {total / 1000:.1f} ms, budget {args.budget_ms} ms")
+
+    best, error = measure(tool, f"import {tool}_client", args.runs)
+    if best is None:
+        report["client_import"] = f"skipped, {error.splitlines()[-1] if error else 'import failed'}"
+    else:
+        client_ms = best[0] / 1000
+        report["client_imports_ms"] = round(client_ms, 1)
+        if args.client_budget_ms is not None and client_ms > args.client_budget_ms:
+            failures.append(f"importing {tool}_client takes {client_ms:.1f} ms, budget {args.client_budget_ms} ms")
+    return report, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when the CLI entry points start slower than a budget")
+    parser.add_argument("--budget-ms", type=float, default=25.0, help="Max import time of `<tool> --help` after interpreter startup, 0 to check the imported modules only")
+    parser.add_argument("--client-budget-ms", type=float, help="Max import time of each client module (not checked by default)")
+    parser.add_argument("--runs", type=int, default=5, help="Measurements per check, the fastest one counts")
+    parser.add_argument("--tool", action="append", choices=sorted(TOOLS), help="Tool to check, repeatable (default all)")
+    args = parser.parse_args()
+
+    report = {}
+    failures = []
+    for tool in args.tool or sorted(TOOLS):
+        report[tool], tool_failures = check_tool(tool, args)
+        failures.extend(tool_failures)
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
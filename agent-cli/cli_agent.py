@@ -0,0 +1,528 @@
+"""
+Resident local agent for the llm, stt and tts commands.
+
+Without it every invocation starts an interpreter, imports websockets,
+asyncio (and numpy/pyaudio for tts), probes its server and opens a new
+websocket, so a `stt | llm | tts` chain pays three cold starts per
+utterance. While the agent runs, the commands hand their invocation to it
+through agent_client and exit with its result:
+
+- llm prompts are sent over one warm websocket per llm_server, shared by all
+  handed-off requests with the id-tagged protocol. Prompts the agent cannot
+  serve (--batch, --chunked, --help, interactive input, server not
+  reachable) are answered with a fallback and run directly as before.
+- stt and tts run in a child with their modules imported already, with the
+  caller's stdin, stdout and stderr. The children are forked by a helper
+  process (ForkHelper) that the agent forks before it starts any thread, so
+  no child inherits a lock held by another thread. This needs fd passing,
+  so on Windows they always run directly.
+
+    cli-agent                        # listen on the default socket
+    cli-agent --socket /tmp/a.sock   # or CLI_AGENT_SOCKET=/tmp/a.sock
+    CLI_AGENT=off llm "..."          # bypass a running agent
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import itertools
+import json
+import logging
+import os
+import secrets
+import select
+import signal
+import socket
+import sys
+import traceback
+
+import websockets
+
+import agent_client
+
+logger = logging.getLogger(__name__)
+
+TOOL_MODULES = {"llm": "llm_client", "stt": "stt_client", "tts": "tts_client"}
+
+# Same per-frame timeout as LLMClient.send_and_receive
+LLM_FRAME_TIMEOUT = 5.0
+
+
+class LLMConnection:
+    """
+    Warm websocket to one llm_server. Requests get agent-unique ids so they
+    stream concurrently on it (llm_connection.MultiplexedConnection of
+    llm-cli); it is reopened on the next request after the server closed it.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        self.ids = itertools.count(1)
+        self.lock = asyncio.Lock()
+
+    async def get_connection(self):
+        from llm_connection import MultiplexedConnection  # llm-cli, there when llm is served
+
+        async with self.lock:
+            if self.connection is None or self.connection.closed:
+                websocket = await websockets.connect(self.url, max_size=None, open_timeout=5)
+                self.connection = MultiplexedConnection(websocket)
+                asyncio.create_task(self.read_frames(self.connection))
+                logger.info(f"Connected to {self.url}")
+            return self.connection
+
+    async def read_frames(self, connection):
+        await connection.read_frames()
+        logger.info(f"Connection to {self.url} closed")
+
+    async def request(self, data, on_frame):
+        """
+        Send one prompt and pass its frames to on_frame until it is done.
+        Returns the last frame, {"done": true} or {"error"}. A timeout, Ctrl+C
+        or a vanished caller stops the generation.
+        """
+        connection = await self.get_connection()
+        request_id = f"agent-{next(self.ids)}"
+        try:
+            return await connection.request(request_id, data, on_frame, LLM_FRAME_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.info(f"Timeout waiting for response to {request_id}")
+            return {"id": request_id, "error": f"No response from the LLM server for {LLM_FRAME_TIMEOUT:g}s"}
+        except websockets.exceptions.ConnectionClosed:
+            return {"id": request_id, "error": "Connection to the LLM server closed"}
+
+
+class Fallback(Exception):
+    """The invocation has to run directly, the message says why."""
+
+
+class ForkHelper:
+    """
+    Process that forks the stt and tts children. It is forked from the agent
+    before asyncio or any thread starts (like multiprocessing's forkserver),
+    stays single-threaded and only forks and reaps. The agent sends it a
+    request {"tool", "argv", "cwd"} with the caller's stdio fds; it answers
+    {"pid"} (or {"error"}) once forked and {"pid", "status"} when the child
+    ended. One message per packet on a SOCK_SEQPACKET socket pair.
+    """
+
+    def __init__(self, tools):
+        self.sock, helper_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.pid = os.fork()
+        if self.pid == 0:
+            self.sock.close()
+            run_fork_helper(helper_sock, tools)  # does not return
+        helper_sock.close()
+        self.sock.setblocking(False)
+        self.forking = []  # futures of the sent requests, answered in order
+        self.exits = {}  # pid: future of its wait status
+
+    async def read_replies(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                data = await loop.sock_recv(self.sock, 65536)
+                if not data:
+                    break
+                reply = json.loads(data)
+                if "status" in reply:
+                    self.exits.pop(reply["pid"]).set_result(reply["status"])
+                elif "pid" in reply:
+                    self.exits[reply["pid"]] = loop.create_future()
+                    self.forking.pop(0).set_result(reply["pid"])
+                else:
+                    self.forking.pop(0).set_exception(OSError(reply["error"]))
+        finally:
+            logger.info("Fork helper stopped")
+            for future in self.forking + list(self.exits.values()):
+                if not future.done():
+                    future.set_exception(ConnectionError("The fork helper stopped"))
+
+    async def fork(self, request, fds):
+        """Fork a child running `request` with `fds` as its stdio, returns its pid."""
+        future = asyncio.get_running_loop().create_future()
+        message = json.dumps({key: request.get(key) for key in ("tool", "argv", "cwd")}).encode("utf-8")
+        socket.send_fds(self.sock, [message], fds)
+        self.forking.append(future)
+        return await future
+
+    def wait(self, pid):
+        """Future of the wait status of a child forked by fork()."""
+        return self.exits[pid]
+
+    def close(self):
+        self.sock.close()  # the helper exits when it reads the end of the socket
+        with contextlib.suppress(ChildProcessError):
+            os.waitpid(self.pid, 0)
+
+
+class CLIAgent:
+    def __init__(self, tools, token=None, fork_helper=None):
+        self.tools = tools
+        self.token = token  # required from TCP callers
+        self.fork_helper = fork_helper
+        self.connections = {}
+        self.stats = {"llm": 0, "forked": 0, "fallback": 0}
+
+    async def serve(self, listener):
+        loop = asyncio.get_running_loop()
+        while True:
+            sock, _ = await loop.sock_accept(listener)
+            asyncio.create_task(self.handle_connection(sock))
+
+    async def read_request(self, sock):
+        """The JSON request line and, on unix, the stdio fds sent with it."""
+        loop = asyncio.get_running_loop()
+        data = b""
+        fds = []
+        while b"\n" not in data:
+            if sock.family == socket.AF_UNIX:
+                await wait_readable(loop, sock)
+                try:
+                    chunk, received, _, _ = socket.recv_fds(sock, 65536, 3)
+                except BlockingIOError:
+                    continue
+                fds.extend(received)
+            else:
+                chunk = await loop.sock_recv(sock, 65536)
+            if not chunk:
+                break
+            data += chunk
+        return json.loads(data), fds
+
+    async def handle_connection(self, sock):
+        sock.setblocking(False)
+        fds = []
+        writer = None
+        try:
+            request, fds = await self.read_request(sock)
+            if sock.family != socket.AF_UNIX and not secrets.compare_digest(str(request.get("token")), self.token or ""):
+                logger.warning("Rejected a request without the agent's token")
+                return
+            reader, writer = await asyncio.open_connection(sock=sock)
+
+            async def send(message):
+                writer.write((json.dumps(message) + "\n").encode("utf-8"))
+                await writer.drain()
+
+            tool = request.get("tool")
+            try:
+                if tool not in self.tools:
+                    raise Fallback(f"{tool} is not loaded in the agent")
+                if tool == "llm":
+                    code = await self.serve_llm(request, reader, send)
+                else:
+                    code = await self.serve_forked(request, fds, reader)
+            except Fallback as reason:
+                self.stats["fallback"] += 1
+                logger.info(f"Fallback for {tool}: {reason}")
+                await send({"fallback": str(reason)})
+            else:
+                await send({"exit": code})
+        except (ConnectionError, ValueError) as e:
+            logger.info(f"Connection ended: {e}")
+        except Exception as e:
+            logger.exception(f"Error serving request: {e}")
+        finally:
+            for fd in fds:
+                os.close(fd)
+            if writer is not None:
+                writer.close()
+            else:
+                sock.close()
+
+    async def run_until_signal(self, reader, work, on_signal):
+        """
+        Run `work` while reading the caller's messages. {"signal": "INT"}
+        calls on_signal(), a closed connection cancels `work`.
+        """
+        task = asyncio.create_task(work)
+
+        async def read_signals():
+            while True:
+                line = await reader.readline()
+                if not line:
+                    task.cancel()
+                    return
+                if json.loads(line).get("signal") == "INT":
+                    on_signal(task)
+
+        watcher = asyncio.create_task(read_signals())
+        try:
+            return await task
+        finally:
+            watcher.cancel()
+
+    async def serve_llm(self, request, reader, send):
+        llm_client = self.tools["llm"]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                args = llm_client.parse_arguments(request["argv"])
+        except SystemExit:
+            raise Fallback("--help or invalid arguments")
+        if args.batch or args.chunked:
+            raise Fallback("--batch and --chunked run directly")
+
+        stdin = request.get("stdin")
+        if stdin is not None:
+            user_message = stdin.strip()
+            system_message = args.system or " ".join(args.input) or ""
+        else:
+            system_message = args.system or ""
+            user_message = " ".join(args.input)
+        if not user_message:
+            raise Fallback("interactive input")
+
+        connection = self.connections.get(args.server)
+        if connection is None:
+            connection = self.connections[args.server] = LLMConnection(args.server)
+        try:
+            await connection.get_connection()
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            raise Fallback(f"LLM server at {args.server} not reachable: {e}")
+
+        self.stats["llm"] += 1
+        data = llm_client.create_client(args).build_request(system_message, user_message)
+
+        async def on_frame(frame):
+            if "delta" in frame:
+                await send({"out": frame["delta"]})
+            elif "raw" in frame:
+                await send({"out": frame["raw"]})
+            elif frame.get("type") == "queue":
+                await send({"queue": {"position": frame["position"], "eta": frame["eta"]}})
+
+        try:
+            end = await self.run_until_signal(reader, connection.request(data, on_frame), lambda task: task.cancel())
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            return 130
+        if "error" in end:
+            await send({"err": f"Error: {end['error']}\n"})
+            return 1
+        return 0
+
+    async def serve_forked(self, request, fds, reader):
+        if len(fds) != 3:
+            raise Fallback("stdin, stdout and stderr were not passed")
+        if self.fork_helper is None:
+            raise Fallback("the fork helper is not running")
+        try:
+            pid = await self.fork_helper.fork(request, fds)
+        except (OSError, ConnectionError) as e:
+            raise Fallback(f"forking failed: {e}")
+        for fd in fds:
+            os.close(fd)
+        fds.clear()
+        self.stats["forked"] += 1
+        logger.info(f"Forked {request['tool']} as pid {pid}")
+        waiting = self.fork_helper.wait(pid)
+
+        async def wait():
+            return os.waitstatus_to_exitcode(await asyncio.shield(waiting))
+
+        try:
+            code = await self.run_until_signal(reader, wait(), lambda task: os.kill(pid, signal.SIGINT))
+        except asyncio.CancelledError:
+            # The caller is gone, so is the terminal the child was using
+            os.kill(pid, signal.SIGTERM)
+            await waiting
+            raise
+        return code if code >= 0 else 128 - code
+
+
+def wait_readable(loop, sock):
+    future = loop.create_future()
+
+    def ready():
+        loop.remove_reader(sock.fileno())
+        if not future.done():
+            future.set_result(None)
+
+    loop.add_reader(sock.fileno(), ready)
+    return future
+
+
+def run_fork_helper(sock, tools):
+    """Main loop of the ForkHelper process: fork children on request, report their ends."""
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C of the agent's terminal; the agent closes the socket
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        children = set()
+        while True:
+            readable, _, _ = select.select([sock, wakeup_read], [], [])
+            if wakeup_read in readable:
+                with contextlib.suppress(BlockingIOError):
+                    while os.read(wakeup_read, 512):
+                        pass
+                for pid in list(children):
+                    done, status = os.waitpid(pid, os.WNOHANG)
+                    if done:
+                        children.remove(pid)
+                        sock.send(json.dumps({"pid": pid, "status": status}).encode("utf-8"))
+            if sock in readable:
+                data, fds, _, _ = socket.recv_fds(sock, 65536, 3)
+                if not data:
+                    break
+                request = json.loads(data)
+                try:
+                    pid = os.fork()
+                except OSError as e:
+                    sock.send(json.dumps({"error": str(e)}).encode("utf-8"))
+                else:
+                    if pid == 0:
+                        run_child(tools[request["tool"]], request, fds)  # does not return
+                    children.add(pid)
+                    sock.send(json.dumps({"pid": pid}).encode("utf-8"))
+                for fd in fds:
+                    os.close(fd)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def run_child(module, request, fds):
+    """Run a tool's main() in a forked child with the caller's stdio."""
+    code = 1
+    try:
+        os.setsid()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        os.closerange(3, 65536)  # the agent's sockets and event loop
+        os.chdir(request.get("cwd") or os.getcwd())
+        sys.stdin = open(0, closefd=False)
+        sys.stdout = open(1, "w", buffering=1 if os.isatty(1) else -1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        sys.argv = [request["tool"]] + request["argv"]
+
+        for handler in list(logging.root.handlers):
+            logging.root.removeHandler(handler)
+        logging.root.setLevel(logging.WARNING)
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        asyncio.events._set_running_loop(None)
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+        module.main()
+        code = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+    except KeyboardInterrupt:
+        code = 130
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        with contextlib.suppress(Exception):
+            sys.stdout.flush()
+            sys.stderr.flush()
+        os._exit(code)
+
+
+def load_tools(names):
+    tools = {}
+    for name in names:
+        try:
+            tools[name] = importlib.import_module(TOOL_MODULES[name])
+        except ImportError as e:
+            logger.warning(f"{name} runs directly, its client could not be imported: {e}")
+    return tools
+
+
+def create_listener():
+    family, address = agent_client.agent_address()
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            probe = agent_client.connect()
+            if probe is not None:
+                probe.close()
+                raise SystemExit(f"An agent is already listening on {address}")
+            os.unlink(address)  # left behind by an agent that was killed
+    elif address[0] not in ("127.0.0.1", "localhost", "::1"):
+        raise SystemExit(f"The agent only listens on the loopback interface, not {address[0]}")
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX:
+        old_umask = os.umask(0o177)  # only the current user may connect
+        try:
+            listener.bind(address)
+        finally:
+            os.umask(old_umask)
+    else:
+        listener.bind(address)
+    listener.listen(64)
+    listener.setblocking(False)
+    return listener, address
+
+
+def write_token():
+    """A new token for TCP callers, in a file only the current user can read."""
+    token = secrets.token_hex(16)
+    path = agent_client.token_path()
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with open(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return token
+
+
+async def main_async(tools, fork_helper):
+    listener, address = create_listener()
+    token = write_token() if listener.family != socket.AF_UNIX else None
+    agent = CLIAgent(tools, token, fork_helper)
+    if fork_helper is not None:
+        asyncio.create_task(fork_helper.read_replies())
+    if sys.platform != "win32":
+        # Remove the socket on `kill` as well as on Ctrl+C
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    logger.info(f"cli-agent listening on {address}, serving {', '.join(tools) or 'nothing'}")
+    try:
+        await agent.serve(listener)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        listener.close()
+        with contextlib.suppress(OSError):
+            os.unlink(address if listener.family == socket.AF_UNIX else agent_client.token_path())
+        logger.info(f"Served {agent.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident agent that keeps the llm, stt and tts commands warm")
+    parser.add_argument("--socket", help=f"Socket path, or host:port on Windows (default: ${agent_client.SOCKET_ENV} or a per-user socket)")
+    parser.add_argument("--tools", default="llm,stt,tts", help="Comma separated tools to serve")
+    parser.add_argument("--log-level", default="INFO", help="Logging level")
+    args = parser.parse_args()
+    if args.socket:
+        os.environ[agent_client.SOCKET_ENV] = args.socket
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    tools = load_tools(args.tools.split(","))
+    if not agent_client.CAN_PASS_FDS:
+        tools = {name: module for name, module in tools.items() if name not in agent_client.FORKED_TOOLS}
+    # Before asyncio.run, while this process has a single thread
+    fork_helper = ForkHelper(tools) if agent_client.FORKED_TOOLS & tools.keys() else None
+    try:
+        asyncio.run(main_async(tools, fork_helper))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fork_helper is not None:
+            fork_helper.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+from setuptools import setup, find_packages
+
+setup(
+    name="agent-cli",
+    version="0.1",
+    packages=find_packages(),
+    entry_points={
+        'console_scripts': [
+            'cli-agent=cli_agent:main',
+        ],
+    },
+)
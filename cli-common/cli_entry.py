@@ -0,0 +1,72 @@
+"""
+Start of the llm, stt and tts commands, shared by their <tool>_entry.py
+modules and installed with each of them (pip install -e cli-common).
+
+run() hands the invocation to a running cli-agent when agent-cli is
+installed, and otherwise parses the arguments and runs the tool's client.
+--profile-startup runs the invocation again under `python -X importtime`
+and prints its slowest top-level imports. Only stdlib modules are used, and
+only os and sys at import time, so a command's start-up stays as cheap as
+its argument parsing.
+"""
+import os
+import sys
+
+
+def run(tool, tool_dir, parse_arguments, client_module):
+    """
+    Run `tool` with the process's arguments: `tool_dir` is the directory of
+    <tool>_entry.py, `parse_arguments(argv)` its parser and
+    `client_module` the module whose main(args) does the work.
+    """
+    argv = sys.argv[1:]
+    if "--profile-startup" in argv:
+        sys.exit(profile_startup(tool, tool_dir, [arg for arg in argv if arg != "--profile-startup"]))
+
+    try:
+        import agent_client
+    except ImportError:
+        agent_client = None
+    if agent_client is not None:
+        exit_code = agent_client.handoff(tool, argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    args = parse_arguments(argv)
+    __import__(client_module).main(args)
+
+
+def profile_startup(tool, tool_dir, argv, top=15):
+    """
+    Run `tool argv` again under `python -X importtime`, without the agent,
+    with `tool_dir` (the directory of <tool>_entry.py) on the path, and
+    print its slowest top-level imports to stderr. Returns its exit code.
+    """
+    # Only here, a normal invocation does not pay for them
+    import subprocess
+    import time
+
+    env = dict(os.environ, CLI_AGENT="off")
+    common_dir = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = os.pathsep.join(path for path in [tool_dir, common_dir, env.get("PYTHONPATH")] if path)
+    code = f"import sys; sys.argv[0] = {tool!r}; from {tool}_entry import main; main()"
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code] + argv, env=env, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - started
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            print(line, file=sys.stderr)
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit() and len(name) - len(name.lstrip()) == 1:
+            imports.append((int(cumulative), int(self_us), name.strip()))
+
+    print(f"\nStartup profile of {tool} (python -X importtime):", file=sys.stderr)
+    print(f"{'cumulative':>12} {'self':>10}  module", file=sys.stderr)
+    for cumulative, self_us, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative / 1000:9.1f} ms {self_us / 1000:7.1f} ms  {name}", file=sys.stderr)
+    total = sum(cumulative for cumulative, _, _ in imports)
+    print(f"Imports took {total / 1000:.1f} ms of {elapsed * 1000:.0f} ms until exit", file=sys.stderr)
+    return result.returncode
@@ -0,0 +1,8 @@
+from setuptools import setup, find_packages
+
+setup(
+    name="cli-common",
+    version="0.1",
+    packages=find_packages(),
+    py_modules=["cli_entry"],
+)
@@ -0,0 +1,100 @@
+"""
+Benchmark of websocket frames and server CPU with and without delta
+coalescing.
+
+Simulates many clients each receiving a token stream at a fixed rate. Every
+frame is encoded like a websocket text frame and written to a socket pair,
+so per-frame encoding and syscall overhead is included.
+
+    python benchmarks/bench_coalescer.py --clients 50 --tokens 400 --rate 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delta_coalescer import DeltaCoalescer
+
+
+def encode_frame(text):
+    """Encode an unmasked server-to-client websocket text frame."""
+    payload = text.encode("utf-8")
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x81, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x81, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, length)
+    return header + payload
+
+
+def drain(sock):
+    while sock.recv(65536):
+        pass
+
+
+async def run_client(writer, tokens, rate, interval, max_bytes):
+    async def send(text):
+        writer.sendall(encode_frame(text))
+
+    coalescer = DeltaCoalescer(send, interval, max_bytes)
+    delay = 1.0 / rate
+    for i in range(tokens):
+        await coalescer.push(f" tok{i}")
+        await asyncio.sleep(delay)
+    await coalescer.close()
+    await send("")
+    return coalescer.frames
+
+
+async def run(args, interval):
+    writer, reader = socket.socketpair()
+    threading.Thread(target=drain, args=(reader,), daemon=True).start()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    frames = await asyncio.gather(*[
+        run_client(writer, args.tokens, args.rate, interval, args.flush_bytes)
+        for _ in range(args.clients)
+    ])
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    writer.close()
+
+    total_frames = sum(frames)
+    return {
+        "flush_ms": interval * 1000,
+        "frames": total_frames,
+        "frames_per_s": round(total_frames / wall, 1),
+        "cpu_s": round(cpu, 3),
+        "cpu_us_per_token": round(cpu / (args.clients * args.tokens) * 1e6, 2),
+        "wall_s": round(wall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta coalescing benchmark")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent simulated clients")
+    parser.add_argument("--tokens", type=int, default=400, help="Tokens per response")
+    parser.add_argument("--rate", type=float, default=100.0, help="Tokens per second per client")
+    parser.add_argument("--flush-ms", type=float, default=20.0, help="Coalescing interval to compare against per-token frames")
+    parser.add_argument("--flush-bytes", type=int, default=512, help="Coalescing size limit")
+    args = parser.parse_args()
+
+    results = {
+        "before": asyncio.run(run(args, 0.0)),
+        "after": asyncio.run(run(args, args.flush_ms / 1000.0)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
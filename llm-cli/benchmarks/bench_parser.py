@@ -0,0 +1,161 @@
+"""
+Microbenchmark of the provider stream parsers over recorded stream fixtures.
+
+Compares the previous line-based handlers (decode to text, split lines,
+startswith checks, json.loads per line) against stream_parser working on
+raw byte chunks, with the stdlib JSON decoder and with orjson if installed.
+
+    python benchmarks/bench_parser.py --chunk-size 256 --repeat 100
+"""
+import argparse
+import asyncio
+import codecs
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stream_parser
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+STREAMS = {
+    "openai": ("openai_stream.txt", stream_parser.iter_openai_deltas),
+    "anthropic": ("anthropic_stream.txt", stream_parser.iter_anthropic_deltas),
+    "ollama": ("ollama_stream.ndjson", stream_parser.iter_ollama_deltas),
+}
+
+
+class aiter_chunks:
+    """The fixture body as a stream of fixed-size network reads."""
+
+    def __init__(self, body, chunk_size):
+        self.chunks = iter([body[start:start + chunk_size] for start in range(0, len(body), chunk_size)])
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+async def aiter_lines(chunks):
+    """What httpx aiter_lines did for the old handlers: decode, then split lines."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    if buffer:
+        yield buffer
+
+
+async def legacy_openai(chunks):
+    lines = aiter_lines(chunks)
+    async for line in lines:
+        if line.startswith("data: "):
+            if line.strip() == "data: [DONE]":
+                await lines.aclose()
+                break
+            json_data = json.loads(line[6:])
+            content = json_data['choices'][0]['delta'].get('content')
+            if content:
+                yield content
+
+
+async def legacy_anthropic(chunks):
+    lines = aiter_lines(chunks)
+    async for line in lines:
+        if line.startswith("data: "):
+            event_data = json.loads(line[6:].strip())
+            event_type = event_data.get("type")
+            if event_type == "content_block_delta":
+                delta = event_data.get("delta", {}).get("text", "")
+                if delta:
+                    yield delta
+            elif event_type == "message_stop":
+                await lines.aclose()
+                break
+
+
+async def legacy_ollama(chunks):
+    lines = aiter_lines(chunks)
+    async for line in lines:
+        json_data = json.loads(line)
+        if json_data.get('done'):
+            await lines.aclose()
+            break
+        content = json_data.get('message', {}).get('content', '')
+        if content:
+            yield content
+
+
+LEGACY = {"openai": legacy_openai, "anthropic": legacy_anthropic, "ollama": legacy_ollama}
+
+
+async def consume(parse, body, chunk_size):
+    stream = parse(aiter_chunks(body, chunk_size))
+    try:
+        return [delta async for delta in stream]
+    finally:
+        await stream.aclose()
+
+
+def measure(parse, body, chunk_size, repeat, rounds):
+    """Return the deltas and the best per-parse time over several rounds."""
+    loop = asyncio.new_event_loop()
+    best = float("inf")
+    try:
+        expected = loop.run_until_complete(consume(parse, body, chunk_size))
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                loop.run_until_complete(consume(parse, body, chunk_size))
+            best = min(best, (time.perf_counter() - started) / repeat)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+    return expected, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream parser microbenchmark")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Bytes per simulated network chunk")
+    parser.add_argument("--repeat", type=int, default=100, help="Parses per round")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds per measurement, the best one is reported")
+    args = parser.parse_args()
+
+    decoders = {"json": stream_parser.stdlib_loads}
+    try:
+        import orjson
+        decoders["orjson"] = orjson.loads
+    except ImportError:
+        pass
+
+    results = {}
+    for name, (filename, parse) in STREAMS.items():
+        with open(os.path.join(FIXTURES, filename), "rb") as f:
+            body = f.read()
+        reference, legacy_time = measure(LEGACY[name], body, args.chunk_size, args.repeat, args.rounds)
+        result = {"deltas": len(reference), "legacy_us": round(legacy_time * 1e6, 1)}
+        for decoder_name, loads in decoders.items():
+            stream_parser.json_loads = loads
+            deltas, elapsed = measure(parse, body, args.chunk_size, args.repeat, args.rounds)
+            assert deltas == reference, f"{name} parser output differs from legacy handler"
+            result[f"incremental_{decoder_name}_us"] = round(elapsed * 1e6, 1)
+            result[f"speedup_{decoder_name}"] = round(legacy_time / elapsed, 2)
+        results[name] = result
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
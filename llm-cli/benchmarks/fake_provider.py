@@ -0,0 +1,327 @@
+"""
+Offline stand-in for the LLM providers used by llm_server.
+
+Serves the chat completion endpoints of OpenAI and the OpenAI-compatible
+local servers (/v1/chat/completions, SSE), Anthropic (/v1/messages, SSE) and Ollama
+(/api/chat, NDJSON) on one local port, streaming generated tokens in the
+same wire formats as the real services. Time to first token, token rate,
+response length, failures and rate limiting are configurable, so
+llm_server can be load tested without network access:
+
+    python benchmarks/fake_provider.py --port 8900 --ttft 0.2 --token-rate 50
+    python llm_server.py --endpoint openai=http://localhost:8900/v1/chat/completions ...
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "quantum", "computing", "uses", "qubits", "which", "can", "represent", "both",
+    "zero", "and", "one", "at", "the", "same", "time", "allowing", "certain",
+    "problems", "to", "be", "solved", "much", "faster", "than", "on", "classical",
+    "machines", "although", "today's", "hardware", "is", "still", "noisy",
+)
+
+ROUTES = {
+    "/v1/chat/completions": "openai",
+    "/v1/messages": "anthropic",
+    "/api/chat": "ollama",
+}
+
+# Kinds of stream events: token events are paced at the token rate, the
+# framing events around them are sent immediately
+TOKEN, FRAMING = True, False
+
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class FakeProvider:
+    """
+    Emulated provider backend. Every request waits `ttft` seconds (plus up to
+    `jitter` seconds) before its first token and then streams `tokens` tokens
+    at `token_rate` tokens per second. A fraction `error_rate` of requests is
+    answered with a 500 and a fraction `rate_limit_rate` with a 429 carrying
+    Retry-After and the provider's rate limit headers. With a
+    `requests_per_minute` quota, requests draw from a bucket of that size
+    that refills continuously like OpenAI's limits, every response reports
+    the budget in rate limit headers and requests beyond it get a 429.
+    With `sentence_words`, every that many words end a sentence with a
+    period, for consumers that cut the stream at sentences.
+    """
+
+    def __init__(
+            self,
+            ttft: float = 0.2,
+            token_rate: float = 50.0,
+            tokens: int = 100,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            rate_limit_rate: float = 0.0,
+            retry_after: float = 1.0,
+            requests_per_minute: float = 0.0,
+            sentence_words: int = 0,
+            seed: int = None):
+        self.ttft = ttft
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self.sentence_words = sentence_words
+        self.bucket = requests_per_minute
+        self.bucket_updated = time.monotonic()
+        self.random = random.Random(seed)
+        self.active = 0
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "over_quota": 0, "cancelled": 0, "connections": 0}
+
+    # Wire formats
+
+    def openai_events(self, model: str, words):
+        base = {
+            "id": f"chatcmpl-fake{self.stats['requests']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+        }
+        yield FRAMING, "data: " + json.dumps(dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "logprobs": None, "finish_reason": None}])) + "\n\n"
+        for word in words:
+            yield TOKEN, "data: " + json.dumps(dict(base, choices=[{"index": 0, "delta": {"content": word}, "logprobs": None, "finish_reason": None}])) + "\n\n"
+        yield FRAMING, "data: " + json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "logprobs": None, "finish_reason": "stop"}])) + "\n\n"
+        yield FRAMING, "data: [DONE]\n\n"
+
+    def anthropic_events(self, model: str, words):
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+        yield FRAMING, event("message_start", {"type": "message_start", "message": {
+            "id": f"msg_fake{self.stats['requests']}", "type": "message", "role": "assistant", "content": [],
+            "model": model, "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": 25, "output_tokens": 1}}})
+        yield FRAMING, event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        yield FRAMING, event("ping", {"type": "ping"})
+        for word in words:
+            yield TOKEN, event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}})
+        yield FRAMING, event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield FRAMING, event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": len(words)}})
+        yield FRAMING, event("message_stop", {"type": "message_stop"})
+
+    def ollama_events(self, model: str, words):
+        def line(data):
+            return json.dumps(dict(data, model=model, created_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))) + "\n"
+
+        for word in words:
+            yield TOKEN, line({"message": {"role": "assistant", "content": word}, "done": False})
+        yield FRAMING, line({"message": {"role": "assistant", "content": ""}, "done_reason": "stop", "done": True, "eval_count": len(words)})
+
+    # Quota
+
+    def take_quota(self):
+        """Draw one request from the quota: (allowed, rate limit headers)."""
+        rate = self.requests_per_minute / 60.0
+        now = time.monotonic()
+        self.bucket = min(self.requests_per_minute, self.bucket + (now - self.bucket_updated) * rate)
+        self.bucket_updated = now
+        allowed = self.bucket >= 1
+        if allowed:
+            self.bucket -= 1
+        reset = (self.requests_per_minute - self.bucket) / rate
+        reset_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + reset))
+        headers = {
+            "x-ratelimit-limit-requests": f"{self.requests_per_minute:g}",
+            "x-ratelimit-remaining-requests": int(self.bucket),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            "anthropic-ratelimit-requests-limit": f"{self.requests_per_minute:g}",
+            "anthropic-ratelimit-requests-remaining": int(self.bucket),
+            "anthropic-ratelimit-requests-reset": reset_at,
+        }
+        if not allowed:
+            headers["Retry-After"] = f"{(1 - self.bucket) / rate:.3f}"
+        return allowed, headers
+
+    # HTTP
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self.handle_request(method, path.split("?")[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # client went away or the emulator is shutting down
+        except Exception as e:
+            logger.warning(f"Error handling request: {e}")
+        finally:
+            writer.close()
+
+    def write_head(self, writer, status: int, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def send_json(self, writer, status: int, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        all_headers = {"Content-Type": "application/json", "Content-Length": len(body)}
+        all_headers.update(headers or {})
+        self.write_head(writer, status, all_headers)
+        writer.write(body)
+        await writer.drain()
+
+    async def handle_request(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        provider = ROUTES.get(path)
+        if method != "POST" or provider is None:
+            await self.send_json(writer, 404, {"error": f"Unknown endpoint {method} {path}"})
+            return
+
+        self.stats["requests"] += 1
+        model = json.loads(body or b"{}").get("model") or "fake-model"
+
+        quota_headers = {}
+        if self.requests_per_minute > 0:
+            allowed, quota_headers = self.take_quota()
+            if not allowed:
+                self.stats["over_quota"] += 1
+                await self.send_json(writer, 429, {"error": {"type": "rate_limit_error", "message": "Request quota exceeded (emulated)"}}, quota_headers)
+                return
+
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            await self.send_json(writer, 429, {"error": {"type": "rate_limit_error", "message": "Rate limit reached (emulated)"}}, {
+                "Retry-After": f"{self.retry_after:g}",
+                "x-ratelimit-remaining-requests": 0,
+                "x-ratelimit-reset-requests": f"{self.retry_after:g}s",
+                "anthropic-ratelimit-requests-remaining": 0,
+            })
+            return
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            await self.send_json(writer, 500, {"error": {"type": "server_error", "message": "Internal error (emulated)"}})
+            return
+
+        words = [(" " if i else "") + self.random.choice(WORDS) for i in range(self.tokens)]
+        if self.sentence_words:
+            words = [word + "." if (i + 1) % self.sentence_words == 0 else word for i, word in enumerate(words)]
+        events = {
+            "openai": self.openai_events,
+            "anthropic": self.anthropic_events,
+            "ollama": self.ollama_events,
+        }[provider](model, words)
+        content_type = "application/x-ndjson" if provider == "ollama" else "text/event-stream"
+
+        self.stats["streams"] += 1
+        self.active += 1
+        try:
+            self.write_head(writer, 200, dict(quota_headers, **{"Content-Type": content_type, "Transfer-Encoding": "chunked"}))
+            await writer.drain()
+            await asyncio.sleep(self.ttft + self.random.random() * self.jitter)
+            interval = 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+            next_send = time.monotonic()
+            for is_token, event in events:
+                data = event.encode("utf-8")
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+                if interval and is_token:
+                    next_send += interval
+                    await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            self.stats["cancelled"] += 1
+            raise
+        finally:
+            self.active -= 1
+
+    def get_stats(self):
+        return dict(self.stats, active=self.active)
+
+    async def start(self, host: str, port: int):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def endpoint_overrides(host: str, port: int):
+    """llm_server --endpoint arguments that point every provider at the emulator."""
+    base = f"http://{host}:{port}"
+    return [
+        f"openai={base}/v1/chat/completions",
+        f"lmstudio={base}/v1/chat/completions",
+        f"vllm={base}/v1/chat/completions",
+        f"llamacpp={base}/v1/chat/completions",
+        f"tgi={base}/v1/chat/completions",
+        f"anthropic={base}/v1/messages",
+        f"ollama={base}/api/chat",
+    ]
+
+
+def add_arguments(parser):
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds added to the TTFT")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Tokens per second (0 = as fast as possible)")
+    parser.add_argument("--tokens", type=int, default=100, help="Tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--requests-per-minute", type=float, default=0.0, help="Request quota, refilled continuously, with rate limit headers (0 = unlimited)")
+    parser.add_argument("--sentence-words", type=int, default=0, help="End a sentence with a period every this many words (0 = never)")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+
+
+def from_arguments(args) -> FakeProvider:
+    return FakeProvider(
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        requests_per_minute=args.requests_per_minute,
+        sentence_words=args.sentence_words,
+        seed=args.seed,
+    )
+
+
+async def main_async(args):
+    provider = from_arguments(args)
+    server = await provider.start(args.host, args.port)
+    print(f"Fake provider listening on http://{args.host}:{args.port}")
+    print("Start llm_server with:")
+    print("  " + " ".join(f"--endpoint {override}" for override in endpoint_overrides(args.host, args.port)))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI/Anthropic/Ollama/LM Studio emulator")
+    parser.add_argument("--host", default="localhost", help="Host to bind to")
+    parser.add_argument("--port", type=int, default=8900, help="Port to listen on")
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Load test for llm_server: opens N concurrent websocket clients that each send
+a number of prompts, and reports throughput, time to first token and
+end-to-end latency percentiles as JSON.
+
+Against an already running server (real or emulated providers):
+
+    python benchmarks/load_test.py --url ws://localhost:5000 --clients 20 --requests 5
+
+Fully offline, starting fake_provider in-process and llm_server as a
+subprocess pointed at it:
+
+    python benchmarks/load_test.py --spawn --clients 50 --provider openai --ttft 0.3 --token-rate 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hedging import percentile
+import fake_provider
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm_server.py")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples):
+    return {
+        "p50": percentile(samples, 0.5),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "max": max(samples) if samples else None,
+    }
+
+
+async def run_request(websocket, data, timeout):
+    """Send one prompt and return its timings, or raise on an error frame."""
+    started = time.monotonic()
+    first = None
+    frames = 0
+    chars = 0
+    await websocket.send(json.dumps(data))
+    while True:
+        response = await asyncio.wait_for(websocket.recv(), timeout=timeout)
+        if response == "":  # Empty string marks end of response
+            break
+        if first is None and response.startswith('{"type": "queue"'):
+            continue
+        if first is None and response.startswith('{"error"'):
+            raise RuntimeError(json.loads(response)["error"])
+        if first is None:
+            first = time.monotonic()
+        frames += 1
+        chars += len(response)
+    return {
+        "ttft": (first or time.monotonic()) - started,
+        "latency": time.monotonic() - started,
+        "frames": frames,
+        "chars": chars,
+    }
+
+
+async def run_client(args, client_id, results, errors):
+    providers = args.provider or ["openai"]
+    async with websockets.connect(args.url, max_size=None) as websocket:
+        for i in range(args.requests):
+            provider = providers[(client_id + i) % len(providers)]
+            data = {
+                "system": args.system,
+                "user": f"{args.prompt} (client {client_id}, request {i})",
+                "provider": provider,
+                "model": args.model,
+                "cache": args.cache,
+                "queue_updates": True,
+            }
+            try:
+                result = await run_request(websocket, data, args.timeout)
+                result["provider"] = provider
+                results.append(result)
+            except (asyncio.TimeoutError, RuntimeError) as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                if isinstance(e, asyncio.TimeoutError):
+                    return  # the connection may still be streaming the old answer
+
+
+async def wait_for_port(host: str, port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_load(args):
+    results = []
+    errors = []
+    started = time.monotonic()
+    clients = [run_client(args, client_id, results, errors) for client_id in range(args.clients)]
+    outcomes = await asyncio.gather(*clients, return_exceptions=True)
+    elapsed = time.monotonic() - started
+    errors.extend(f"{type(e).__name__}: {e}" for e in outcomes if isinstance(e, Exception))
+
+    ttft = [result["ttft"] for result in results]
+    latency = [result["latency"] for result in results]
+    chars = sum(result["chars"] for result in results)
+    report = {
+        "clients": args.clients,
+        "requests": args.clients * args.requests,
+        "completed": len(results),
+        "errors": len(errors),
+        "elapsed": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "throughput_chars_per_s": round(chars / elapsed, 1) if elapsed else None,
+        "frames_per_response": round(sum(result["frames"] for result in results) / len(results), 1) if results else None,
+        "ttft": summarize(ttft),
+        "latency": summarize(latency),
+    }
+    if errors:
+        report["error_samples"] = sorted(set(errors))[:5]
+    return report
+
+
+async def main_async(args):
+    if not args.spawn:
+        return await run_load(args)
+
+    # Emulated providers in this process, llm_server in a subprocess
+    provider = fake_provider.from_arguments(args)
+    provider_port = free_port()
+    provider_server = await provider.start("localhost", provider_port)
+    server_port = free_port()
+    command = [sys.executable, SERVER_SCRIPT, "--port", str(server_port), "--metrics-port", "0", "--log-level", "WARNING"]
+    for override in fake_provider.endpoint_overrides("localhost", provider_port):
+        command += ["--endpoint", override]
+    command += args.server_args
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "offline")
+    env.setdefault("ANTHROPIC_API_KEY", "offline")
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    try:
+        await wait_for_port("localhost", server_port)
+        args.url = f"ws://localhost:{server_port}"
+        report = await run_load(args)
+        report["provider"] = provider.get_stats()
+        return report
+    finally:
+        server.terminate()
+        server.wait()
+        provider_server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for llm_server")
+    parser.add_argument("--url", default="ws://localhost:5000", help="llm_server websocket URL")
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent websocket clients")
+    parser.add_argument("--requests", type=int, default=5, help="Prompts sent by each client, one after another")
+    parser.add_argument("--provider", action="append", help="Provider to use, repeat to spread clients over several (default openai)")
+    parser.add_argument("--model", help="Model to request")
+    parser.add_argument("--system", default="You are a helpful assistant.", help="System message")
+    parser.add_argument("--prompt", default="Explain quantum computing.", help="User message, made unique per request")
+    parser.add_argument("--cache", action="store_true", help="Allow the server cache and coalescing to answer requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Max seconds between two frames")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+
+    spawn = parser.add_argument_group("offline mode")
+    spawn.add_argument("--spawn", action="store_true", help="Start the fake provider and an llm_server pointed at it")
+    spawn.add_argument("--server-arg", dest="server_args", action="append", default=[], help="Extra llm_server argument, e.g. --server-arg=--flush-ms=0 (repeatable)")
+    fake_provider.add_arguments(spawn)
+
+    args = parser.parse_args()
+    report = asyncio.run(main_async(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
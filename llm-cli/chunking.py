@@ -0,0 +1,77 @@
+"""
+Splitting of long inputs for `llm --chunked`, which answers every chunk
+on its own and combines the partial answers (map-reduce).
+
+The client has no tokenizer, so sizes are estimated at ~4 characters per
+token, like the server's rate limiting does. A chunk ends at the strongest
+boundary in the last half of its budget (a blank line, a line end, a
+sentence end, a space), and the next chunk starts `overlap` tokens earlier,
+so text around the cut is seen in one piece by at least one chunk.
+"""
+import re
+from typing import List
+
+CHARS_PER_TOKEN = 4
+
+# Strongest first
+BOUNDARIES = [
+    re.compile(r"\n[ \t]*\n\s*"),
+    re.compile(r"\n"),
+    re.compile(r"[.!?][\"')\]]*\s+"),
+    re.compile(r"\s+"),
+]
+LINE_START = re.compile(r"\n")
+WORD_START = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def find_cut(text: str, earliest: int, latest: int) -> int:
+    """End of the last match of the strongest boundary within text[earliest:latest]."""
+    for pattern in BOUNDARIES:
+        last = None
+        for last in pattern.finditer(text, earliest, latest):
+            pass
+        if last is not None:
+            return last.end()
+    return latest
+
+
+def find_start(text: str, earliest: int, cut: int) -> int:
+    """Start of the overlap: the first line start, or else word start, after earliest."""
+    for pattern in (LINE_START, WORD_START):
+        match = pattern.search(text, earliest, cut)
+        if match is not None and match.end() < cut:
+            return match.end()
+    return cut
+
+
+def split_text(text: str, chunk_tokens: int = 3000, overlap_tokens: int = 200) -> List[str]:
+    """Chunks of at most ~chunk_tokens tokens, consecutive ones sharing ~overlap_tokens."""
+    size = max(1, chunk_tokens) * CHARS_PER_TOKEN
+    overlap = min(max(0, overlap_tokens) * CHARS_PER_TOKEN, size // 4)
+    chunks = []
+    start = 0
+    while len(text) - start > size:
+        cut = find_cut(text, start + size // 2, start + size)
+        chunks.append(text[start:cut])
+        start = find_start(text, cut - overlap, cut) if overlap else cut
+    chunks.append(text[start:])
+    return chunks
+
+
+def group_texts(texts: List[str], budget_tokens: int) -> List[List[str]]:
+    """Consecutive texts grouped so every group of two or more stays within budget_tokens."""
+    groups = []
+    size = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if groups and size + tokens <= budget_tokens:
+            groups[-1].append(text)
+            size += tokens
+        else:
+            groups.append([text])
+            size = tokens
+    return groups
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+
+class DeltaCoalescer:
+    """
+    Batches text deltas into fewer websocket frames.
+
+    The first delta of a response is always sent right away so time to first
+    token is unchanged. After that deltas are buffered and flushed when
+    max_bytes have accumulated or interval seconds have passed since the
+    first buffered delta, whichever comes first. An interval of 0 disables
+    coalescing and sends every delta as its own frame.
+    """
+
+    def __init__(
+            self,
+            send: Callable[[str], Awaitable[None]],
+            interval: float = 0.02,
+            max_bytes: int = 512):
+        self.send = send
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.buffer: List[str] = []
+        self.buffered_bytes = 0
+        self.first = True
+        self.frames = 0
+        self.flush_task: Optional[asyncio.Task] = None
+        self.error: Optional[Exception] = None
+        self.send_lock = asyncio.Lock()
+        self.discarded = False
+
+    async def push(self, delta: str):
+        if self.error is not None:
+            raise self.error
+        if self.first or self.interval <= 0:
+            self.first = False
+            await self._send(delta)
+            return
+
+        self.buffer.append(delta)
+        self.buffered_bytes += len(delta.encode("utf-8"))
+        if self.buffered_bytes >= self.max_bytes:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self.flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # Surfaced on the next push or close.
+            self.error = e
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        text = "".join(self.buffer)
+        self.buffer.clear()
+        self.buffered_bytes = 0
+        await self._send(text)
+
+    async def _send(self, text: str):
+        async with self.send_lock:
+            await self.send(text)
+            self.frames += 1
+
+    def discard(self):
+        """Drop buffered deltas and stop the timer, e.g. when the response was cancelled."""
+        self.discarded = True
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.buffer.clear()
+        self.buffered_bytes = 0
+
+    async def close(self):
+        """Cancel the pending timer and send whatever is still buffered."""
+        if self.discarded:
+            return
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        # Wait for a timer flush that was already sending.
+        async with self.send_lock:
+            pass
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,104 @@
+"""
+Protocol v2 of the llm_server websocket: binary response frames.
+
+Clients opt in by offering the websocket subprotocol "llm.v2" when they
+connect; connections without it keep protocol v1 (text frames, see
+ResponseChannel in llm_server.py), so old clients work unchanged.
+Requests and control messages stay JSON text, and every v2 request needs
+an integer "id" that names its stream. Each response frame is one binary
+message:
+
+    version  u8   2
+    type     u8   DELTA, RAW, QUEUE, ERROR or DONE
+    flags    u16  reserved, 0
+    stream   u32  the request's id
+    seq      u32  0, 1, 2, ... per stream
+    payload       DELTA, ERROR: UTF-8 text
+                  RAW: provider bytes as received
+                  QUEUE, DONE: JSON object
+
+ERROR and DONE end a stream, DONE carries its metadata (provider, model,
+deltas, chars, frames, ttft, duration). Streams of many requests
+interleave on one connection. A request with a "resume_key" survives a
+disconnect for a while; after reconnecting, the client sends
+{"type": "resume", "key": ..., "id": new id, "after": last seq} and gets the
+frames it missed, and the sequence numbers show whether any are lost.
+"""
+import json
+import struct
+from typing import Dict, List, NamedTuple, Tuple
+
+SUBPROTOCOL = "llm.v2"
+VERSION = 2
+
+DELTA, RAW, QUEUE, ERROR, DONE = 1, 2, 3, 4, 5
+TYPE_NAMES = {DELTA: "delta", RAW: "raw", QUEUE: "queue", ERROR: "error", DONE: "done"}
+
+HEADER = struct.Struct("!BBHII")
+MAX_STREAM_ID = 2 ** 32 - 1
+
+
+class Frame(NamedTuple):
+    type: int
+    stream: int
+    seq: int
+    payload: bytes
+
+    @property
+    def ends_stream(self) -> bool:
+        return self.type in (ERROR, DONE)
+
+    def text(self) -> str:
+        return self.payload.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.payload)
+
+
+def encode(frame_type: int, stream: int, seq: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(VERSION, frame_type, 0, stream, seq) + payload
+
+
+def decode(message: bytes) -> Frame:
+    if len(message) < HEADER.size:
+        raise ValueError(f"Frame of {len(message)} bytes is shorter than its header")
+    version, frame_type, _, stream, seq = HEADER.unpack_from(message)
+    if version != VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    if frame_type not in TYPE_NAMES:
+        raise ValueError(f"Unknown frame type {frame_type}")
+    return Frame(frame_type, stream, seq, message[HEADER.size:])
+
+
+def valid_stream_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_STREAM_ID
+
+
+class SequenceTracker:
+    """
+    Client-side check of the sequence numbers of each stream. accept()
+    returns False for frames that were already seen (replayed after a
+    resume) and records the seq ranges that never arrived in `gaps`.
+    """
+
+    def __init__(self):
+        self.next_seq: Dict[int, int] = {}
+        self.gaps: List[Tuple[int, int, int]] = []  # (stream, first missing, last missing)
+
+    def accept(self, frame: Frame) -> bool:
+        expected = self.next_seq.get(frame.stream, 0)
+        if frame.seq < expected:
+            return False
+        if frame.seq > expected:
+            self.gaps.append((frame.stream, expected, frame.seq - 1))
+        self.next_seq[frame.stream] = frame.seq + 1
+        return True
+
+    def last_seq(self, stream: int) -> int:
+        """Last seq received on a stream, -1 if none; the "after" of a resume."""
+        return self.next_seq.get(stream, 0) - 1
+
+    def rename(self, old: int, new: int):
+        """Continue counting a stream that was resumed under a new id."""
+        if old in self.next_seq:
+            self.next_seq[new] = self.next_seq.pop(old)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Candidate = Tuple[str, Callable[[], AsyncIterator[str]]]
+
+
+def percentile(samples, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class HedgeStats:
+    """Per-provider race starts, wins and time to first token of the winners."""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.providers: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, provider: str) -> Dict[str, Any]:
+        entry = self.providers.get(provider)
+        if entry is None:
+            entry = {"started": 0, "wins": 0, "failures": 0, "ttft": deque(maxlen=self.max_samples)}
+            self.providers[provider] = entry
+        return entry
+
+    def started(self, provider: str):
+        self._entry(provider)["started"] += 1
+
+    def won(self, provider: str, ttft: float):
+        entry = self._entry(provider)
+        entry["wins"] += 1
+        entry["ttft"].append(ttft)
+
+    def failed(self, provider: str):
+        self._entry(provider)["failures"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for provider, entry in self.providers.items():
+            ttft = list(entry["ttft"])
+            stats[provider] = {
+                "started": entry["started"],
+                "wins": entry["wins"],
+                "failures": entry["failures"],
+                "win_rate": entry["wins"] / entry["started"] if entry["started"] else None,
+                "ttft_p50": percentile(ttft, 0.5),
+                "ttft_p95": percentile(ttft, 0.95),
+                "ttft_p99": percentile(ttft, 0.99),
+            }
+        return stats
+
+
+async def hedged_stream(candidates: List[Candidate], delay: float, stats: HedgeStats) -> AsyncIterator[str]:
+    """
+    Race one request across an ordered list of providers.
+
+    The first candidate starts immediately and the next one is started after
+    each further `delay` seconds without a token, or right away when a
+    candidate fails before producing one. The first candidate to produce a
+    token wins; all others are cancelled, which closes their upstream
+    streams. A provider listed more than once is raced once. Yields the
+    deltas of the winner.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    tasks: Dict[str, asyncio.Task] = {}
+    winner: Optional[str] = None
+
+    async def run(provider: str, factory: Callable[[], AsyncIterator[str]]):
+        nonlocal winner
+        started = time.monotonic()
+        try:
+            async for delta in factory():
+                if winner is None:
+                    winner = provider
+                    stats.won(provider, time.monotonic() - started)
+                    logger.info(f"Hedged request won by {provider}")
+                    for name, task in tasks.items():
+                        if name != provider:
+                            task.cancel()
+                elif winner != provider:
+                    return
+                await events.put(("delta", provider, delta))
+            await events.put(("done", provider, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats.failed(provider)
+            await events.put(("error", provider, e))
+
+    # A provider listed twice would race itself; its first entry counts
+    pending = []
+    for provider, factory in candidates:
+        if all(provider != name for name, _ in pending):
+            pending.append((provider, factory))
+    finished = 0
+    last_error: Optional[Exception] = None
+
+    def launch():
+        provider, factory = pending.pop(0)
+        stats.started(provider)
+        tasks[provider] = asyncio.create_task(run(provider, factory))
+
+    try:
+        launch()
+        while True:
+            timeout = delay if pending and winner is None else None
+            try:
+                kind, provider, value = await asyncio.wait_for(events.get(), timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"No token after {delay}s, hedging to {pending[0][0]}")
+                launch()
+                continue
+
+            if kind == "delta":
+                yield value
+            elif kind == "done":
+                if provider == winner or winner is None:
+                    return
+            elif kind == "error":
+                if provider == winner:
+                    raise value
+                last_error = value
+                finished += 1
+                if winner is None and pending:
+                    launch()
+                elif winner is None and finished == len(tasks):
+                    raise last_error
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
@@ -0,0 +1,113 @@
+import logging
+import time
+from typing import Callable, Dict, Any, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Providers that speak HTTP/2 on their public endpoints. Local servers
+# (LM Studio, Ollama) only offer HTTP/1.1 keep-alive.
+HTTP2_PROVIDERS = {"openai", "anthropic"}
+
+DEFAULT_POOL_SETTINGS = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 60.0,
+    "connect_timeout": 10.0,
+    "read_timeout": 60.0,
+}
+
+# Per-provider overrides of DEFAULT_POOL_SETTINGS. LM Studio serves one
+# generation at a time, so there is no point in holding many sockets open.
+# Hosted APIs keep as many idle connections as llm_server lets requests run
+# in parallel, otherwise every burst closes and reopens the difference.
+PROVIDER_POOL_SETTINGS = {
+    "lmstudio": {"max_connections": 4, "max_keepalive_connections": 2},
+    "ollama": {"max_connections": 8, "max_keepalive_connections": 4},
+    "openai": {"max_keepalive_connections": 16},
+    "anthropic": {"max_keepalive_connections": 16},
+}
+
+
+class ProviderClientPool:
+    """
+    Keeps one long-lived httpx.AsyncClient per provider so that prompts
+    reuse warm TCP/TLS connections instead of handshaking every time.
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None):
+        self.overrides = overrides or {}
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        # Called with (provider, seconds) whenever a new connection was opened
+        self.on_connect: Optional[Callable[[str, float], None]] = None
+
+    def settings_for(self, provider: str) -> Dict[str, Any]:
+        """Merge the default, per-provider and command-line pool settings."""
+        settings = dict(DEFAULT_POOL_SETTINGS)
+        settings.update(PROVIDER_POOL_SETTINGS.get(provider, {}))
+        settings.update({k: v for k, v in self.overrides.items() if v is not None})
+        return settings
+
+    def get_client(self, provider: str) -> httpx.AsyncClient:
+        """Return the pooled client for a provider, creating it on first use."""
+        client = self.clients.get(provider)
+        if client is None or client.is_closed:
+            settings = self.settings_for(provider)
+            http2 = HTTP2_AVAILABLE and provider in HTTP2_PROVIDERS
+            client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings["max_connections"],
+                    max_keepalive_connections=settings["max_keepalive_connections"],
+                    keepalive_expiry=settings["keepalive_expiry"],
+                ),
+                timeout=httpx.Timeout(
+                    settings["read_timeout"],
+                    connect=settings["connect_timeout"],
+                ),
+            )
+            self.clients[provider] = client
+            self.stats.setdefault(provider, {"requests": 0, "hits": 0, "misses": 0})
+            logger.info(f"Created connection pool for {provider} (http2={http2}): {settings}")
+        return client
+
+    def stream(self, provider: str, method: str, url: str, **kwargs):
+        """
+        Open a streaming request through the provider's pool.
+
+        A request counts as a pool miss when httpcore had to open a new
+        TCP connection for it, and as a hit when a kept-alive one was reused.
+        """
+        client = self.get_client(provider)
+        stats = self.stats[provider]
+        stats["requests"] += 1
+        state = {"connect_started": None}
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.started":
+                state["connect_started"] = time.monotonic()
+            elif event_name.endswith(".send_request_headers.started"):
+                connect_started = state["connect_started"]
+                stats["misses" if connect_started is not None else "hits"] += 1
+                if connect_started is not None and self.on_connect:
+                    self.on_connect(provider, time.monotonic() - connect_started)
+
+        extensions = kwargs.pop("extensions", {})
+        extensions["trace"] = trace
+        return client.stream(method, url, extensions=extensions, **kwargs)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {provider: dict(values) for provider, values in self.stats.items()}
+
+    async def aclose(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
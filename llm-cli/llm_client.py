@@ -1,21 +1,37 @@
 import asyncio
+import itertools
 import websockets
 import json
-import argparse
 import sys
 import os
-import socket
-import subprocess
+import time
+import uuid
 from datetime import datetime
 from urllib.parse import urlparse
 
+import chunking
+import framing
+from llm_connection import MultiplexedConnection
+from llm_entry import parse_arguments
+
 class LLMClient:
-    def __init__(self, server_url, debug=False, file_output=None, provider='lmstudio', model=None):
+    # Reconnects per answer when a protocol v2 connection drops mid-stream
+    max_resumes = 3
+
+    def __init__(self, server_url, debug=False, file_output=None, provider='lmstudio', model=None, cache=True, priority=0, session=None, reset_session=False, hedge=None, hedge_delay=None, raw=False, resumable=False):
         self.server_url = server_url
         self.debug = debug
         self.file_output = file_output
         self.provider = provider
         self.model = model
+        self.cache = cache
+        self.priority = priority
+        self.session = session
+        self.reset_session = reset_session
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.raw = raw
+        self.resumable = resumable
         parsed_url = urlparse(self.server_url)
         self.host = parsed_url.hostname
         self.port = parsed_url.port or 80
@@ -28,6 +44,7 @@ class LLMClient:
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
 
     def is_server_running(self):
+        import socket
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             return s.connect_ex((self.host, self.port)) == 0
 
@@ -50,39 +67,190 @@ class LLMClient:
         return True
 
 
-    async def send_and_receive(self, websocket, system_message, user_message):
-        self.websocket = websocket
+    def build_request(self, system_message, user_message):
+        """The JSON request sent to the server for one prompt."""
         data = {
             "system": system_message,
             "user": user_message,
             "provider": self.provider,
-            "model": self.model
+            "model": self.model,
+            "cache": self.cache,
+            "priority": self.priority,
+            "queue_updates": True
         }
+        if self.session:
+            data["session"] = self.session
+            data["reset"] = self.reset_session
+        if self.raw:
+            data["raw"] = True
+        if self.hedge:
+            data["hedge"] = self.hedge
+            if self.hedge_delay is not None:
+                data["hedge_delay"] = self.hedge_delay
+        return data
+
+    async def send_and_receive(self, websocket, system_message, user_message):
+        self.websocket = websocket
+        data = self.build_request(system_message, user_message)
+        if websocket.subprotocol == framing.SUBPROTOCOL:
+            await self.receive_frames(websocket, data)
+            return
         self.debug_print(f"Sending: {json.dumps(data)}")
         await websocket.send(json.dumps(data))
 
         try:
+            first_content = True
             while True:
                 try:
                     response = await asyncio.wait_for(websocket.recv(), timeout=5)
                     if response == "":  # Empty string marks end of response
                         break
+                    if isinstance(response, bytes):  # --raw passthrough
+                        self.handle_raw(response)
+                        continue
+                    if first_content and self.handle_queue_update(response):
+                        continue
+                    if first_content and response.startswith('{"error"'):
+                        self.handle_error(json.loads(response)["error"])
+                        continue
+                    if first_content:
+                        self.clear_queue_status()
+                        first_content = False
                     self.handle_text(response)
                 except asyncio.TimeoutError:
                     self.debug_print("Timeout waiting for response")
+                    await self.send_cancel(websocket)
                     break
                 except websockets.exceptions.ConnectionClosed:
                     self.debug_print("WebSocket connection closed")
                     break
         except asyncio.CancelledError:
+            # Ctrl+C: stop the generation on the server before closing
+            await self.send_cancel(websocket)
             raise
 
+    async def receive_frames(self, websocket, data):
+        """
+        Protocol v2 (see framing.py): the answer is stream 1 of binary
+        frames. With resumable=True the request carries a resume key, and
+        when the connection drops, reconnect and resume the stream after
+        the last frame received; the sequence numbers tell whether frames
+        were lost in between. Without it the server stops the answer as
+        soon as the connection is gone.
+        """
+        stream = 1
+        data = dict(data, id=stream)
+        if self.resumable:
+            data["resume_key"] = uuid.uuid4().hex
+        tracker = framing.SequenceTracker()
+        reconnected = []
+        self.debug_print(f"Sending: {json.dumps(data)}")
+        await websocket.send(json.dumps(data))
+        try:
+            first_content = True
+            while True:
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), timeout=5)
+                except asyncio.TimeoutError:
+                    self.debug_print("Timeout waiting for response")
+                    await self.send_cancel(websocket, stream)
+                    break
+                except websockets.exceptions.ConnectionClosed:
+                    if not self.resumable or len(reconnected) >= self.max_resumes:
+                        self.handle_error("Connection to the LLM server lost")
+                        break
+                    self.debug_print("WebSocket connection closed, resuming")
+                    await asyncio.sleep(0.5 * len(reconnected))
+                    try:
+                        websocket = await websockets.connect(self.server_url, open_timeout=5, subprotocols=[framing.SUBPROTOCOL])
+                    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                        self.debug_print(f"Reconnect failed: {e}")
+                        reconnected.append(None)
+                        continue
+                    reconnected.append(websocket)
+                    tracker.rename(stream, stream + 1)
+                    stream += 1
+                    await websocket.send(json.dumps({"type": "resume", "key": data["resume_key"], "id": stream, "after": tracker.last_seq(stream)}))
+                    continue
+
+                if isinstance(message, str):  # Replies to the request itself, e.g. an invalid id
+                    reply = json.loads(message)
+                    if "error" in reply:
+                        self.handle_error(reply["error"])
+                        break
+                    continue
+                frame = framing.decode(message)
+                gaps = len(tracker.gaps)
+                if frame.stream != stream or not tracker.accept(frame):
+                    continue
+                if len(tracker.gaps) > gaps:
+                    _, first, last = tracker.gaps[-1]
+                    print(f"Warning: {last - first + 1} frames of the answer were lost while reconnecting", file=sys.stderr)
+
+                if frame.type == framing.QUEUE:
+                    if first_content:
+                        self.show_queue_position(frame.json())
+                    continue
+                if first_content:
+                    self.clear_queue_status()
+                    first_content = False
+                if frame.type == framing.DELTA:
+                    self.handle_text(frame.text())
+                elif frame.type == framing.RAW:
+                    self.handle_raw(frame.payload)
+                elif frame.type == framing.ERROR:
+                    self.handle_error(frame.text())
+                    break
+                elif frame.type == framing.DONE:
+                    self.debug_print(f"Done: {frame.text()}")
+                    break
+        except asyncio.CancelledError:
+            # Ctrl+C: stop the generation on the server before closing
+            await self.send_cancel(websocket, stream)
+            raise
+        finally:
+            for extra in reconnected:
+                if extra is not None:
+                    await extra.close()
+
+    async def send_cancel(self, websocket, request_id=None):
+        """Tell the server to abort the answer we are no longer waiting for."""
+        message = {"type": "cancel"}
+        if request_id is not None:
+            message["id"] = request_id
+        try:
+            await asyncio.wait_for(websocket.send(json.dumps(message)), timeout=1)
+        except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+            pass
+
+    def handle_queue_update(self, response):
+        """Show queue position messages that the server sends before the answer starts."""
+        if not response.startswith('{"type": "queue"'):
+            return False
+        try:
+            update = json.loads(response)
+        except json.JSONDecodeError:
+            return False
+        self.show_queue_position(update)
+        return True
+
+    def show_queue_position(self, update):
+        self.debug_print(f"Queued at position {update['position']}, eta {update['eta']}s")
+        if sys.stderr.isatty():
+            print(f"\rWaiting in queue: position {update['position']}, ~{update['eta']:.0f}s", end="", flush=True, file=sys.stderr)
+            self.queue_status_shown = True
+
+    def clear_queue_status(self):
+        if getattr(self, "queue_status_shown", False):
+            print("\r\033[K", end="", flush=True, file=sys.stderr)
+            self.queue_status_shown = False
+
     async def process_input(self, system_message, user_message):
         self.debug_print(f"Connecting to {self.server_url}")
         if not await self.ensure_server_running():
             return        
         try:
-            async with websockets.connect(self.server_url, timeout=5) as websocket:
+            async with websockets.connect(self.server_url, open_timeout=5, subprotocols=[framing.SUBPROTOCOL]) as websocket:
                 self.debug_print("Connected")
                 await self.send_and_receive(websocket, system_message, user_message)
         except (websockets.exceptions.WebSocketException, ConnectionRefusedError, OSError) as e:
@@ -106,6 +274,7 @@ class LLMClient:
         return response == 'y' or response == 'yes'
 
     def start_server(self):
+        import subprocess
         if os.name == 'nt':  # Windows
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
@@ -125,27 +294,301 @@ class LLMClient:
         else:
             print(text, end="", flush=True)
 
+    def handle_error(self, message):
+        self.clear_queue_status()
+        print(f"Error: {message}", file=sys.stderr)
+
+    def handle_raw(self, chunk):
+        output = self.file_output or sys.stdout
+        output.buffer.write(chunk)
+        output.flush()
+
+class BatchRunner:
+    """
+    Runs the prompts of a JSONL file over a few websocket connections.
+
+    Every input line is an object with "user" (or "prompt") and optionally
+    "id", "system", "provider" and "model"; ids default to the line number
+    and must be unique.
+    Prompts are sent with their id so the server streams several of them
+    concurrently on one connection, at most `concurrency` in total. One
+    JSONL result per prompt is appended to the output file as soon as it
+    finishes (or in input order with ordered=True), so a restarted run
+    skips every id that already has a successful result.
+    """
+
+    def __init__(self, client, input_path, output_path, concurrency=4, connections=1, ordered=False, timeout=120.0):
+        self.client = client
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.connections = max(1, connections)
+        self.ordered = ordered
+        self.timeout = timeout
+        self.finished = {}
+        self.next_index = 0
+        self.output = None
+
+    def load_done(self):
+        """Ids with a successful result from an earlier run."""
+        done = set()
+        if not os.path.exists(self.output_path):
+            return done
+        with open(self.output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # last line of an interrupted run
+                if "error" not in result:
+                    done.add(str(result["id"]))
+        return done
+
+    def load_items(self):
+        """
+        Prompts of the input file without a result yet. Raises ValueError
+        naming the line of an invalid prompt or of a repeated id, before
+        anything is sent.
+        """
+        done = self.load_done()
+        items = []
+        lines = {}  # id: line number
+        with open(self.input_path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{self.input_path}:{number}: invalid JSON: {e}")
+                if not isinstance(item, dict):
+                    raise ValueError(f"{self.input_path}:{number}: expected a JSON object")
+                item["id"] = str(item.get("id", number))
+                if item["id"] in lines:
+                    raise ValueError(f"{self.input_path}:{number}: id {item['id']} is already used on line {lines[item['id']]}")
+                lines[item["id"]] = number
+                if item["id"] not in done:
+                    items.append(item)
+        if done:
+            self.client.debug_print(f"Resuming, {len(done)} prompts already done", force=True)
+        return items
+
+    async def run_item(self, index, item, connection, semaphore):
+        async with semaphore:
+            request_id = item["id"]
+            data = {
+                "system": item.get("system", ""),
+                "user": item.get("user", item.get("prompt", "")),
+                "provider": item.get("provider", self.client.provider),
+                "model": item.get("model", self.client.model),
+                "cache": self.client.cache,
+                "priority": self.client.priority,
+            }
+            parts = []
+            first = None
+            started = time.monotonic()
+
+            async def on_frame(frame):
+                nonlocal first
+                if "delta" in frame:
+                    if first is None:
+                        first = time.monotonic()
+                    parts.append(frame["delta"])
+
+            try:
+                error = (await connection.request(request_id, data, on_frame, self.timeout)).get("error")
+            except asyncio.TimeoutError:
+                error = f"No response for {self.timeout}s"
+            except websockets.exceptions.ConnectionClosed as e:
+                error = f"Connection to the LLM server closed: {e}"
+
+            result = {
+                "id": request_id,
+                "provider": data["provider"],
+                "model": data["model"],
+                "output": "".join(parts),
+                "ttft": round(first - started, 3) if first is not None else None,
+                "duration": round(time.monotonic() - started, 3),
+            }
+            if error is not None:
+                result["error"] = error
+            self.write(index, result)
+
+    def write(self, index, result):
+        self.finished[index] = result
+        if not self.ordered:
+            self.output.write(json.dumps(self.finished.pop(index)) + "\n")
+        while self.next_index in self.finished:
+            self.output.write(json.dumps(self.finished.pop(self.next_index)) + "\n")
+            self.next_index += 1
+        self.output.flush()
+
+    async def run(self):
+        try:
+            items = self.load_items()
+        except ValueError as e:
+            sys.exit(str(e))
+        if not items:
+            self.client.debug_print("Nothing to do, all prompts have results", force=True)
+            return
+        if not await self.client.ensure_server_running():
+            return
+
+        sockets = [await websockets.connect(self.client.server_url, max_size=None) for _ in range(self.connections)]
+        connections = [MultiplexedConnection(websocket) for websocket in sockets]
+        readers = [asyncio.create_task(connection.read_frames()) for connection in connections]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        self.output = open(self.output_path, "a", encoding="utf-8")
+        try:
+            await asyncio.gather(*[
+                self.run_item(index, item, connections[index % len(connections)], semaphore)
+                for index, item in enumerate(items)
+            ])
+        finally:
+            self.output.close()
+            for websocket in sockets:
+                await websocket.close()
+            await asyncio.gather(*readers, return_exceptions=True)
+        self.client.debug_print(f"{len(items)} prompts done in {time.monotonic() - started:.1f}s", force=True)
+
+class ChunkedRunner:
+    """
+    Map-reduce over an input too long for one prompt (--chunked). The input
+    is split with chunking.split_text, every chunk is answered with the
+    task as a request of its own (at most `concurrency` in flight, further
+    limited by the server's scheduler), and a reduce request combines the
+    partial answers; only its answer goes to stdout. Partial answers too
+    long for one reduce request are combined in groups first. Progress is
+    reported on stderr.
+    """
+
+    MAP_NOTE = ("The input is too long to answer at once, this is part {index} of {count}. "
+                "Answer for this part only, the answers to all parts are combined afterwards.")
+    REDUCE_PROMPT = ("Below are the answers to the {count} consecutive parts of a long input. "
+                     "Combine them into one answer as if you had seen the whole input at once, without mentioning the parts.")
+
+    def __init__(self, client, task, text, chunk_tokens=3000, overlap_tokens=200, concurrency=4, timeout=120.0):
+        self.client = client
+        self.task = task
+        self.text = text
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.ids = itertools.count(1)
+        self.connection = None
+
+    def progress(self, message, final=False):
+        if sys.stderr.isatty():
+            print(f"\r\033[K{message}", end="\n" if final else "", flush=True, file=sys.stderr)
+        else:
+            print(message, file=sys.stderr, flush=True)
+
+    async def ask(self, system_message, user_message, semaphore, on_delta=None):
+        """The answer to one prompt; raises RuntimeError when the server reports an error."""
+        async with semaphore:
+            data = self.client.build_request(system_message, user_message)
+            for key in ("session", "reset", "raw"):
+                data.pop(key, None)
+            parts = []
+
+            async def on_frame(frame):
+                if "delta" in frame:
+                    parts.append(frame["delta"])
+                    if on_delta is not None:
+                        on_delta(frame["delta"])
+
+            try:
+                end = await self.connection.request(next(self.ids), data, on_frame, self.timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"No response for {self.timeout:g}s")
+            if "error" in end:
+                raise RuntimeError(end["error"])
+            return "".join(parts)
+
+    def reduce_prompt(self, answers):
+        parts = "\n\n".join(f"## Part {index}\n\n{answer.strip()}" for index, answer in enumerate(answers, 1))
+        return self.REDUCE_PROMPT.format(count=len(answers)) + "\n\n" + parts
+
+    async def map_chunks(self, chunks, semaphore):
+        done = 0
+
+        async def answer(index, chunk):
+            nonlocal done
+            note = self.MAP_NOTE.format(index=index, count=len(chunks))
+            system_message = f"{self.task}\n\n{note}" if self.task else note
+            try:
+                result = await self.ask(system_message, chunk, semaphore)
+            except RuntimeError as e:
+                raise RuntimeError(f"Part {index} of {len(chunks)} failed: {e}")
+            done += 1
+            self.progress(f"Map: {done}/{len(chunks)} parts answered")
+            return result
+
+        return await gather_or_cancel([answer(index, chunk) for index, chunk in enumerate(chunks, 1)])
+
+    async def reduce(self, answers, semaphore):
+        """Combine groups of answers until all of them fit into one reduce prompt, then stream that one."""
+        while len(answers) > 1 and chunking.estimate_tokens(self.reduce_prompt(answers)) > self.chunk_tokens:
+            groups = chunking.group_texts(answers, self.chunk_tokens)
+            if len(groups) == len(answers):  # every answer alone fills a prompt, combine pairs
+                groups = [answers[i:i + 2] for i in range(0, len(answers), 2)]
+            self.progress(f"Reduce: combining {len(answers)} partial answers in {len(groups)} groups")
+            answers = await gather_or_cancel([
+                self.ask(self.task, self.reduce_prompt(group), semaphore) if len(group) > 1 else echo(group[0])
+                for group in groups])
+
+        self.progress(f"Reduce: combining {len(answers)} partial answers", final=True)
+        await self.ask(self.task, self.reduce_prompt(answers), semaphore, on_delta=self.client.handle_text)
+
+    async def run(self):
+        chunks = chunking.split_text(self.text, self.chunk_tokens, self.overlap_tokens)
+        if len(chunks) == 1:
+            self.client.debug_print("Input fits into one prompt, not chunking")
+            await self.client.process_input(self.task, self.text)
+            return
+        if not await self.client.ensure_server_running():
+            return
+
+        started = time.monotonic()
+        self.progress(f"Split {chunking.estimate_tokens(self.text)} tokens into {len(chunks)} parts of up to ~{self.chunk_tokens} tokens",
+                      final=True)
+        async with websockets.connect(self.client.server_url, open_timeout=5, max_size=None) as websocket:
+            self.connection = MultiplexedConnection(websocket)
+            reader = asyncio.create_task(self.connection.read_frames())
+            semaphore = asyncio.Semaphore(self.concurrency)
+            try:
+                answers = await self.map_chunks(chunks, semaphore)
+                await self.reduce(answers, semaphore)
+            except RuntimeError as e:
+                self.client.handle_error(str(e))
+                return
+            finally:
+                reader.cancel()
+        self.client.debug_print(f"{len(chunks)} parts answered and combined in {time.monotonic() - started:.1f}s")
+
+
+async def echo(value):
+    return value
+
+
+async def gather_or_cancel(coroutines):
+    """Results of all coroutines; the first failure cancels the others."""
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 def get_user_input():
     return input().strip()
 
-def parse_arguments():
-    parser = argparse.ArgumentParser(description="LLM Client")
-    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
-    parser.add_argument("--server", default="ws://localhost:5000", help="WebSocket server URL")
-    parser.add_argument("--system", help="System message")
-    parser.add_argument("--provider", default="lmstudio", choices=["lmstudio", "openai", "anthropic", "ollama"], help="LLM provider")
-    parser.add_argument("--model", help="Specific model to use (required for OpenAI and Anthropic)")
-    parser.add_argument("--openai", action="store_true", help="Use OpenAI provider")
-    parser.add_argument("--anthropic", action="store_true", help="Use Anthropic provider")
-    parser.add_argument("--ollama", action="store_true", help="Use Ollama provider")
-    parser.add_argument("--lmstudio", action="store_true", help="Use LM Studio provider")    
-    parser.add_argument("input", nargs="*", help="User message")
-    return parser.parse_args()
-
-async def run_client(args):
-    file_output = sys.stdout if not os.isatty(sys.stdout.fileno()) else None
-    
-    # Determine the provider based on the command-line arguments
+def resolve_provider(args):
+    """Provider selected by --provider or one of the --openai style shortcuts."""
     if args.openai:
         provider = "openai"
     elif args.anthropic:
@@ -155,9 +598,23 @@ async def run_client(args):
     elif args.lmstudio:
         provider = "lmstudio"
     else:
-        provider = args.provider    
-    client = LLMClient(args.server, args.debug, file_output, args.provider, args.model)
+        provider = args.provider
+    return provider
+
+def create_client(args, file_output=None):
+    return LLMClient(args.server, args.debug, file_output, resolve_provider(args), args.model, not args.no_cache, args.priority, args.session, args.reset_session,
+                     args.hedge.split(",") if args.hedge else None, args.hedge_delay, args.raw, args.resumable)
+
+async def run_client(args):
+    file_output = sys.stdout if not os.isatty(sys.stdout.fileno()) else None
+    client = create_client(args, file_output)
         
+    if args.batch:
+        output_path = args.batch_output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+        runner = BatchRunner(client, args.batch, output_path, args.concurrency, args.connections, args.ordered, args.batch_timeout)
+        await runner.run()
+        return
+
     try:
         if not sys.stdin.isatty():
             user_message = sys.stdin.read().strip()
@@ -169,6 +626,10 @@ async def run_client(args):
         if not user_message:
             user_message = get_user_input()
 
+        if args.chunked:
+            runner = ChunkedRunner(client, system_message, user_message, args.chunk_tokens, args.chunk_overlap, args.concurrency, args.batch_timeout)
+            await runner.run()
+            return
         await client.process_input(system_message, user_message)
     except KeyboardInterrupt:
         pass
@@ -177,8 +638,9 @@ async def run_client(args):
     finally:
         pass
 
-def main():
-    args = parse_arguments()
+def main(args=None):
+    if args is None:
+        args = parse_arguments()
     try:
         asyncio.run(run_client(args))
     except KeyboardInterrupt:
@@ -0,0 +1,89 @@
+"""
+Id-tagged requests on one llm_server websocket (protocol v1 text frames).
+
+Every request carries an "id", the server streams the answers of several
+requests concurrently on the connection and tags each frame with the id
+of its request: {"id", "delta"} (or "raw"), {"id", "type": "queue"},
+{"id", "done": true} and {"id", "error"}. MultiplexedConnection routes the
+frames to the waiting requests; llm --batch and --chunked, cli-agent and
+voice-server all talk to llm_server through it.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+CLOSED_ERROR = "Connection to the LLM server closed"
+
+Frame = Dict[str, Any]
+
+
+class MultiplexedConnection:
+    """
+    Requests sharing one websocket. read_frames() has to run as a task for
+    as long as the connection is used; once the connection is closed,
+    waiting requests end with an error frame and `closed` is set.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.streams: Dict[Any, asyncio.Queue] = {}
+        self.closed = False
+
+    async def read_frames(self):
+        """Route the frames of the connection to their requests until it closes."""
+        try:
+            async for message in self.websocket:
+                frame = json.loads(message)
+                stream = self.streams.get(frame.get("id"))
+                if stream is not None:
+                    stream.put_nowait(frame)
+                elif frame.get("type") != "queue":
+                    logger.debug(f"LLM frame for an unknown request: {message[:100]}")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.closed = True
+            for stream in self.streams.values():
+                stream.put_nowait({"error": CLOSED_ERROR})
+
+    async def request(self, request_id, data: Dict[str, Any], on_frame: Optional[Callable[[Frame], Awaitable[None]]] = None,
+                      timeout: Optional[float] = None) -> Frame:
+        """
+        Send `data` as request `request_id` and pass its delta, raw and queue
+        frames to on_frame. Returns the frame that ended the answer,
+        {"done": true, ...} or {"error": ...}. Raises asyncio.TimeoutError
+        when no frame arrived for `timeout` seconds; then, and when the
+        caller is cancelled, the request is cancelled on the server too.
+        Raises ValueError when `request_id` is still in flight.
+        """
+        if request_id in self.streams:
+            raise ValueError(f"Request id {request_id!r} is already in flight on this connection")
+        if self.closed:
+            return {"id": request_id, "error": CLOSED_ERROR}
+        stream: asyncio.Queue = asyncio.Queue()
+        self.streams[request_id] = stream
+        finished = False
+        try:
+            await self.websocket.send(json.dumps(dict(data, id=request_id)))
+            while True:
+                frame = await asyncio.wait_for(stream.get(), timeout)
+                if frame.get("done") or "error" in frame:
+                    finished = True
+                    return frame
+                if on_frame is not None:
+                    await on_frame(frame)
+        finally:
+            del self.streams[request_id]
+            if not finished and not self.closed:
+                await self.cancel(request_id)
+
+    async def cancel(self, request_id):
+        """Tell the server to stop the answer to a request."""
+        with contextlib.suppress(asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+            await asyncio.wait_for(self.websocket.send(json.dumps({"type": "cancel", "id": request_id})), timeout=1)
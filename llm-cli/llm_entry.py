@@ -0,0 +1,57 @@
+"""
+Entry point of the `llm` command. cli_entry.run (cli-common) hands
+the invocation to a running cli-agent (see agent-cli) before llm_client
+and its dependencies are imported, and runs llm_client directly when
+there is none. Arguments are parsed here, after the handoff: without an
+agent, --help and usage errors exit before asyncio or websockets are
+imported; with one, they first cost a round trip to the agent, which
+answers them with a fallback.
+"""
+import argparse
+import os
+
+TOOL = "llm"
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="LLM Client")
+    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument("--server", default="ws://localhost:5000", help="WebSocket server URL")
+    parser.add_argument("--system", help="System message")
+    parser.add_argument("--provider", default="lmstudio", choices=["lmstudio", "openai", "anthropic", "ollama", "vllm", "llamacpp", "tgi"], help="LLM provider")
+    parser.add_argument("--model", help="Specific model to use (required for OpenAI and Anthropic)")
+    parser.add_argument("--openai", action="store_true", help="Use OpenAI provider")
+    parser.add_argument("--anthropic", action="store_true", help="Use Anthropic provider")
+    parser.add_argument("--ollama", action="store_true", help="Use Ollama provider")
+    parser.add_argument("--lmstudio", action="store_true", help="Use LM Studio provider")    
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the server response cache")
+    parser.add_argument("--session", help="Continue a server-side conversation with this id, only the new message is sent")
+    parser.add_argument("--reset-session", action="store_true", help="Start the --session conversation from scratch")
+    parser.add_argument("--hedge", help="Comma separated providers to race, e.g. lmstudio,ollama (first token wins)")
+    parser.add_argument("--hedge-delay", type=float, help="Seconds without a token before the next --hedge provider is tried")
+    parser.add_argument("--priority", type=int, default=0, help="Request priority on the server, higher is served first")
+    parser.add_argument("--resumable", action="store_true", help="If the connection drops, the server keeps generating for --resume-grace seconds and llm reconnects to the answer")
+    parser.add_argument("--raw", action="store_true", help="Print the provider's raw stream (SSE/NDJSON) instead of the text")
+    parser.add_argument("--batch", metavar="PROMPTS.jsonl", help="Run all prompts of a JSONL file and write JSONL results")
+    parser.add_argument("--batch-output", metavar="RESULTS.jsonl", help="Results file for --batch, appended to and used to resume (default: PROMPTS.results.jsonl)")
+    parser.add_argument("--chunked", action="store_true", help="Split a long input into chunks, answer them concurrently and combine the answers")
+    parser.add_argument("--chunk-tokens", type=int, default=3000, help="Approximate tokens per --chunked chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="Approximate tokens shared by consecutive --chunked chunks")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts in flight at once in --batch and --chunked mode")
+    parser.add_argument("--connections", type=int, default=1, help="Websocket connections used in --batch mode")
+    parser.add_argument("--ordered", action="store_true", help="Write --batch results in input order")
+    parser.add_argument("--batch-timeout", type=float, default=120.0, help="Seconds without a frame before a --batch or --chunked prompt fails")
+    parser.add_argument("--profile-startup", action="store_true", help="Print an import-time breakdown of this invocation to stderr")
+    parser.add_argument("input", nargs="*", help="User message")
+    return parser.parse_args(argv)
+
+
+def main():
+    # Here, so the clients can import parse_arguments without cli-common
+    import cli_entry
+
+    cli_entry.run(TOOL, os.path.dirname(os.path.abspath(__file__)), parse_arguments, "llm_client")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+ASGI application serving the LLM server (llm_server.py) so it can run as
+several uvicorn worker processes:
+
+    python llm_gateway.py --port 5000 --workers 4 [llm_server options]
+    uvicorn llm_gateway:app --port 5000 --workers 4
+
+Every worker is a complete LLM server with its own upstream pools,
+scheduler and metrics; nothing is shared between them except through the
+state backend given with --state-backend (sessions, cached responses and
+in-flight limits, see state_backend.py). With the default in-process
+backend each worker applies --max-in-flight on its own.
+
+Endpoints, on one port:
+
+    websocket (any path)  the llm_server protocol, v1 and v2 (framing.py)
+    POST /stream          one prompt, same JSON as over the websocket; the
+                          answer streams back as NDJSON lines {"delta"},
+                          {"type": "queue"}, {"error"} and finally
+                          {"done": true, ...metadata}
+    GET /metrics, /stats  of the worker that answers the request
+    GET /health
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import websockets
+
+import framing
+import llm_server
+
+logger = logging.getLogger(__name__)
+
+# Command line of the gateway, handed to the worker processes, which
+# configure llm_server from it when they start
+ARGS_ENV = "LLM_GATEWAY_ARGS"
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class ASGIWebSocket:
+    """
+    The subset of a websockets connection that llm_server.handle_client
+    uses, on top of an ASGI websocket: the negotiated subprotocol, async
+    iteration over the received messages and send(). Like with the
+    websockets server, the iteration ends when the client closed the
+    connection normally, and a dropped connection raises ConnectionClosed.
+    """
+
+    def __init__(self, receive, send, subprotocol=None):
+        self._receive = receive
+        self._send = send
+        self.subprotocol = subprotocol
+        self.closed = False
+
+    def _closed_error(self):
+        self.closed = True
+        return websockets.exceptions.ConnectionClosed(None, None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise self._closed_error()
+        message = await self._receive()
+        if message["type"] == "websocket.disconnect":
+            if message.get("code") in (1000, 1001):
+                self.closed = True
+                raise StopAsyncIteration
+            raise self._closed_error()
+        if message.get("text") is not None:
+            return message["text"]
+        return message.get("bytes") or b""
+
+    async def send(self, message):
+        if self.closed:
+            raise self._closed_error()
+        frame = {"type": "websocket.send"}
+        frame["text" if isinstance(message, str) else "bytes"] = message
+        try:
+            await self._send(frame)
+        except (OSError, RuntimeError):  # the server's disconnect errors
+            raise self._closed_error()
+
+
+class HTTPChannel:
+    """The frames of one /stream response as NDJSON lines, see llm_server.ResponseChannel."""
+
+    def __init__(self, send, connection):
+        self._send = send
+        self.connection = connection
+        self.started = time.monotonic()
+        self.first_delta = None
+
+    async def line(self, frame):
+        await self._send({"type": "http.response.body", "body": json.dumps(frame).encode("utf-8") + b"\n", "more_body": True})
+
+    async def delta(self, text: str):
+        if self.first_delta is None:
+            self.first_delta = time.monotonic()
+        await self.line({"delta": text})
+
+    async def raw(self, chunk: bytes):
+        await self.line({"raw": chunk.decode("utf-8", errors="replace")})
+
+    async def end(self, metadata=None):
+        frame = dict(metadata or {}, done=True, duration=round(time.monotonic() - self.started, 3))
+        if self.first_delta is not None:
+            frame["ttft"] = round(self.first_delta - self.started, 3)
+        await self.line(frame)
+
+    async def error(self, message: str):
+        await self.line({"error": message})
+
+    async def queue(self, position: int, eta: float):
+        await self.line({"type": "queue", "position": position, "eta": round(eta, 1)})
+
+
+async def respond(send, status: int, content_type: str, body: str):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type.encode("latin-1"))]})
+    await send({"type": "http.response.body", "body": body.encode("utf-8")})
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError(f"Request body larger than {MAX_BODY_BYTES} bytes")
+        if not message.get("more_body"):
+            return body
+
+
+async def stream_prompt(scope, receive, send):
+    """POST /stream: answer one prompt, cancelling it when the client goes away."""
+    received = time.monotonic()
+    try:
+        data = json.loads(await read_body(receive))
+    except ConnectionError:
+        return
+    except ValueError as e:
+        await respond(send, 400, "application/json", json.dumps({"error": str(e) or "Invalid JSON"}))
+        return
+    if not isinstance(data, dict):
+        await respond(send, 400, "application/json", json.dumps({"error": "Expected a JSON object"}))
+        return
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"application/x-ndjson"), (b"cache-control", b"no-cache")]})
+    # Requests of one HTTP connection take turns with other connections in the scheduler
+    channel = HTTPChannel(send, tuple(scope["client"]) if scope.get("client") else None)
+    request = asyncio.create_task(llm_server.handle_request(channel, data, received))
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        request.cancel("disconnect")
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await asyncio.gather(request, return_exceptions=True)
+    finally:
+        watcher.cancel()
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def handle_http(scope, receive, send):
+    path, method = scope["path"], scope["method"]
+    if path == "/stream" and method == "POST":
+        await stream_prompt(scope, receive, send)
+    elif path == "/metrics" and method == "GET":
+        await respond(send, 200, "text/plain; version=0.0.4", llm_server.metrics.render())
+    elif path == "/stats" and method == "GET":
+        await respond(send, 200, "application/json", json.dumps(dict(llm_server.get_stats(), pid=os.getpid())))
+    elif path == "/health" and method == "GET":
+        await respond(send, 200, "application/json", json.dumps({"status": "ok"}))
+    else:
+        await respond(send, 404, "text/plain", "Not Found\n")
+
+
+async def handle_websocket(scope, receive, send):
+    if (await receive())["type"] != "websocket.connect":
+        return
+    subprotocol = framing.SUBPROTOCOL if framing.SUBPROTOCOL in scope.get("subprotocols", []) else None
+    await send({"type": "websocket.accept", "subprotocol": subprotocol})
+    websocket = ASGIWebSocket(receive, send, subprotocol)
+    # Returns once the client disconnected
+    await llm_server.handle_client(websocket, scope["path"])
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                llm_server.configure(llm_server.parse_arguments(json.loads(os.environ.get(ARGS_ENV, "[]"))))
+            except (ValueError, SystemExit) as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            logger.info(f"LLM gateway worker {os.getpid()} started")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await llm_server.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http":
+        await handle_http(scope, receive, send)
+    elif scope["type"] == "websocket":
+        await handle_websocket(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await lifespan(receive, send)
+
+
+def parse_arguments(argv=None):
+    """The gateway's options, and the llm_server options among them that the workers parse again."""
+    parser = argparse.ArgumentParser(description="LLM Server as an ASGI application on uvicorn workers")
+    llm_server.add_server_arguments(parser)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default one per CPU core)")
+    args = parser.parse_args(argv)
+
+    gateway_only = argparse.ArgumentParser(add_help=False)
+    gateway_only.add_argument("--workers")
+    _, server_argv = gateway_only.parse_known_args(argv)
+    return args, server_argv
+
+
+def main():
+    args, server_argv = parse_arguments()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("llm_gateway needs uvicorn (pip install uvicorn)")
+
+    os.environ[ARGS_ENV] = json.dumps(server_argv)
+
+    print(f"LLM Gateway starting {args.workers} worker(s) on ws://{args.host}:{args.port} and http://{args.host}:{args.port}/stream")
+    uvicorn.run(
+        "llm_gateway:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        lifespan="on",
+        log_level=args.log_level.lower(),
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+if __name__ == "__main__":
+    main()
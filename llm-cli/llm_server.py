@@ -1,42 +1,128 @@
-debug = True
-
 import asyncio
+import collections
+import contextlib
+import time
 import websockets
+import argparse
 import json
 import httpx
 from typing import Dict, Any
 import logging
-import os
+from http_pool import ProviderClientPool
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from scheduler import ProviderScheduler, QueueFullError
+from delta_coalescer import DeltaCoalescer
+from sessions import ConversationStore
+from hedging import HedgeStats, hedged_stream
+from rate_limits import RateLimitTracker, RETRY_STATUSES, estimate_tokens
+from state_backend import MemoryBackend, open_backend
+import providers
+import framing
+from metrics import MetricsRegistry, LabelLimiter, serve_http
 
-if debug:
-    # Configure logging
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s.%(msecs)03d - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
 logger = logging.getLogger(__name__)
 
 # Replace with your actual LMStudio server endpoint
 LMSTUDIO_SERVER_URL = "http://localhost:1234/v1/chat/completions"
 
-# Define endpoints for different providers
-PROVIDER_ENDPOINTS = {
-    "lmstudio": "http://localhost:1234/v1/chat/completions",
-    "openai": "https://api.openai.com/v1/chat/completions",
-    "anthropic": "https://api.anthropic.com/v1/messages",    
-    "ollama": "http://localhost:11434/api/chat"  
-}
-
-# Define default models for providers
-DEFAULT_MODELS = {
-    "openai": "gpt-4o-mini",
-    "anthropic": "claude-3-5-sonnet-20240620",
-    "ollama": "llama3.1"
-}
-
-# Create a single httpx.AsyncClient to be reused
-http_client = httpx.AsyncClient()
+# Endpoints, default models and in-flight limits of the providers are
+# defined by their adapters in providers.py
+
+# How long / how many bytes of deltas are batched into one websocket frame
+# after the first token (configured in main, 0 ms sends every delta)
+FLUSH_INTERVAL = 0.02
+FLUSH_BYTES = 512
+
+# Seconds without a token before a hedged request is also sent to the next
+# provider in its list (configured in main, requests may override it)
+HEDGE_DELAY = 0.5
+
+# Upstream answers with a status in RETRY_STATUSES (429, 5xx) are retried
+# with jittered backoff up to MAX_RETRIES times, as long as the request is
+# not older than RETRY_DEADLINE seconds (configured in main)
+MAX_RETRIES = 4
+RETRY_DEADLINE = 30.0
+
+# Pooled keep-alive clients, one per provider (configured in main)
+client_pool = ProviderClientPool()
+
+# Admission control for upstream requests (configured in main)
+scheduler = ProviderScheduler({name: adapter.max_in_flight for name, adapter in providers.ADAPTERS.items()})
+
+# State shared between server processes (sessions, cache, in-flight
+# counters). In-process by default, configured with --state-backend
+state = MemoryBackend()
+
+# Request and token budgets per provider and model from the rate limit
+# headers of the responses, used to pace requests before they are sent
+rate_limits = RateLimitTracker()
+
+# Server-side conversation history for clients that send a session id
+conversations = ConversationStore(backend=state)
+
+# Win rates and time to first token of hedged requests per provider
+hedge_stats = HedgeStats()
+
+# Cancelled requests per reason ("cancel", "disconnect") and the deltas they
+# had streamed until then
+cancel_stats = {"cancel": 0, "disconnect": 0, "deltas": 0}
+
+# Protocol v2 streams with a resume key whose connection went away, by key.
+# They keep running (and buffering frames) for RESUME_GRACE seconds waiting
+# for the client to reconnect and resume them.
+detached_streams: Dict[str, Any] = {}
+RESUME_GRACE = 30.0
+RESUME_BUFFER_FRAMES = 4096
+
+# Optional response cache, enabled with --cache
+response_cache = None
+
+# Optional coalescing of identical in-flight requests, enabled with --coalesce
+single_flight = None
+
+# Prometheus metrics served on --metrics-port. Provider and model labels go
+# through LabelLimiters so clients sending arbitrary names cannot blow up
+# the number of series.
+metrics = MetricsRegistry()
+provider_label = LabelLimiter(len(providers.ADAPTERS) + 1, providers.ADAPTERS.keys())
+model_label = LabelLimiter(20, [adapter.default_model for adapter in providers.ADAPTERS.values() if adapter.default_model])
+TOKEN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RATE_BUCKETS = (1, 2.5, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+REQUESTS = metrics.counter("llm_requests_total", "Requests received", ["provider", "model"])
+ERRORS = metrics.counter("llm_errors_total", "Requests that failed", ["provider", "model", "kind"])
+QUEUE_WAIT = metrics.histogram("llm_queue_wait_seconds", "Time spent waiting for an upstream slot", ["provider"])
+UPSTREAM_CONNECT = metrics.histogram("llm_upstream_connect_seconds", "Time to open a new upstream connection (TCP and TLS)", ["provider"])
+UPSTREAM_RESPONSE = metrics.histogram("llm_upstream_response_seconds", "Time from sending the upstream request to its response headers", ["provider"])
+TTFT = metrics.histogram("llm_time_to_first_token_seconds", "Time from receiving a request to its first delta", ["provider", "model"])
+INTER_TOKEN = metrics.histogram("llm_inter_token_seconds", "Time between consecutive deltas", ["provider", "model"], TOKEN_BUCKETS)
+TOKENS = metrics.counter("llm_tokens_total", "Streamed deltas (roughly one token each)", ["provider", "model"])
+TOKEN_RATE = metrics.histogram("llm_tokens_per_second", "Deltas per second of completed responses, after the first token", ["provider", "model"], RATE_BUCKETS)
+CANCELLED = metrics.counter("llm_cancelled_total", "Requests aborted by a cancel message or a disconnect", ["provider", "model", "reason"])
+CANCELLED_TOKENS = metrics.counter("llm_cancelled_tokens_total", "Deltas streamed for requests that were then cancelled", ["provider", "model"])
+IN_FLIGHT = metrics.gauge("llm_in_flight_requests", "Upstream requests currently running", ["provider"])
+QUEUE_DEPTH = metrics.gauge("llm_queued_requests", "Requests waiting for an upstream slot", ["provider"])
+RETRIES = metrics.counter("llm_upstream_retries_total", "Upstream requests retried after a 429 or 5xx answer", ["provider", "status"])
+PACED = metrics.counter("llm_ratelimit_paced_seconds_total", "Time requests were held back to stay within rate limits", ["provider"])
+RATE_LIMIT_REMAINING = metrics.gauge("llm_ratelimit_remaining", "Remaining rate limit budget reported by the provider", ["provider", "model", "kind"])
+
+client_pool.on_connect = lambda provider, seconds: UPSTREAM_CONNECT.observe(provider_label(provider), value=seconds)
+
+def collect_scheduler_metrics():
+    for provider, stats in scheduler.get_stats().items():
+        IN_FLIGHT.set(provider_label(provider), value=stats["in_flight"])
+        QUEUE_DEPTH.set(provider_label(provider), value=stats["waiting"])
+
+metrics.add_collector(collect_scheduler_metrics)
+
+def collect_rate_limit_metrics():
+    for (provider, model), budget in rate_limits.budgets.items():
+        for kind, remaining in (("requests", budget.requests.remaining), ("tokens", budget.tokens.remaining)):
+            if remaining is not None:
+                RATE_LIMIT_REMAINING.set(provider_label(provider), model_label(model), kind, value=remaining)
+
+metrics.add_collector(collect_rate_limit_metrics)
 
 def log_detailed_error(e: Exception, context: str, extra_info: Dict[str, Any] = {}):
     """Log detailed error information including stacktrace."""
@@ -46,190 +132,639 @@ def log_detailed_error(e: Exception, context: str, extra_info: Dict[str, Any] =
         logger.error(f"{key}: {value}")
 
 
-async def handle_anthropic_stream(response, websocket):
-    async for line in response.aiter_lines():
-        if line.startswith("data: "):
-            data = line[6:].strip()  # Remove "data: " prefix and whitespace
-            if data == "[DONE]":
-                await websocket.send("")  # Send empty string to mark end of response
-                break
-            try:
-                event_data = json.loads(data)
-                event_type = event_data.get("type")
-
-                if event_type == "content_block_delta":
-                    delta = event_data.get("delta", {}).get("text", "")
-                    if delta:
-                        await websocket.send(delta)
-                        logger.debug(f"Sent delta: {delta}")
-                elif event_type == "message_delta":
-                    stop_reason = event_data.get("delta", {}).get("stop_reason")
-                    if stop_reason:
-                        logger.info(f"Message stopped. Reason: {stop_reason}")
-                elif event_type == "message_stop":
-                    await websocket.send("")  # Send empty string to mark end of response
-                    logger.info("Message stop event received")
-                    break
-                # You can add more event type handlers here if needed
-
-            except json.JSONDecodeError as json_error:
-                logger.error(f"Error parsing JSON: {json_error}")
-                logger.error(f"Problematic data: {data}")
-        elif line.startswith("event: "):
-            event_type = line[7:].strip()  # Remove "event: " prefix and whitespace
-            logger.debug(f"Received event: {event_type}")
-        elif line.strip() == "":
-            # Empty line, ignore
-            pass
+class UpstreamError(Exception):
+    """Raised when a provider answers a request with a non-200 status."""
+
+
+def build_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a client message into the provider, endpoint, payload and headers to send upstream."""
+    system_message = data.get("system", "")
+    user_message = data.get("user", "")
+    provider = data.get("provider", "lmstudio")
+    adapter = providers.get_adapter(provider)
+    model = data.get("model") or adapter.default_model
+
+    logger.info(f"Received system message: {system_message}")
+    logger.info(f"Received user message: {user_message}")
+    logger.info(f"Using provider: {provider}")
+    logger.info(f"Using model: {model}")
+
+    session_id = data.get("session")
+    if session_id:
+        messages = conversations.build_messages(session_id, system_message, user_message)
+    else:
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": user_message})
+
+    logger.info(f"Messages sent to LLM:\n{messages}")
+
+    request = adapter.build_request(model, messages, session=bool(session_id))
+    request["priority"] = int(data.get("priority", 0))
+    return request
+
+def shared_slot(provider: str):
+    """
+    Hold one of the provider's in-flight slots across all server processes
+    when the state backend is shared. The local scheduler still queues and
+    orders the requests of this process.
+    """
+    if not state.shared:
+        return contextlib.nullcontext()
+    return state.slot(f"inflight:{provider}", scheduler.limits.get(provider, scheduler.default_limit))
+
+async def hold_back(seconds: float, on_queue=None):
+    """
+    Wait before sending a request upstream. Clients that asked for queue
+    updates get one every second, at position 1, so they keep waiting.
+    """
+    until = time.monotonic() + seconds
+    while (left := until - time.monotonic()) > 0:
+        if on_queue:
+            await on_queue(1, left)
+        await asyncio.sleep(min(left, scheduler.update_interval))
+
+@contextlib.asynccontextmanager
+async def upstream_response(request: Dict[str, Any], started: float):
+    """
+    Send a request upstream, paced by the provider's rate limit budget, and
+    yield the 200 response. 429 and 5xx answers are retried with jittered
+    backoff (at least their Retry-After) until MAX_RETRIES or RETRY_DEADLINE
+    is reached; nothing has been streamed to the client at that point. The
+    budget claimed for a request that is cancelled or fails before its
+    response headers arrive is released again.
+    """
+    provider = request["provider"]
+    model = request["payload"].get("model")
+    tokens = estimate_tokens(request["payload"])
+    attempt = 0
+    claim = None
+    try:
+        while True:
+            delay, claim = rate_limits.reserve(provider, model, tokens)
+            if delay > 0:
+                PACED.inc(provider_label(provider), amount=delay)
+                await hold_back(delay, request.get("on_queue"))
+            sent = time.monotonic()
+            async with client_pool.stream(
+                provider,
+                "POST",
+                request["endpoint"],
+                json=request["payload"],
+                headers=request["headers"]
+            ) as response:
+                # The headers account for this request from here on
+                claim = None
+                retry_after = rate_limits.update(provider, model, response.status_code, response.headers, sent)
+                if response.status_code == 200:
+                    UPSTREAM_RESPONSE.observe(provider_label(provider), value=time.monotonic() - sent)
+                    logger.debug(f"Received 200 OK response from {provider}")
+                    yield response
+                    return
+
+                error_content = (await response.aread()).decode("utf-8", errors="replace")
+                error = UpstreamError(f"Error contacting {provider} server. Status code: {response.status_code}. Response: {error_content}")
+                if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                    raise error
+                delay = rate_limits.backoff(provider, model, attempt, retry_after)
+                if time.monotonic() + delay - started > RETRY_DEADLINE:
+                    raise error
+            RETRIES.inc(provider_label(provider), str(response.status_code))
+            logger.warning(f"{provider} answered {response.status_code}, retry {attempt + 1} of {MAX_RETRIES} in {delay:.2f}s")
+            await hold_back(delay, request.get("on_queue"))
+            attempt += 1
+    finally:
+        if claim is not None:
+            rate_limits.release(provider, model, claim, tokens)
+
+async def stream_completion(request: Dict[str, Any], raw: bool = False):
+    """
+    Send a request upstream and yield the response text deltas as they
+    arrive, or with raw=True the response body chunks as received.
+    """
+    provider = request["provider"]
+    adapter = providers.get_adapter(provider)
+    queued = time.monotonic()
+    async with scheduler.slot(
+        provider,
+        request.get("connection"),
+        request.get("priority", 0),
+        request.get("on_queue")
+    ), shared_slot(provider):
+        QUEUE_WAIT.observe(provider_label(provider), value=time.monotonic() - queued)
+        async with upstream_response(request, queued) as response:
+            chunks = response.aiter_bytes()
+            if raw:
+                async for chunk in chunks:
+                    yield chunk
+                return
+            async for delta in adapter.iter_deltas(chunks):
+                yield delta
+            # Parsers stop at the end-of-message event; read the rest of the
+            # body (usually just the final chunk) so httpx returns the
+            # connection to the keep-alive pool instead of closing it
+            async for _ in chunks:
+                pass
+
+def open_stream(request: Dict[str, Any], data: Dict[str, Any]):
+    """
+    Return the delta stream for a request. Identical concurrent requests
+    share one upstream stream and completed responses are served from the
+    response cache when those are enabled. Clients can opt out of both by
+    sending "cache": false.
+    """
+    if not data.get("cache", True) or not (response_cache or single_flight):
+        return stream_completion(request)
+
+    key = ResponseCache.make_key(request["provider"], request["payload"])
+
+    def source(upstream_request):
+        deltas = stream_completion(upstream_request)
+        if response_cache:
+            deltas = response_cache.stream(key, deltas)
+        return deltas
+
+    if single_flight:
+        # The shared upstream request must not carry this client's queue
+        # callback: the flight sends its updates to every subscriber
+        on_queue = request.get("on_queue")
+        shared = {name: value for name, value in request.items() if name != "on_queue"}
+        return single_flight.stream(key, lambda notify_queue: source(dict(shared, on_queue=notify_queue)), on_queue)
+    return source(request)
+
+async def measure_stream(deltas, provider: str, model: str, received: float):
+    """Pass deltas through while recording TTFT, inter-token latency and token rate."""
+    labels = (provider_label(provider), model_label(model))
+    first = last = None
+    count = 0
+    try:
+        async for delta in deltas:
+            now = time.monotonic()
+            if first is None:
+                first = now
+                TTFT.observe(*labels, value=now - received)
+            else:
+                INTER_TOKEN.observe(*labels, value=now - last)
+            last = now
+            count += 1
+            yield delta
+    finally:
+        TOKENS.inc(*labels, amount=count)
+    if count > 1 and last > first:
+        TOKEN_RATE.observe(*labels, value=(count - 1) / (last - first))
+
+def open_hedged_stream(data: Dict[str, Any], connection):
+    """
+    Race a request across the providers listed in data["hedge"], in order.
+    The model given by the client applies to the first provider, the others
+    use their default model.
+    """
+    candidates = []
+    for index, provider in enumerate(data["hedge"]):
+        candidate_data = dict(data, provider=provider)
+        if index > 0:
+            candidate_data["model"] = None
+        request = build_request(candidate_data)
+        request["connection"] = connection
+        candidates.append((provider, lambda request=request, candidate_data=candidate_data: open_stream(request, candidate_data)))
+    delay = float(data.get("hedge_delay", HEDGE_DELAY))
+    return hedged_stream(candidates, delay, hedge_stats)
+
+class ResponseChannel:
+    """
+    The frames of one response. Requests without an "id" get the original
+    protocol: bare text frames, "" at the end and {"error": ...} on failure.
+    Requests with an "id" may run concurrently on one connection, so each
+    of their frames is a JSON object carrying the id: {"id", "delta"},
+    {"id", "done": true}, {"id", "error"}, {"id", "raw"} and queue updates.
+    """
+
+    def __init__(self, websocket, request_id=None):
+        self.websocket = websocket
+        self.connection = websocket
+        self.request_id = request_id
+
+    async def delta(self, text: str):
+        if self.request_id is None:
+            await self.websocket.send(text)
+        else:
+            await self.websocket.send(json.dumps({"id": self.request_id, "delta": text}))
+
+    async def raw(self, chunk: bytes):
+        if self.request_id is None:
+            await self.websocket.send(chunk)
         else:
-            logger.warning(f"Unexpected line in stream: {line}")
-
-async def handle_openai_stream(response, websocket):
-    async for line in response.aiter_lines():
-        if line.startswith("data: "):
-            if line.strip() == "data: [DONE]":
-                await websocket.send("")  # Send empty string to mark end of response
-                break
+            await self.websocket.send(json.dumps({"id": self.request_id, "raw": chunk.decode("utf-8", errors="replace")}))
+
+    async def end(self, metadata=None):
+        if self.request_id is None:
+            await self.websocket.send("")  # Send empty string to mark end of response
+        else:
+            await self.websocket.send(json.dumps({"id": self.request_id, "done": True}))
+
+    async def error(self, message: str):
+        frame = {"error": message}
+        if self.request_id is not None:
+            frame["id"] = self.request_id
+        await self.websocket.send(json.dumps(frame))
+
+    async def queue(self, position: int, eta: float):
+        frame = {"type": "queue", "position": position, "eta": round(eta, 1)}
+        if self.request_id is not None:
+            frame["id"] = self.request_id
+        await self.websocket.send(json.dumps(frame))
+
+class FramedChannel:
+    """
+    The binary frames of one protocol v2 response, see framing.py. A stream
+    with a resume key keeps its last frames and keeps running while its
+    connection is gone, so a reconnected client can pick it up with attach().
+    """
+
+    def __init__(self, websocket, request_id: int, resume_key=None):
+        self.websocket = websocket
+        self.connection = websocket
+        self.request_id = request_id
+        self.resume_key = resume_key
+        self.seq = 0
+        self.sent = collections.deque(maxlen=RESUME_BUFFER_FRAMES) if resume_key else None
+        self.lock = asyncio.Lock()
+        self.started = time.monotonic()
+        self.first_delta = None
+        self.chars = 0
+
+    async def send(self, frame_type: int, payload: bytes):
+        async with self.lock:
+            seq = self.seq
+            self.seq += 1
+            if self.sent is not None:
+                self.sent.append((seq, frame_type, payload))
+            if self.websocket is None:
+                return  # detached, buffered for a resume
             try:
-                json_data = json.loads(line[6:])  # Remove "data: " prefix
-                content = json_data['choices'][0]['delta'].get('content')
-                if content:
-                    await websocket.send(content)
-                    logger.debug(f"Sent content: {content}")
-            except json.JSONDecodeError as json_error:
-                logger.error(f"Error parsing JSON: {json_error}")
-                logger.error(f"Problematic line: {line}")
-
-async def handle_lmstudio_stream(response, websocket):
-    # LMStudio uses the same format as OpenAI
-    await handle_openai_stream(response, websocket)
-
-async def handle_ollama_stream(response, websocket):
-    logger.debug("Starting to handle Ollama stream")
-    async for line in response.aiter_lines():
-        logger.debug(f"Received line from Ollama: {line}")
-        try:
-            json_data = json.loads(line)
-            logger.debug(f"Parsed JSON data: {json_data}")
-            
-            if json_data.get('done'):
-                logger.debug("Received 'done' signal from Ollama")
-                await websocket.send("")  # Send empty string to mark end of response
-                break
-            
-            content = json_data.get('message', {}).get('content', '')
-            if content:
-                logger.debug(f"Sending content to client: {content}")
-                await websocket.send(content)
+                await self.websocket.send(framing.encode(frame_type, self.request_id, seq, payload))
+            except websockets.exceptions.ConnectionClosed:
+                if self.sent is None:
+                    raise
+                self.websocket = None
+
+    async def delta(self, text: str):
+        if self.first_delta is None:
+            self.first_delta = time.monotonic()
+        self.chars += len(text)
+        await self.send(framing.DELTA, text.encode("utf-8"))
+
+    async def raw(self, chunk: bytes):
+        await self.send(framing.RAW, chunk)
+
+    async def end(self, metadata=None):
+        metadata = dict(metadata or {}, frames=self.seq + 1, chars=self.chars, duration=round(time.monotonic() - self.started, 3))
+        if self.first_delta is not None:
+            metadata["ttft"] = round(self.first_delta - self.started, 3)
+        await self.send(framing.DONE, json.dumps(metadata).encode("utf-8"))
+
+    async def error(self, message: str):
+        await self.send(framing.ERROR, message.encode("utf-8"))
+
+    async def queue(self, position: int, eta: float):
+        await self.send(framing.QUEUE, json.dumps({"position": position, "eta": round(eta, 1)}).encode("utf-8"))
+
+    def detach(self):
+        self.websocket = None
+
+    async def attach(self, websocket, request_id: int, after: int):
+        """Continue on a new connection, starting with the frames after seq `after`."""
+        async with self.lock:
+            self.websocket = websocket
+            self.request_id = request_id
+            for seq, frame_type, payload in self.sent:
+                if seq > after:
+                    await websocket.send(framing.encode(frame_type, request_id, seq, payload))
+
+def detach_stream(channel: FramedChannel, task: asyncio.Task):
+    """Keep a resumable stream running for RESUME_GRACE seconds without a connection."""
+    channel.detach()
+    key = channel.resume_key
+    detached_streams[key] = (channel, task)
+
+    def expire():
+        entry = detached_streams.get(key)
+        if entry is not None and entry[0] is channel:
+            del detached_streams[key]
+            task.cancel("disconnect")
+
+    asyncio.get_running_loop().call_later(RESUME_GRACE, expire)
+    logger.info(f"Stream {key} detached, resumable for {RESUME_GRACE:g}s")
+
+async def forward_raw(channel: ResponseChannel, chunks):
+    """
+    Passthrough mode: send the provider's response body chunks (SSE events or
+    NDJSON lines, as received) as binary frames without parsing them.
+    """
+    try:
+        async for chunk in chunks:
+            await channel.raw(chunk)
+    finally:
+        await chunks.aclose()
+    await channel.end()
+
+async def handle_request(channel: ResponseChannel, data: Dict[str, Any], received: float):
+    """
+    Stream the answer to one prompt to the client. The channel (ResponseChannel,
+    FramedChannel or the gateway's HTTP channel) sends the frames, its
+    connection keeps the scheduler's round-robin between clients.
+    """
+    connection = channel.connection
+    provider = None
+    model = None
+    reply = []
+    try:
+        async with conversations.turn(data.get("session")):
+            if data.get("session"):
+                await conversations.load(data["session"], bool(data.get("reset")))
+            if data.get("hedge"):
+                provider = "hedge"
+                model = data.get("model")
+                deltas = open_hedged_stream(data, connection)
             else:
-                logger.debug("No content in this chunk")
-        except json.JSONDecodeError as json_error:
-            logger.error(f"Error parsing JSON: {json_error}")
-            logger.error(f"Problematic line: {line}")
-        except Exception as e:
-            logger.error(f"Unexpected error in handle_ollama_stream: {str(e)}")
-
-    logger.debug("Finished handling Ollama stream")
+                request = build_request(data)
+                provider = request["provider"]
+                model = request["payload"].get("model")
+                request["connection"] = connection
+                if data.get("queue_updates"):
+                    request["on_queue"] = channel.queue
+                if data.get("raw"):
+                    REQUESTS.inc(provider_label(provider), model_label(model))
+                    await forward_raw(channel, stream_completion(request, raw=True))
+                    return
+                deltas = open_stream(request, data)
+            REQUESTS.inc(provider_label(provider), model_label(model))
+            deltas = measure_stream(deltas, provider, model, received)
+
+            coalescer = DeltaCoalescer(channel.delta, FLUSH_INTERVAL, FLUSH_BYTES)
+            try:
+                async for delta in deltas:
+                    reply.append(delta)
+                    await coalescer.push(delta)
+            except asyncio.CancelledError:
+                coalescer.discard()
+                await deltas.aclose()  # in case we were cancelled while sending
+                raise
+            finally:
+                await coalescer.close()
+            await channel.end({"provider": provider, "model": model, "deltas": len(reply)})
+
+            if data.get("session"):
+                conversations.commit(data["session"], data.get("system", ""), data.get("user", ""), "".join(reply))
+                await conversations.save(data["session"])
+
+    except asyncio.CancelledError as cancel:
+        # Cancelling the task closes the upstream stream (or leaves a shared
+        # one), so the provider stops generating for nobody
+        reason = cancel.args[0] if cancel.args else "cancel"
+        CANCELLED.inc(provider_label(provider), model_label(model), reason)
+        CANCELLED_TOKENS.inc(provider_label(provider), model_label(model), amount=len(reply))
+        cancel_stats[reason] = cancel_stats.get(reason, 0) + 1
+        cancel_stats["deltas"] += len(reply)
+        logger.info(f"Request to {provider} cancelled ({reason}) after {len(reply)} deltas")
+        if reason == "cancel":
+            # The client may keep using the connection
+            await channel.end({"provider": provider, "model": model, "deltas": len(reply), "cancelled": True})
+    except (ValueError, UpstreamError, QueueFullError) as e:
+        logger.error(str(e))
+        ERRORS.inc(provider_label(provider), model_label(model), type(e).__name__)
+        await channel.error(str(e))
+    except httpx.RequestError as request_error:
+        log_detailed_error(request_error, f"HTTP request to {provider}")
+        ERRORS.inc(provider_label(provider), model_label(model), type(request_error).__name__)
+        await channel.error(str(request_error))
+    except websockets.exceptions.ConnectionClosed:
+        logger.info("WebSocket closed while sending a response")
+    except Exception as e:
+        log_detailed_error(e, "Processing request")
+        ERRORS.inc(provider_label(provider), model_label(model), "Exception")
+        await channel.error(str(e))
 
 async def handle_client(websocket, path):
-    logger.info("WebSocket connection established")
+    """
+    Read client messages while responses are streaming. Prompts without an
+    "id" are answered one after another; prompts with an "id" start right
+    away and stream concurrently (see ResponseChannel, and FramedChannel on
+    protocol v2 connections). "cancel" aborts the response with the given
+    id, or the untagged one currently streaming, and a disconnect aborts all
+    of them instead of reading the upstream responses to the end. Only v2
+    streams with a resume key whose connection dropped (no close handshake)
+    keep running and wait for a "resume"; a client that closes the
+    connection is done with them.
+    """
+    framed = websocket.subprotocol == framing.SUBPROTOCOL
+    logger.info(f"WebSocket connection established (protocol {2 if framed else 1})")
+    prompts: asyncio.Queue = asyncio.Queue()
+    running = None
+    tagged: Dict[Any, asyncio.Task] = {}
+    channels: Dict[Any, Any] = {}
+
+    def track(request_id, task, channel):
+        tagged[request_id] = task
+        channels[request_id] = channel
+
+        def untrack(_):
+            if tagged.get(request_id) is task:
+                del tagged[request_id]
+                del channels[request_id]
+
+        task.add_done_callback(untrack)
+
+    async def answer_prompts():
+        nonlocal running
+        while True:
+            data, received = await prompts.get()
+            running = asyncio.create_task(handle_request(ResponseChannel(websocket), data, received))
+            # Cancelling this worker cancels the request with the same reason
+            await asyncio.gather(running, return_exceptions=True)
+            running = None
+
+    worker = asyncio.create_task(answer_prompts())
+    dropped = False
     try:
         async for message in websocket:
+            received = time.monotonic()
             try:
                 data = json.loads(message)
-
-                system_message = data.get("system", "")
-                user_message = data.get("user", "")
-                provider = data.get("provider", "lmstudio")
-                model = data.get("model") or DEFAULT_MODELS.get(provider)
-                
-                logger.info(f"Received system message: {system_message}")
-                logger.info(f"Received user message: {user_message}")
-                logger.info(f"Using provider: {provider}")
-                logger.info(f"Using model: {model}")
-
-                messages = []
-                if system_message:
-                    messages.append({"role": "system", "content": system_message})
-                messages.append({"role": "user", "content": user_message})
-
-                logger.info(f"Messages sent to LLM:\n{messages}")
-
-                endpoint = PROVIDER_ENDPOINTS.get(provider)
-                if not endpoint:
-                    error_msg = f"Invalid provider: {provider}"
-                    logger.error(error_msg)
-                    await websocket.send(json.dumps({"error": error_msg}))
-                    continue
-
-                payload = {
-                    "model": model,
-                    "messages": messages,
-                    "stream": True,
-                    # "max_tokens": 1024  #  might want to make this configurable
-                }
-                headers = {"Content-Type": "application/json"}
-
-                if provider == "anthropic":
-                    headers["X-API-Key"] = os.environ.get('ANTHROPIC_API_KEY')
-                    headers["anthropic-version"] = "2023-06-01"
-                elif provider == "openai":
-                    headers["Authorization"] = f"Bearer {os.environ.get('OPENAI_API_KEY')}"
-                elif provider == "lmstudio":
-                    payload["model"] = "local-model"
-
-                async with httpx.AsyncClient() as client:
-                    async with client.stream(
-                        "POST",
-                        endpoint,
-                        json=payload,
-                        headers=headers,
-                        timeout=60.0
-                    ) as response:
-                        if response.status_code != 200:
-                            error_content = await response.text()
-                            error_msg = f"Error contacting {provider} server. Status code: {response.status_code}. Response: {error_content}"
-                            logger.error(error_msg)
-                            await websocket.send(json.dumps({"error": error_msg}))
-                            continue
-
-                        logger.debug(f"Received 200 OK response from {provider}")
-
-                        if provider == "anthropic":
-                            await handle_anthropic_stream(response, websocket)
-                        elif provider == "openai":
-                            await handle_openai_stream(response, websocket)
-                        elif provider == "lmstudio":
-                            await handle_lmstudio_stream(response, websocket)
-                        elif provider == "ollama":
-                            await handle_ollama_stream(response, websocket)
-                        else:
-                            error_msg = f"Unsupported provider: {provider}"
-                            logger.error(error_msg)
-                            await websocket.send(json.dumps({"error": error_msg}))
-
             except json.JSONDecodeError:
                 await websocket.send(json.dumps({"error": "Invalid JSON"}))
-            except httpx.RequestError as request_error:
-                log_detailed_error(request_error, f"HTTP request to {provider}")
-                await websocket.send(json.dumps({"error": str(request_error)}))
-            except Exception as e:
-                log_detailed_error(e, "Processing request")
-                await websocket.send(json.dumps({"error": str(e)}))
+                continue
+
+            request_id = data.get("id")
+            if not isinstance(request_id, (str, int, type(None))):
+                await websocket.send(json.dumps({"error": "Request id must be a string or an integer"}))
+                continue
+            if data.get("type") == "stats":
+                await websocket.send(json.dumps(get_stats()))
+            elif data.get("type") == "cancel":
+                task = tagged.get(request_id) if request_id is not None else running
+                if task is not None and not task.done():
+                    task.cancel("cancel")
+            elif framed and not framing.valid_stream_id(request_id):
+                await websocket.send(json.dumps({"error": "Protocol v2 messages need an integer id from 0 to 2**32-1"}))
+            elif request_id in tagged:
+                await websocket.send(json.dumps({"error": f"Request id {request_id} is already in use", "id": request_id}))
+            elif framed and data.get("type") == "resume":
+                entry = detached_streams.pop(data.get("key"), None)
+                if entry is None:
+                    await websocket.send(framing.encode(framing.ERROR, request_id, 0, b"Unknown or expired resume key"))
+                    continue
+                channel, task = entry
+                after = data.get("after") if framing.valid_stream_id(data.get("after")) else -1
+                await channel.attach(websocket, request_id, after)
+                if not task.done():
+                    track(request_id, task, channel)
+                logger.info(f"Stream {channel.resume_key} resumed as {request_id} after seq {after}")
+            elif framed:
+                channel = FramedChannel(websocket, request_id, data.get("resume_key"))
+                track(request_id, asyncio.create_task(handle_request(channel, data, received)), channel)
+            elif request_id is not None:
+                channel = ResponseChannel(websocket, request_id)
+                track(request_id, asyncio.create_task(handle_request(channel, data, received)), channel)
+            else:
+                prompts.put_nowait((data, received))
 
     except websockets.exceptions.ConnectionClosed:
+        # A close handshake ends the iteration, this is a dropped connection
+        dropped = True
         logger.info("WebSocket disconnected")
     finally:
+        worker.cancel("disconnect")
+        aborted = [worker]
+        for request_id, task in tagged.items():
+            channel = channels[request_id]
+            if dropped and getattr(channel, "resume_key", None) and not task.done():
+                detach_stream(channel, task)
+            else:
+                task.cancel("disconnect")
+                aborted.append(task)
+        await asyncio.gather(*aborted, return_exceptions=True)
         logger.info("Closing WebSocket connection")
 
 
-async def main_async():
-    server = await websockets.serve(handle_client, "localhost", 5000)
-    print("LLM Server started on ws://localhost:5000")
-    await server.wait_closed()
+def get_stats() -> Dict[str, Any]:
+    """Collect server statistics for the "stats" control message."""
+    stats = {
+        "type": "stats",
+        "pool": client_pool.get_stats(),
+        "scheduler": scheduler.get_stats(),
+        "sessions": conversations.get_stats(),
+        "state": state.get_stats(),
+        "hedging": hedge_stats.get_stats(),
+        "cancelled": dict(cancel_stats),
+        "rate_limits": rate_limits.get_stats(),
+    }
+    if response_cache:
+        stats["cache"] = response_cache.get_stats()
+    if single_flight:
+        stats["coalescing"] = single_flight.get_stats()
+    return stats
+
+
+async def main_async(args):
+    server = await websockets.serve(handle_client, args.host, args.port, subprotocols=[framing.SUBPROTOCOL])
+    print(f"LLM Server started on ws://{args.host}:{args.port}")
+    if args.metrics_port:
+        await serve_http(args.host, args.metrics_port, {
+            "/metrics": ("text/plain; version=0.0.4", metrics.render),
+            "/stats": ("application/json", lambda: json.dumps(get_stats())),
+        })
+        print(f"Metrics available on http://{args.host}:{args.metrics_port}/metrics")
+    try:
+        await server.wait_closed()
+    finally:
+        await aclose()
+
+async def aclose():
+    await client_pool.aclose()
+    await state.aclose()
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """Options shared by llm_server.py and llm_gateway.py."""
+    parser.add_argument("--host", default="localhost", help="Host to bind the server to")
+    parser.add_argument("--port", type=int, default=5000, help="Port for the WebSocket server")
+    parser.add_argument("--max-connections", type=int, help="Max upstream connections per provider")
+    parser.add_argument("--max-keepalive", type=int, help="Max idle keep-alive connections per provider")
+    parser.add_argument("--keepalive-expiry", type=float, help="Seconds an idle upstream connection is kept open")
+    parser.add_argument("--connect-timeout", type=float, help="Upstream connect timeout in seconds")
+    parser.add_argument("--read-timeout", type=float, help="Upstream read timeout in seconds")
+    parser.add_argument("--cache", action="store_true", help="Cache and replay identical requests")
+    parser.add_argument("--cache-size", type=int, default=256, help="Max responses kept in the in-memory cache")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="Seconds a cached response stays valid (0 = forever)")
+    parser.add_argument("--cache-dir", help="Directory to persist cached responses in")
+    parser.add_argument("--cache-pace", type=float, default=0.0, help="Replay cache hits at this many deltas per second (0 = immediately)")
+    parser.add_argument("--coalesce", action="store_true", help="Share one upstream stream between identical concurrent requests")
+    parser.add_argument("--endpoint", action="append", default=[], metavar="PROVIDER=URL", help="Override a provider's endpoint, e.g. to point at benchmarks/fake_provider.py (repeatable)")
+    parser.add_argument("--max-in-flight", action="append", default=[], metavar="PROVIDER=N", help="Max concurrent upstream requests for a provider (repeatable)")
+    parser.add_argument("--max-queue", type=int, default=64, help="Max queued requests per provider before new ones are rejected")
+    parser.add_argument("--flush-ms", type=float, default=20.0, help="Batch deltas after the first token into one frame per this many ms (0 = one frame per delta)")
+    parser.add_argument("--flush-bytes", type=int, default=512, help="Send a batched frame early once it holds this many bytes")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="Max conversation sessions kept on the server")
+    parser.add_argument("--session-idle-timeout", type=float, default=1800.0, help="Seconds after which an unused session is dropped")
+    parser.add_argument("--session-max-messages", type=int, default=50, help="Max messages of history kept per session")
+    parser.add_argument("--hedge-delay", type=float, default=0.5, help="Default seconds without a token before a hedged request tries the next provider")
+    parser.add_argument("--max-retries", type=int, default=4, help="Retries of upstream requests answered with 429 or 5xx (0 = none)")
+    parser.add_argument("--retry-deadline", type=float, default=30.0, help="Seconds after which a request is no longer retried")
+    parser.add_argument("--resume-grace", type=float, default=30.0, help="Seconds a protocol v2 stream with a resume key keeps running after its client's connection dropped")
+    parser.add_argument("--state-backend", default="memory://", help="Where state shared between server processes is kept: memory:// (per process) or redis://host:port/db")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="Set the logging level")
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="LLM Server with WebSocket interface")
+    add_server_arguments(parser)
+    parser.add_argument("--metrics-port", type=int, default=0, help="Port for the HTTP /metrics and /stats endpoints, e.g. 5001 (default: disabled)")
+    return parser.parse_args(argv)
+
+def configure(args):
+    """Apply the command line options to the module state."""
+    global response_cache, single_flight, state, FLUSH_INTERVAL, FLUSH_BYTES, HEDGE_DELAY, RESUME_GRACE, MAX_RETRIES, RETRY_DEADLINE
+
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format='%(asctime)s.%(msecs)03d - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    FLUSH_INTERVAL = args.flush_ms / 1000.0
+    FLUSH_BYTES = args.flush_bytes
+    HEDGE_DELAY = args.hedge_delay
+    RESUME_GRACE = args.resume_grace
+    MAX_RETRIES = args.max_retries
+    RETRY_DEADLINE = args.retry_deadline
+    state = open_backend(args.state_backend)
+    conversations.backend = state
+    conversations.max_sessions = args.max_sessions
+    conversations.idle_timeout = args.session_idle_timeout
+    conversations.max_messages = args.session_max_messages
+    client_pool.overrides = {
+        "max_connections": args.max_connections,
+        "max_keepalive_connections": args.max_keepalive,
+        "keepalive_expiry": args.keepalive_expiry,
+        "connect_timeout": args.connect_timeout,
+        "read_timeout": args.read_timeout,
+    }
+    for endpoint in args.endpoint:
+        name, _, url = endpoint.partition("=")
+        providers.get_adapter(name).endpoint = url
+    for limit in args.max_in_flight:
+        name, _, value = limit.partition("=")
+        scheduler.limits[name] = int(value)
+    scheduler.max_queue = args.max_queue
+    if args.cache:
+        response_cache = ResponseCache(args.cache_size, args.cache_ttl, args.cache_dir, args.cache_pace, state)
+    if args.coalesce:
+        single_flight = SingleFlight()
 
 def main():
-    asyncio.run(main_async())
+    args = parse_arguments()
+    configure(args)
+    asyncio.run(main_async(args))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import asyncio
+import bisect
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class LabelLimiter:
+    """
+    Keeps a label's cardinality bounded: the first max_values distinct values
+    are passed through, any later value is reported as "other".
+    """
+
+    def __init__(self, max_values: int = 20, allowed: Sequence[str] = ()):
+        self.max_values = max_values
+        self.seen = set(allowed)
+
+    def __call__(self, value: Optional[str]) -> str:
+        value = value or "none"
+        if value in self.seen:
+            return value
+        if len(self.seen) < self.max_values:
+            self.seen.add(value)
+            return value
+        return "other"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, *labels: str, value: float):
+        # Per series: one counter per bucket (non-cumulative), then sum and count
+        series = self.series.get(labels)
+        if series is None:
+            series = [0.0] * (len(self.buckets) + 2)
+            self.series[labels] = series
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """A minimal Prometheus text-format registry, no client library needed."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Register a callback that refreshes gauges right before rendering."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+async def serve_http(
+        host: str,
+        port: int,
+        routes: Dict[str, Tuple[str, Callable[[], str]]]):
+    """
+    Serve a few read-only GET endpoints (e.g. /metrics) over plain HTTP.
+    routes maps a path to (content type, body callback).
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request_line[1].split("?")[0] if len(request_line) > 1 else "/"
+            if request_line and request_line[0] == "GET" and path in routes:
+                content_type, render = routes[path]
+                status, body = "200 OK", render().encode("utf-8")
+            else:
+                content_type, status, body = "text/plain", "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Error serving HTTP request: {e}")
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
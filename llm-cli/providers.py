@@ -0,0 +1,184 @@
+"""
+Provider adapters for llm_server.
+
+Each provider is one ProviderAdapter subclass that knows its endpoint,
+how to build the upstream request and how to turn the streamed response
+bytes into text deltas. llm_server only talks to adapters, so a new
+backend is added by defining a subclass decorated with @register:
+
+    @register
+    class MyServerAdapter(OpenAICompatibleAdapter):
+        name = "myserver"
+        endpoint = "http://localhost:9000/v1/chat/completions"
+"""
+import os
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+import stream_parser
+
+# How long Ollama keeps a model loaded after a session turn, so the next turn
+# does not pay for reloading it and re-ingesting the conversation prefix
+OLLAMA_SESSION_KEEP_ALIVE = "30m"
+
+# Anthropic requires max_tokens on every request
+ANTHROPIC_MAX_TOKENS = 1024
+
+ADAPTERS: Dict[str, "ProviderAdapter"] = {}
+
+
+def register(adapter_class):
+    """Class decorator that makes an adapter available under its name."""
+    ADAPTERS[adapter_class.name] = adapter_class()
+    return adapter_class
+
+
+def get_adapter(name: str) -> "ProviderAdapter":
+    adapter = ADAPTERS.get(name)
+    if adapter is None:
+        raise ValueError(f"Invalid provider: {name}")
+    return adapter
+
+
+class ProviderAdapter:
+    """Base class of all provider adapters."""
+
+    name: str = ""
+    endpoint: str = ""
+    default_model: Optional[str] = None
+    # Max concurrent upstream requests, see llm_server --max-in-flight
+    max_in_flight: int = 4
+    # Environment variable holding the API key, if the provider needs one
+    api_key_env: Optional[str] = None
+
+    def api_key(self) -> Optional[str]:
+        return os.environ.get(self.api_key_env) if self.api_key_env else None
+
+    def build_headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json"}
+
+    def build_payload(self, model: Optional[str], messages: List[Dict[str, str]], session: bool) -> Dict[str, Any]:
+        payload = {"messages": messages, "stream": True}
+        if model:
+            payload["model"] = model
+        return payload
+
+    def build_request(self, model: Optional[str], messages: List[Dict[str, str]], session: bool = False) -> Dict[str, Any]:
+        """Return the endpoint, payload and headers of a streaming chat request."""
+        return {
+            "provider": self.name,
+            "endpoint": self.endpoint,
+            "payload": self.build_payload(model or self.default_model, messages, session),
+            "headers": self.build_headers(),
+        }
+
+    def iter_deltas(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+        """Text deltas of a streamed response, fed with its raw body chunks."""
+        raise NotImplementedError
+
+
+class OpenAICompatibleAdapter(ProviderAdapter):
+    """Servers speaking the OpenAI chat completions SSE format."""
+
+    def build_headers(self) -> Dict[str, str]:
+        headers = super().build_headers()
+        api_key = self.api_key()
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+    def iter_deltas(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+        return stream_parser.iter_openai_deltas(chunks)
+
+
+@register
+class OpenAIAdapter(OpenAICompatibleAdapter):
+    name = "openai"
+    endpoint = "https://api.openai.com/v1/chat/completions"
+    default_model = "gpt-4o-mini"
+    max_in_flight = 16
+    api_key_env = "OPENAI_API_KEY"
+
+
+@register
+class LMStudioAdapter(OpenAICompatibleAdapter):
+    name = "lmstudio"
+    endpoint = "http://localhost:1234/v1/chat/completions"
+    # LM Studio serves one generation at a time, everything above that only piles up timeouts
+    max_in_flight = 1
+
+    def build_payload(self, model, messages, session):
+        return super().build_payload("local-model", messages, session)
+
+
+@register
+class VLLMAdapter(OpenAICompatibleAdapter):
+    """vLLM's OpenAI-compatible server, model must be the served model name."""
+    name = "vllm"
+    endpoint = "http://localhost:8000/v1/chat/completions"
+    # Continuous batching, many parallel requests are cheap
+    max_in_flight = 16
+    api_key_env = "VLLM_API_KEY"
+
+
+@register
+class LlamaCppAdapter(OpenAICompatibleAdapter):
+    """llama.cpp llama-server, serves whatever model it was started with."""
+    name = "llamacpp"
+    endpoint = "http://localhost:8080/v1/chat/completions"
+    # One slot unless the server was started with --parallel
+    max_in_flight = 1
+    api_key_env = "LLAMACPP_API_KEY"
+
+
+@register
+class TGIAdapter(OpenAICompatibleAdapter):
+    """Hugging Face text-generation-inference Messages API."""
+    name = "tgi"
+    endpoint = "http://localhost:3000/v1/chat/completions"
+    default_model = "tgi"
+    max_in_flight = 8
+    api_key_env = "HF_API_TOKEN"
+
+
+@register
+class AnthropicAdapter(ProviderAdapter):
+    name = "anthropic"
+    endpoint = "https://api.anthropic.com/v1/messages"
+    default_model = "claude-3-5-sonnet-20240620"
+    max_in_flight = 16
+    api_key_env = "ANTHROPIC_API_KEY"
+
+    def build_headers(self):
+        headers = super().build_headers()
+        headers["X-API-Key"] = self.api_key() or ""
+        headers["anthropic-version"] = "2023-06-01"
+        return headers
+
+    def build_payload(self, model, messages, session):
+        # The Messages API takes the system prompt as a top-level field
+        system = "\n\n".join(message["content"] for message in messages if message["role"] == "system")
+        payload = super().build_payload(model, [message for message in messages if message["role"] != "system"], session)
+        payload["max_tokens"] = ANTHROPIC_MAX_TOKENS
+        if system:
+            payload["system"] = system
+        return payload
+
+    def iter_deltas(self, chunks):
+        return stream_parser.iter_anthropic_deltas(chunks)
+
+
+@register
+class OllamaAdapter(ProviderAdapter):
+    name = "ollama"
+    endpoint = "http://localhost:11434/api/chat"
+    default_model = "llama3.1"
+    max_in_flight = 2
+
+    def build_payload(self, model, messages, session):
+        payload = super().build_payload(model, messages, session)
+        if session:
+            payload["keep_alive"] = OLLAMA_SESSION_KEEP_ALIVE
+        return payload
+
+    def iter_deltas(self, chunks):
+        return stream_parser.iter_ollama_deltas(chunks)
@@ -0,0 +1,284 @@
+"""
+Rate limit budgets of the hosted providers, read from their response headers.
+
+OpenAI sends x-ratelimit-{limit,remaining,reset}-{requests,tokens} (resets
+as durations like "6m0s" or "20ms"), Anthropic sends
+anthropic-ratelimit-{requests,tokens}-{limit,remaining,reset} (resets as
+RFC 3339 times), and both send Retry-After with 429s. RateLimitTracker
+keeps the latest budget per provider and model and tells llm_server how
+long to hold back the next request, so requests are sent at the rate the
+budget refills instead of bursting into 429s.
+"""
+import logging
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# Answers worth retrying: rate limited, server errors, Anthropic's "overloaded"
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+# Model names come from the clients, so only the most recently used
+# provider/model budgets are kept
+MAX_BUDGETS = 256
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds of an OpenAI style duration ("1s", "6m0s", "20ms") or a plain number."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_reset(value: str) -> Optional[float]:
+    """Seconds until a reset given as a duration or as an RFC 3339 time."""
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        reset = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset.tzinfo is None:
+        reset = reset.replace(tzinfo=timezone.utc)
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds from retry-after-ms or Retry-After (seconds or an HTTP date)."""
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def read_budget(headers: Mapping[str, str], kind: str) -> Tuple[Optional[int], Optional[int], Optional[float]]:
+    """(limit, remaining, seconds until reset) of "requests" or "tokens", None where not sent."""
+    names = [
+        (f"x-ratelimit-limit-{kind}", f"x-ratelimit-remaining-{kind}", f"x-ratelimit-reset-{kind}"),
+        (f"anthropic-ratelimit-{kind}-limit", f"anthropic-ratelimit-{kind}-remaining", f"anthropic-ratelimit-{kind}-reset"),
+    ]
+    for limit_name, remaining_name, reset_name in names:
+        if remaining_name in headers:
+            try:
+                remaining = int(float(headers[remaining_name]))
+                limit = int(float(headers[limit_name])) if limit_name in headers else None
+            except ValueError:
+                return None, None, None
+            reset = parse_reset(headers[reset_name]) if reset_name in headers else None
+            return limit, remaining, reset
+    return None, None, None
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Rough token count a request is charged for: ~4 characters per token plus max_tokens."""
+    chars = sum(len(message.get("content") or "") for message in payload.get("messages", []))
+    return chars // 4 + int(payload.get("max_tokens") or 0)
+
+
+class Budget:
+    """
+    One limit (requests or tokens) as the provider reported it, modelled as
+    a bucket that refills continuously and is full again at the reset, which
+    is how both OpenAI and Anthropic describe their limits. Requests claimed
+    since the headers were read count against it until newer headers arrive.
+    """
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.rate: Optional[float] = None  # refill per second
+        self.updated = 0.0
+        self.claims: Deque[Tuple[float, int]] = deque()  # (dispatch time, amount)
+        self.claimed = 0
+
+    def update(self, limit, remaining, reset, sent: float):
+        if remaining is None:
+            return
+        now = time.monotonic()
+        self.limit = limit if limit is not None else self.limit
+        self.remaining = remaining
+        self.reset_at = now + reset if reset is not None else None
+        self.rate = (self.limit - remaining) / reset if self.limit and reset and self.limit > remaining else None
+        self.updated = now
+        # Requests sent before this one are included in its headers, the
+        # ones sent since then still count against the budget
+        while self.claims and self.claims[0][0] <= sent:
+            self.claims.popleft()
+        self.claimed = sum(amount for _, amount in self.claims)
+
+    def available_at(self, amount: int, now: float) -> float:
+        """When the bucket holds `amount` more than what is claimed already."""
+        if self.remaining is None:
+            return now
+        if self.limit:
+            amount = min(amount, self.limit)
+        needed = self.claimed + amount - self.remaining
+        if needed <= 0:
+            return now
+        if self.rate:
+            return max(now, self.updated + needed / self.rate)
+        return max(now, self.reset_at or now)
+
+    def claim(self, amount: int, dispatch: float):
+        if self.remaining is not None:
+            self.claims.append((dispatch, amount))
+            self.claimed += amount
+
+    def release(self, amount: int, dispatch: float):
+        """Drop the claim of a request that was never answered."""
+        try:
+            self.claims.remove((dispatch, amount))
+        except ValueError:
+            return  # already covered by newer headers
+        self.claimed -= amount
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "claimed": self.claimed,
+            "reset_in": round(max(0.0, self.reset_at - now), 3) if self.reset_at is not None else None,
+        }
+
+
+class ProviderBudget:
+    """Budgets of one provider and model."""
+
+    def __init__(self):
+        self.requests = Budget()
+        self.tokens = Budget()
+        self.paused_until = 0.0
+        self.stats = {"responses": 0, "rate_limited": 0, "retries": 0, "paced": 0, "paced_seconds": 0.0}
+
+
+class RateLimitTracker:
+    """
+    Per provider and model budgets from response headers, pacing of new
+    requests and the backoff of retried ones.
+
+    reserve() returns how long the next request has to wait: until a 429's
+    Retry-After has passed and until both the request and the token budget
+    have refilled enough for it. While budget is left requests go out right
+    away, once it is used up they go out at the rate it refills, so bulk
+    work runs at the quota instead of alternating between bursts and 429s.
+    The reservation counts against the budget right away, so concurrent
+    requests do not all see the same remaining budget; release() takes it
+    back for a request that got no response. Budgets of the MAX_BUDGETS
+    most recently used provider/model pairs are kept.
+    """
+
+    def __init__(self, retry_base_delay: float = 0.5, retry_max_delay: float = 8.0):
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.budgets: "OrderedDict[Tuple[str, str], ProviderBudget]" = OrderedDict()
+        self.random = random.Random()
+
+    def _budget(self, provider: str, model: Optional[str]) -> ProviderBudget:
+        key = (provider, model or "")
+        budget = self.budgets.get(key)
+        if budget is None:
+            budget = ProviderBudget()
+            self.budgets[key] = budget
+            if len(self.budgets) > MAX_BUDGETS:
+                self.budgets.popitem(last=False)
+        else:
+            self.budgets.move_to_end(key)
+        return budget
+
+    def update(self, provider: str, model: Optional[str], status: int, headers: Mapping[str, str], sent: float) -> Optional[float]:
+        """
+        Record the budgets of a response to a request sent at `sent`
+        (time.monotonic()); returns the Retry-After of a 429 or 503, if any.
+        """
+        budget = self._budget(provider, model)
+        budget.stats["responses"] += 1
+        budget.requests.update(*read_budget(headers, "requests"), sent)
+        budget.tokens.update(*read_budget(headers, "tokens"), sent)
+        retry_after = parse_retry_after(headers) if status in (429, 503) else None
+        if status == 429:
+            budget.stats["rate_limited"] += 1
+            pause = retry_after if retry_after is not None else self.retry_base_delay
+            budget.paused_until = max(budget.paused_until, time.monotonic() + pause)
+            logger.warning(f"{provider} rate limited {model or ''}, pausing it for {pause:.2f}s")
+        return retry_after
+
+    def reserve(self, provider: str, model: Optional[str], tokens: int = 0) -> Tuple[float, float]:
+        """
+        Seconds until the next request to provider/model may be sent, and
+        its dispatch time, which names the claim against the budget.
+        """
+        budget = self._budget(provider, model)
+        now = time.monotonic()
+        dispatch = max(now, budget.paused_until, budget.requests.available_at(1, now))
+        if tokens:
+            dispatch = max(dispatch, budget.tokens.available_at(tokens, now))
+        budget.requests.claim(1, dispatch)
+        if tokens:
+            budget.tokens.claim(tokens, dispatch)
+
+        delay = dispatch - now
+        if delay > 0:
+            budget.stats["paced"] += 1
+            budget.stats["paced_seconds"] += delay
+        return delay, dispatch
+
+    def release(self, provider: str, model: Optional[str], dispatch: float, tokens: int = 0):
+        """Take back the claim of reserve() for a request that was cancelled or never answered."""
+        budget = self.budgets.get((provider, model or ""))
+        if budget is None:
+            return
+        budget.requests.release(1, dispatch)
+        if tokens:
+            budget.tokens.release(tokens, dispatch)
+
+    def backoff(self, provider: str, model: Optional[str], attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before retry number `attempt` (0-based): a random share of an
+        exponentially growing window ("full jitter"), on top of Retry-After
+        when the provider sent one, so retrying clients do not synchronize.
+        """
+        self._budget(provider, model).stats["retries"] += 1
+        window = min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt)
+        return (retry_after or 0.0) + self.random.uniform(0, window)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        stats = {}
+        for (provider, model), budget in self.budgets.items():
+            stats[f"{provider}/{model}" if model else provider] = dict(
+                budget.stats,
+                paced_seconds=round(budget.stats["paced_seconds"], 3),
+                requests=budget.requests.to_dict(now),
+                tokens=budget.tokens.to_dict(now),
+                paused_for=round(max(0.0, budget.paused_until - now), 3),
+            )
+        return stats
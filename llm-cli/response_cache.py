@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Caches complete streamed LLM responses keyed by a hash of the normalized
+    request payload.
+
+    Entries live in memory with LRU + TTL eviction and can optionally be
+    persisted to a directory (one JSON file per entry) so that they survive
+    server restarts; the directory holds at most max_entries files too. Hits are replayed as the original delta sequence, either
+    immediately or paced at a fixed number of deltas per second. With a
+    shared state backend (see state_backend.py) entries are also written to
+    it and looked up there on a local miss, so server processes share hits.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 256,
+            ttl: float = 3600.0,
+            cache_dir: Optional[str] = None,
+            pace: float = 0.0,
+            backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.pace = pace
+        self.backend = backend if backend is not None and backend.shared else None
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "saved_deltas": 0,
+            "saved_chars": 0,
+            "saved_upstream_seconds": 0.0,
+        }
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._prune_disk()
+
+    @staticmethod
+    def make_key(provider: str, payload: Dict[str, Any]) -> str:
+        """Hash the provider and payload, ignoring key order and whitespace around message text."""
+        normalized = {k: v for k, v in payload.items() if k != "stream"}
+        normalized["messages"] = [
+            {"role": m.get("role"), "content": (m.get("content") or "").strip()}
+            for m in payload.get("messages", [])
+        ]
+        blob = json.dumps([provider, normalized], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl > 0 and time.time() - entry["created"] > self.ttl
+
+    def _load_from_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not read cache entry {key}: {e}")
+            return None
+
+    def _remove_from_disk(self, key: str):
+        if self.cache_dir:
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+
+    def _prune_disk(self):
+        """Keep only the max_entries most recently written files of earlier runs."""
+        paths = [entry.path for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")]
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=lambda path: os.path.getmtime(path), reverse=True)
+        for path in paths[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a live cache entry or None, dropping it if it has expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self._load_from_disk(key)
+            if entry is not None:
+                self._insert(key, entry)
+        if entry is None:
+            return None
+        if self._is_expired(entry):
+            self.stats["expirations"] += 1
+            self.entries.pop(key, None)
+            self._remove_from_disk(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, deltas: List[str], elapsed: float) -> Dict[str, Any]:
+        entry = {"created": time.time(), "elapsed": elapsed, "deltas": deltas}
+        self._insert(key, entry)
+        self.stats["stores"] += 1
+        if self.cache_dir:
+            try:
+                with open(self._entry_path(key), "w", encoding="utf-8") as f:
+                    json.dump(entry, f, ensure_ascii=False)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key}: {e}")
+        return entry
+
+    async def _get_shared(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self.backend.get(f"cache:{key}")
+        if entry is None or self._is_expired(entry):
+            return None
+        self._insert(key, entry)
+        return entry
+
+    def _insert(self, key: str, entry: Dict[str, Any]):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self._remove_from_disk(evicted)
+            self.stats["evictions"] += 1
+
+    async def stream(self, key: str, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Yield the cached deltas for key, or pass through the deltas from
+        source and store them once the upstream stream completed normally.
+        """
+        entry = self.get(key)
+        if entry is None and self.backend is not None:
+            entry = await self._get_shared(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            self.stats["saved_deltas"] += len(entry["deltas"])
+            self.stats["saved_chars"] += sum(len(d) for d in entry["deltas"])
+            self.stats["saved_upstream_seconds"] += entry.get("elapsed", 0.0)
+            logger.info(f"Cache hit for {key[:12]}, replaying {len(entry['deltas'])} deltas")
+            for delta in entry["deltas"]:
+                yield delta
+                if self.pace > 0:
+                    await asyncio.sleep(1.0 / self.pace)
+            return
+
+        self.stats["misses"] += 1
+        started = time.monotonic()
+        deltas = []
+        async for delta in source:
+            deltas.append(delta)
+            yield delta
+        entry = self.put(key, deltas, time.monotonic() - started)
+        if self.backend is not None:
+            await self.backend.set(f"cache:{key}", entry, self.ttl or None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["entries"] = len(self.entries)
+        return stats
@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Any, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QueueCallback = Callable[[int, float], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    """Raised when a provider queue is at its bound and a request is shed."""
+
+
+class Waiter:
+    def __init__(self, key, connection: Hashable):
+        self.key = key
+        self.connection = connection
+        self.future = asyncio.get_running_loop().create_future()
+        self.cancelled = False
+
+    def __lt__(self, other: "Waiter"):
+        return self.key < other.key
+
+
+class ProviderQueue:
+    """Admission state of a single provider."""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.waiters: List[Waiter] = []
+        self.pending_by_connection: Dict[Hashable, int] = {}
+        self.avg_service_time: Optional[float] = None
+        self.stats = {"admitted": 0, "queued": 0, "shed": 0}
+
+    def waiting(self) -> List[Waiter]:
+        return sorted(w for w in self.waiters if not w.cancelled)
+
+
+class ProviderScheduler:
+    """
+    Limits the number of concurrent upstream requests per provider.
+
+    Requests beyond the limit wait in a priority queue. Higher "priority"
+    values go first; within a priority level requests are interleaved
+    round-robin across connections, so one client submitting many prompts
+    cannot starve the others. Waiting requests get their queue position and
+    ETA reported every update_interval seconds. Requests are shed with
+    QueueFullError once a provider queue holds max_queue waiters.
+    """
+
+    def __init__(
+            self,
+            limits: Dict[str, int],
+            default_limit: int = 4,
+            max_queue: int = 64,
+            update_interval: float = 1.0):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.update_interval = update_interval
+        self.queues: Dict[str, ProviderQueue] = {}
+        self.sequence = itertools.count()
+
+    def _queue(self, provider: str) -> ProviderQueue:
+        queue = self.queues.get(provider)
+        if queue is None:
+            queue = ProviderQueue(self.limits.get(provider, self.default_limit))
+            self.queues[provider] = queue
+        return queue
+
+    def eta(self, provider: str, position: int) -> float:
+        """Estimate the seconds until a request at this queue position is admitted."""
+        queue = self._queue(provider)
+        service_time = queue.avg_service_time or 5.0
+        return (position // queue.max_in_flight + 1) * service_time
+
+    async def acquire(
+            self,
+            provider: str,
+            connection: Hashable = None,
+            priority: int = 0,
+            on_queue: Optional[QueueCallback] = None):
+        queue = self._queue(provider)
+        if queue.in_flight < queue.max_in_flight and not queue.waiting():
+            queue.in_flight += 1
+            queue.stats["admitted"] += 1
+            return
+
+        if len(queue.waiting()) >= self.max_queue:
+            queue.stats["shed"] += 1
+            raise QueueFullError(f"Too many queued requests for {provider}, try again later")
+
+        fair_round = queue.pending_by_connection.get(connection, 0)
+        waiter = Waiter((-priority, fair_round, next(self.sequence)), connection)
+        queue.pending_by_connection[connection] = fair_round + 1
+        heapq.heappush(queue.waiters, waiter)
+        queue.stats["queued"] += 1
+
+        try:
+            while True:
+                # Also acts as a keep-alive for clients with a receive timeout.
+                if on_queue:
+                    position = queue.waiting().index(waiter)
+                    await on_queue(position + 1, self.eta(provider, position))
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), self.update_interval)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            waiter.cancelled = True
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted while we were being cancelled, pass it on.
+                self.release(provider)
+            else:
+                waiter.future.cancel()
+            raise
+        finally:
+            self._leave(queue, connection)
+        queue.stats["admitted"] += 1
+
+    def _leave(self, queue: ProviderQueue, connection: Hashable):
+        remaining = queue.pending_by_connection.get(connection, 1) - 1
+        if remaining > 0:
+            queue.pending_by_connection[connection] = remaining
+        else:
+            queue.pending_by_connection.pop(connection, None)
+
+    def release(self, provider: str, service_time: Optional[float] = None):
+        queue = self._queue(provider)
+        if service_time is not None:
+            if queue.avg_service_time is None:
+                queue.avg_service_time = service_time
+            else:
+                queue.avg_service_time = 0.8 * queue.avg_service_time + 0.2 * service_time
+
+        # Hand the slot straight to the next waiter, if there is one.
+        while queue.waiters:
+            waiter = heapq.heappop(queue.waiters)
+            if not waiter.cancelled and not waiter.future.done():
+                waiter.future.set_result(True)
+                return
+        queue.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, provider: str, connection: Hashable = None, priority: int = 0, on_queue: Optional[QueueCallback] = None):
+        """Hold one in-flight slot of a provider for the duration of the block."""
+        await self.acquire(provider, connection, priority, on_queue)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(provider, time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            provider: dict(
+                queue.stats,
+                in_flight=queue.in_flight,
+                max_in_flight=queue.max_in_flight,
+                waiting=len(queue.waiting()),
+                avg_service_time=queue.avg_service_time,
+            )
+            for provider, queue in self.queues.items()
+        }
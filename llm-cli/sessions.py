@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Conversation:
+    def __init__(self, system: str = ""):
+        self.system = system
+        self.messages: List[Dict[str, str]] = []
+        self.last_used = time.monotonic()
+
+
+class ConversationStore:
+    """
+    Server-side conversation history keyed by client-chosen session ids, so
+    clients only have to send the new turn.
+
+    Sessions idle for longer than idle_timeout seconds are dropped, and the
+    least recently used session is evicted when more than max_sessions are
+    open. Each conversation keeps at most max_messages messages; older turns
+    are trimmed from the front (the system message is kept separately).
+
+    With a shared state backend (see state_backend.py) the backend holds the
+    sessions: load() refreshes a session from it before each turn and save()
+    writes it back after the turn, so consecutive turns may go to different
+    server processes. The local store then only caches the sessions in use.
+
+    Turns of one session run one after another (see turn()), so concurrent
+    requests with the same session id neither interleave nor lose a turn.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 1800.0, max_messages: int = 50, backend=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.backend = backend
+        self.conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.stats = {"created": 0, "turns": 0, "evicted": 0, "expired": 0, "waited": 0}
+        self.turn_locks: Dict[str, asyncio.Lock] = {}
+        self.turn_users: Dict[str, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def turn(self, session_id: Optional[str]):
+        """
+        Hold the session for one turn, from load() to save(). A turn of the
+        same session that is still running is waited for first; without a
+        session id nothing is held.
+        """
+        if not session_id:
+            yield
+            return
+        lock = self.turn_locks.setdefault(session_id, asyncio.Lock())
+        self.turn_users[session_id] = self.turn_users.get(session_id, 0) + 1
+        try:
+            if lock.locked():
+                self.stats["waited"] += 1
+                logger.info(f"Session {session_id} is busy, waiting for its previous turn")
+            async with lock:
+                yield
+        finally:
+            self.turn_users[session_id] -= 1
+            if not self.turn_users[session_id]:
+                del self.turn_users[session_id]
+                del self.turn_locks[session_id]
+
+    def _expire_idle(self):
+        now = time.monotonic()
+        while self.conversations:
+            session_id, conversation = next(iter(self.conversations.items()))
+            if now - conversation.last_used <= self.idle_timeout:
+                break
+            del self.conversations[session_id]
+            self.stats["expired"] += 1
+            logger.info(f"Session {session_id} expired")
+
+    def get(self, session_id: str) -> Optional[Conversation]:
+        self._expire_idle()
+        conversation = self.conversations.get(session_id)
+        if conversation is not None:
+            conversation.last_used = time.monotonic()
+            self.conversations.move_to_end(session_id)
+        return conversation
+
+    def build_messages(self, session_id: str, system: str, user: str) -> List[Dict[str, str]]:
+        """Return the full message list for a new turn without recording it yet."""
+        conversation = self.get(session_id)
+        if system or conversation is None:
+            system = system or ""
+        else:
+            system = conversation.system
+
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        if conversation is not None:
+            messages.extend(conversation.messages)
+        messages.append({"role": "user", "content": user})
+        return messages
+
+    def commit(self, session_id: str, system: str, user: str, reply: str):
+        """Record a completed turn."""
+        conversation = self.get(session_id)
+        if conversation is None:
+            conversation = Conversation(system)
+            self.conversations[session_id] = conversation
+            self.stats["created"] += 1
+            while len(self.conversations) > self.max_sessions:
+                evicted, _ = self.conversations.popitem(last=False)
+                self.stats["evicted"] += 1
+                logger.info(f"Session {evicted} evicted")
+        elif system:
+            conversation.system = system
+
+        conversation.messages.append({"role": "user", "content": user})
+        conversation.messages.append({"role": "assistant", "content": reply})
+        excess = len(conversation.messages) - self.max_messages
+        if excess > 0:
+            # Trim whole user/assistant pairs so history never starts with a reply
+            del conversation.messages[:excess + excess % 2]
+        self.stats["turns"] += 1
+
+    def drop(self, session_id: str):
+        self.conversations.pop(session_id, None)
+
+    def _shared(self) -> bool:
+        return self.backend is not None and self.backend.shared
+
+    async def load(self, session_id: str, reset: bool = False):
+        """Replace the local copy of a session with the shared one, or drop it for a reset."""
+        if reset:
+            self.drop(session_id)
+        if not self._shared():
+            return
+        if reset:
+            await self.backend.delete(f"session:{session_id}")
+            return
+        stored = await self.backend.get(f"session:{session_id}")
+        if stored is None:
+            self.drop(session_id)
+            return
+        conversation = self.conversations.get(session_id) or Conversation()
+        conversation.system = stored["system"]
+        conversation.messages = stored["messages"]
+        conversation.last_used = time.monotonic()
+        self.conversations[session_id] = conversation
+        self.conversations.move_to_end(session_id)
+
+    async def save(self, session_id: str):
+        """Write a session back to the shared backend after commit()."""
+        conversation = self.conversations.get(session_id)
+        if conversation is None or not self._shared():
+            return
+        await self.backend.set(
+            f"session:{session_id}",
+            {"system": conversation.system, "messages": conversation.messages},
+            self.idle_timeout or None
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["open"] = len(self.conversations)
+        return stats
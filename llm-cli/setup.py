@@ -6,8 +6,9 @@ setup(
     packages=find_packages(),
     entry_points={
         'console_scripts': [
-            'llm=llm_client:main',
+            'llm=llm_entry:main',
             'llm-server=start_llm_server:main',
+            'llm-gateway=llm_gateway:main',
         ],
     },
 )
\ No newline at end of file
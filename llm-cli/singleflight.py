@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One upstream stream that any number of subscribers read from."""
+
+    def __init__(self):
+        self.deltas: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.queue_listeners: List[Callable] = []
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Condition()
+
+    async def run(self, source: AsyncIterator[str]):
+        try:
+            async for delta in source:
+                async with self.changed:
+                    self.deltas.append(delta)
+                    self.changed.notify_all()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            async with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+    async def notify_queue(self, position: int, eta: float):
+        """
+        Pass a queue update of the upstream request on to every subscriber
+        that asked for them. A subscriber whose update fails (its client
+        went away) stops getting them; the others and the stream go on.
+        """
+        for listener in list(self.queue_listeners):
+            try:
+                await listener(position, eta)
+            except Exception as e:
+                logger.debug(f"Dropping queue listener: {e!r}")
+                if listener in self.queue_listeners:
+                    self.queue_listeners.remove(listener)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield every delta of the flight, starting from the first one."""
+        index = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: index < len(self.deltas) or self.done)
+            while index < len(self.deltas):
+                yield self.deltas[index]
+                index += 1
+            if self.done and index >= len(self.deltas):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight requests: the first caller for a key starts
+    the upstream stream, concurrent callers with the same key subscribe to it
+    and receive the same deltas as they arrive.
+    """
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def stream(
+        self,
+        key: str,
+        source_factory: Callable[[Callable], AsyncIterator[str]],
+        on_queue: Optional[Callable] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the deltas of the flight for `key`, starting it with
+        `source_factory(notify_queue)` if there is none. The shared source
+        only gets the flight's notify_queue, which sends its queue updates
+        to the `on_queue` of each subscriber, so nothing of one client's
+        connection ends up in the upstream request.
+        """
+        flight = self.flights.get(key)
+        # A cancelled flight has nothing left to give a new subscriber
+        if flight is None or flight.task.cancelled():
+            flight = Flight()
+            self.flights[key] = flight
+            flight.task = asyncio.create_task(flight.run(source_factory(flight.notify_queue)))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            logger.info(f"Coalescing request {key[:12]} onto in-flight stream ({flight.subscribers} subscribers)")
+
+        flight.subscribers += 1
+        if on_queue:
+            flight.queue_listeners.append(on_queue)
+        try:
+            async for delta in flight.subscribe():
+                yield delta
+        finally:
+            flight.subscribers -= 1
+            if on_queue in flight.queue_listeners:
+                flight.queue_listeners.remove(on_queue)
+            # Nobody is listening any more, stop generating upstream. The
+            # flight is forgotten first, so a request arriving meanwhile
+            # starts a new one instead of getting this cancellation.
+            if flight.subscribers == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self.flights)
+        return stats
@@ -0,0 +1,184 @@
+"""
+Storage for server state that has to be shared when the LLM server runs
+as several processes (llm_gateway.py --workers N): conversation sessions,
+cached responses and in-flight counters of the providers.
+
+Backends are picked by URL with --state-backend. "memory://" (the default)
+keeps everything in the process, so every worker has its own sessions,
+cache and limits; "redis://host:port/db" shares them through Redis and
+needs the `redis` package. Further backends register a StateBackend
+subclass in BACKENDS under their URL scheme.
+"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """
+    Async key/value store with expiry. Values are JSON-serializable; a ttl
+    of None keeps a key until it is deleted. `shared` tells whether other
+    processes see the same keys, only then do the stores write through to it.
+    """
+
+    shared = False
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add amount to an integer counter and return the new value, refreshing its ttl."""
+        raise NotImplementedError
+
+    async def touch(self, key: str, ttl: float):
+        """Let an existing key live for another ttl seconds."""
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+    @asynccontextmanager
+    async def slot(self, key: str, limit: int, ttl: float = 300.0, max_delay: float = 0.25):
+        """
+        Hold one of `limit` slots counted under key, polling with backoff
+        while all of them are taken. The ttl lets the counter of a crashed
+        process run out once nobody holds a slot for that long; holders
+        refresh it every ttl / 3 seconds, so a stream running longer than
+        the ttl keeps its slot counted.
+        """
+        delay = 0.01
+        while await self.incr(key, 1, ttl) > limit:
+            await self.incr(key, -1, ttl)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+        async def keep_alive():
+            while True:
+                await asyncio.sleep(ttl / 3)
+                try:
+                    await self.touch(key, ttl)
+                except Exception as e:
+                    logger.warning(f"Refreshing the ttl of {key} failed: {e}")
+
+        refresher = asyncio.create_task(keep_alive())
+        try:
+            yield
+        finally:
+            refresher.cancel()
+            await self.incr(key, -1, ttl)
+
+
+class MemoryBackend(StateBackend):
+    """In-process backend, state is private to the process."""
+
+    def __init__(self, url: str = "memory://"):
+        self.values: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def _live(self, key: str):
+        entry = self.values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.monotonic() + ttl if ttl else None
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(key)
+        return None if entry is None else json.loads(entry[0])
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        # Stored serialized so callers never share mutable objects, like with Redis
+        self.values[key] = (json.dumps(value), self._expiry(ttl))
+
+    async def delete(self, key: str):
+        self.values.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        entry = self._live(key)
+        value = (int(entry[0]) if entry else 0) + amount
+        self.values[key] = (str(value), self._expiry(ttl))
+        return value
+
+    async def touch(self, key: str, ttl: float):
+        entry = self._live(key)
+        if entry is not None:
+            self.values[key] = (entry[0], self._expiry(ttl))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self.values)}
+
+
+class RedisBackend(StateBackend):
+    """Shared backend on a Redis server, keys are prefixed with "llm:"."""
+
+    shared = True
+    prefix = "llm:"
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ValueError("The redis state backend needs the redis package (pip install redis)")
+        self.url = url
+        self.client = redis.from_url(url)
+
+    async def get(self, key: str) -> Any:
+        value = await self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incrby(self.prefix + key, amount)
+            if ttl:
+                pipe.pexpire(self.prefix + key, int(ttl * 1000))
+            value, *_ = await pipe.execute()
+        return int(value)
+
+    async def touch(self, key: str, ttl: float):
+        await self.client.pexpire(self.prefix + key, int(ttl * 1000))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "host": urlparse(self.url).hostname}
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "redis": RedisBackend,
+    "rediss": RedisBackend,
+}
+
+
+def open_backend(url: str) -> StateBackend:
+    scheme = urlparse(url).scheme or url
+    backend = BACKENDS.get(scheme)
+    if backend is None:
+        raise ValueError(f"Unknown state backend {scheme!r}, use one of {', '.join(sorted(BACKENDS))}")
+    logger.info(f"Using state backend {scheme}")
+    return backend(url)
@@ -0,0 +1,236 @@
+"""
+Incremental parsers for provider streaming responses.
+
+Provider streams are consumed as raw byte chunks (httpx aiter_bytes) and
+split into SSE events (OpenAI, LM Studio, Anthropic) or NDJSON lines
+(Ollama) without decoding the whole body to text. For token events only
+the delta string is located and decoded; other events fall back to a full
+JSON decode, using orjson when it is installed.
+"""
+import json
+import logging
+import re
+from typing import AsyncIterator, List, Optional
+
+_json_decoder = json.JSONDecoder()
+
+
+def stdlib_loads(payload: bytes):
+    # json.loads(bytes) sniffs the encoding on every call, providers always send UTF-8
+    return _json_decoder.decode(payload.decode("utf-8"))
+
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = stdlib_loads
+
+JSON_DECODE_ERRORS = (ValueError,)  # json and orjson decode errors both subclass it
+
+logger = logging.getLogger(__name__)
+
+# A JSON string literal body, e.g. the delta text in
+# {"choices":[{"index":0,"delta":{"content":"Hel\"lo"}}]}. Escaped quotes
+# inside other string values can never form one of these key patterns.
+_STRING = rb'"([^"\\]*(?:\\.[^"\\]*)*)"'
+OPENAI_CONTENT = re.compile(rb'"content":' + _STRING)
+ANTHROPIC_TEXT = re.compile(rb'"type":"text_delta","text":' + _STRING)
+
+
+class LineSplitter:
+    """Splits a byte stream into complete lines, keeping the partial tail."""
+
+    def __init__(self):
+        self.tail = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        if self.tail:
+            chunk = self.tail + chunk
+        lines = chunk.split(b"\n")
+        self.tail = lines.pop()
+        return lines
+
+    def flush(self) -> List[bytes]:
+        tail, self.tail = self.tail, b""
+        return [tail] if tail else []
+
+
+class SSEParser:
+    """
+    Incremental text/event-stream parser. feed() returns the data payloads of
+    all events completed by the chunk. Event names, ids and comments are
+    ignored since every provider repeats the event type inside the data.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+
+    @staticmethod
+    def _event_data(event: bytes) -> Optional[bytes]:
+        # Fast path: an event that is a single "data:" line
+        if event.startswith(b"data:") and b"\n" not in event:
+            data = event[5:]
+            return data[1:] if data.startswith(b" ") else data
+        data = []
+        for line in event.split(b"\n"):
+            if line.startswith(b"data:"):
+                value = line[5:]
+                data.append(value[1:] if value.startswith(b" ") else value)
+        return b"\n".join(data) if data else None
+
+    def _parse(self, events: List[bytes]) -> List[bytes]:
+        payloads = []
+        for event in events:
+            data = self._event_data(event)
+            if data is not None:
+                payloads.append(data)
+        return payloads
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        buffer = self.buffer + chunk if self.buffer else chunk
+        if b"\r" in buffer:
+            # CRLF streams; a \r split from its \n stays in the buffer until the next chunk
+            buffer = buffer.replace(b"\r\n", b"\n")
+        events = buffer.split(b"\n\n")
+        self.buffer = events.pop()
+        return self._parse(events)
+
+    def flush(self) -> List[bytes]:
+        """Return a final event that was not terminated by a blank line."""
+        buffer, self.buffer = self.buffer.replace(b"\r\n", b"\n").strip(b"\n"), b""
+        return self._parse([buffer]) if buffer else []
+
+
+class NDJSONParser:
+    """Incremental newline-delimited JSON parser, feed() returns the raw lines."""
+
+    def __init__(self):
+        self.lines = LineSplitter()
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        return [line for line in self.lines.feed(chunk) if line.strip()]
+
+    def flush(self) -> List[bytes]:
+        return [line for line in self.lines.flush() if line.strip()]
+
+
+class iter_batches:
+    """
+    Async iterator over the payloads completed by each chunk, then any
+    unterminated rest. A plain class rather than an async generator so that
+    returning early from a parser leaves nothing for the event loop to finalize.
+    """
+
+    def __init__(self, parser, chunks: AsyncIterator[bytes]):
+        self.parser = parser
+        self.chunks = chunks.__aiter__()
+        self.flushed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> List[bytes]:
+        while not self.flushed:
+            try:
+                chunk = await self.chunks.__anext__()
+            except StopAsyncIteration:
+                self.flushed = True
+                payloads = self.parser.flush()
+            else:
+                payloads = self.parser.feed(chunk)
+            if payloads:
+                return payloads
+        raise StopAsyncIteration
+
+
+def extract(pattern: re.Pattern, payload: bytes) -> Optional[str]:
+    """
+    Pull a single string field out of a payload without decoding the rest of
+    it. Returns None when the field is not present in the expected form, so
+    the caller can fall back to a full decode.
+    """
+    match = pattern.search(payload)
+    if match is None:
+        return None
+    value = match.group(1)
+    if b"\\" in value:
+        return json_loads(b'"' + value + b'"')
+    return value.decode("utf-8")
+
+
+def decode(payload: bytes) -> Optional[dict]:
+    try:
+        return json_loads(payload)
+    except JSON_DECODE_ERRORS as json_error:
+        logger.error(f"Error parsing JSON: {json_error}")
+        logger.error(f"Problematic data: {payload[:200]!r}")
+        return None
+
+
+async def iter_openai_deltas(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Delta text of an OpenAI-compatible chat completion stream (also LM Studio)."""
+    async for payloads in iter_batches(SSEParser(), chunks):
+        for payload in payloads:
+            if payload == b"[DONE]":
+                return
+            content = extract(OPENAI_CONTENT, payload)
+            if content is not None:
+                if content:
+                    yield content
+                continue
+            # Role, finish and usage chunks carry no content string
+            event = decode(payload)
+            if not event or not event.get("choices"):
+                continue
+            content = event["choices"][0].get("delta", {}).get("content")
+            if content:
+                yield content
+
+
+async def iter_anthropic_deltas(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Delta text of an Anthropic messages stream."""
+    async for payloads in iter_batches(SSEParser(), chunks):
+        for payload in payloads:
+            # ping, message_start, content_block_start/stop carry no text
+            if b'"content_block_delta"' not in payload and b'"message_' not in payload:
+                continue
+            text = extract(ANTHROPIC_TEXT, payload)
+            if text is not None:
+                if text:
+                    yield text
+                continue
+            event = decode(payload)
+            if not event:
+                continue
+            event_type = event.get("type")
+            if event_type == "content_block_delta":
+                text = event.get("delta", {}).get("text")
+                if text:
+                    yield text
+            elif event_type == "message_delta":
+                stop_reason = event.get("delta", {}).get("stop_reason")
+                if stop_reason:
+                    logger.info(f"Message stopped. Reason: {stop_reason}")
+            elif event_type == "message_stop":
+                return
+
+
+async def iter_ollama_deltas(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Delta text of an Ollama /api/chat NDJSON stream."""
+    async for lines in iter_batches(NDJSONParser(), chunks):
+        for line in lines:
+            if b'"done":false' in line:
+                content = extract(OPENAI_CONTENT, line)
+                if content is not None:
+                    if content:
+                        yield content
+                    continue
+            event = decode(line)
+            if not event:
+                continue
+            content = event.get("message", {}).get("content")
+            if content:
+                yield content
+            if event.get("done"):
+                return
@@ -0,0 +1,127 @@
+"""
+Audio framing of STT connections.
+
+A client starts its session with one text message, the handshake
+
+    {"type": "start", "sampleRate": 16000, "format": "s16le", "channels": 1, "codec": "pcm"}
+
+and the server answers {"type": "started", ...} with the accepted
+settings, or an error. After that every binary message is audio only:
+raw samples in the negotiated format for "pcm", one Opus packet for
+"opus". Clients that skip the handshake send the older framing, a u32 LE
+metadata length, JSON metadata {"sampleRate"} and PCM16 samples in every
+message; it is still accepted.
+"""
+import json
+
+import numpy as np
+
+from resampling import StreamingResampler
+
+FORMATS = ("s16le", "f32le")
+CODECS = ("pcm", "opus")
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_MAX_FRAME = 0.12  # seconds, the longest frame an Opus packet holds
+MAX_SAMPLE_RATE = 384000  # the resampler's filter grows with the rate
+
+
+def field(handshake: dict, name: str, default):
+    """A handshake field, with null treated as missing."""
+    value = handshake.get(name)
+    return default if value is None else value
+
+
+def sample_rate_of(value) -> int:
+    try:
+        sample_rate = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid sample rate {value!r}")
+    if not 0 < sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"Invalid sample rate {sample_rate}")
+    return sample_rate
+
+
+class OpusDecoder:
+    """Decodes the Opus packets of one stream straight to PCM16 at `sample_rate`."""
+
+    def __init__(self, sample_rate: int):
+        try:
+            import opuslib
+        except ImportError:
+            raise ValueError("Opus audio needs the opuslib package and libopus on the server (pip install opuslib)")
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+        self.error = opuslib.OpusError
+        self.max_frame = int(OPUS_MAX_FRAME * sample_rate)
+
+    def decode(self, packet) -> bytes:
+        try:
+            return self.decoder.decode(bytes(packet), self.max_frame)
+        except self.error as e:
+            raise ValueError(f"Invalid Opus packet: {e}")
+
+
+class AudioStream:
+    """
+    Turns the binary messages of one connection into PCM16 audio at
+    `target_rate` (bytes-like). Raises ValueError for a handshake it
+    cannot accept and for a message it cannot decode.
+    """
+
+    def __init__(self, target_rate: int):
+        self.target_rate = target_rate
+        self.settings = None  # set by the handshake
+        self.resampler = None
+        self.decoder = None
+
+    def start(self, handshake: dict) -> dict:
+        """Accept the handshake and return the settings the stream uses."""
+        if self.settings is not None:
+            raise ValueError("The session was already started")
+        sample_rate = sample_rate_of(field(handshake, "sampleRate", self.target_rate))
+        sample_format = field(handshake, "format", "s16le")
+        channels = field(handshake, "channels", 1)
+        codec = field(handshake, "codec", "pcm")
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec {codec!r}, use one of {', '.join(CODECS)}")
+        if sample_format not in FORMATS:
+            raise ValueError(f"Unsupported sample format {sample_format!r}, use one of {', '.join(FORMATS)}")
+        if channels != 1 or isinstance(channels, bool):
+            raise ValueError("Only mono audio is supported")
+        if codec == "opus":
+            if sample_rate not in OPUS_RATES:
+                raise ValueError(f"Opus needs one of the sample rates {', '.join(map(str, OPUS_RATES))}")
+            # Opus decodes to any of its rates, whatever the encoder ran at
+            self.decoder = OpusDecoder(self.target_rate)
+            sample_format = "s16le"
+        else:
+            self.resampler = StreamingResampler(sample_rate, self.target_rate)
+        self.settings = {"sampleRate": sample_rate, "format": sample_format, "channels": channels, "codec": codec}
+        return self.settings
+
+    def decode(self, message):
+        if self.settings is None:
+            return self.decode_framed(message)
+        if self.decoder is not None:
+            return self.decoder.decode(message)
+        if len(message) % (4 if self.settings["format"] == "f32le" else 2):
+            raise ValueError(f"Audio message of {len(message)} bytes holds no whole number of samples")
+        if self.settings["format"] == "f32le":
+            samples = np.frombuffer(message, dtype=np.float32)
+            message = np.clip(np.rint(samples * 32768.0), -32768, 32767).astype(np.int16)
+        # At the target rate the message goes on as it is
+        return self.resampler.process(message)
+
+    def decode_framed(self, message):
+        """A message of the framing without handshake: metadata length, metadata, PCM16."""
+        metadata_length = int.from_bytes(message[:4], byteorder='little')
+        try:
+            metadata = json.loads(message[4:4+metadata_length].decode('utf-8'))
+            sample_rate = sample_rate_of(metadata['sampleRate'])
+        except (TypeError, KeyError, ValueError):
+            raise ValueError("Audio message without a handshake needs a length, JSON metadata with sampleRate and PCM16 audio")
+        audio = memoryview(message)[4+metadata_length:]
+        if len(audio) % 2:
+            raise ValueError(f"Audio message of {len(audio)} bytes holds no whole number of samples")
+        if self.resampler is None or self.resampler.original_rate != sample_rate:
+            self.resampler = StreamingResampler(sample_rate, self.target_rate)
+        return self.resampler.process(audio)
@@ -0,0 +1,80 @@
+"""
+Batched transcription across the STT server's sessions.
+
+Each session asks for its transcriptions on its own, so with several
+people talking the shared Whisper model gets one call per utterance.
+TranscriptionScheduler collects the requests of all sessions for a short
+window and hands them to the model as one batch: the encoder and the
+decoder then run once for the whole batch, which costs far less than one
+run per request.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionScheduler:
+    """
+    Batches transcription requests per model. A request waits at most
+    `window` seconds for others to join it, and a batch holds at most
+    `batch_size` requests. Final and realtime transcriptions use
+    different models, so each has its own queue and worker thread.
+
+    transcribe() blocks the calling session thread until its result is
+    ready, like a direct model call does.
+    """
+
+    def __init__(self, models, batch_size: int = 8, window: float = 0.02):
+        self.models = models
+        self.batch_size = max(1, batch_size)
+        self.window = window
+        self.queues = {False: queue.Queue(), True: queue.Queue()}
+        self.stats = {"requests": 0, "batches": 0, "largest_batch": 0}
+        self.threads = [
+            threading.Thread(target=self.run, args=(realtime,), name=f"stt-batch-{'realtime' if realtime else 'final'}", daemon=True)
+            for realtime in (False, True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def transcribe(self, audio, realtime: bool = False) -> str:
+        future = Future()
+        self.queues[realtime].put((audio, future))
+        return future.result()
+
+    def collect(self, requests: queue.Queue) -> List:
+        """The next batch: the first request, and the ones arriving within the window after it."""
+        batch = [requests.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, realtime: bool):
+        requests = self.queues[realtime]
+        while True:
+            batch = self.collect(requests)
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            try:
+                if len(batch) == 1:
+                    texts = [self.models.transcribe_one(batch[0][0], realtime)]
+                else:
+                    texts = self.models.transcribe_batch([audio for audio, _ in batch], realtime)
+            except Exception as e:
+                logger.exception(f"Batch of {len(batch)} transcriptions failed")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
@@ -0,0 +1,121 @@
+"""
+Utterances per second of the STT server's shared Whisper model with and
+without batching, by number of sessions transcribing at the same time.
+
+Every session is a thread that transcribes the same utterance
+`--utterances` times in a row, like a session thread of stt_server does
+with its final transcriptions. Without batching each call runs on its
+own (--workers of them in parallel), with batching the calls of all
+sessions go through batching.TranscriptionScheduler. Runs on the CPU by
+default; the model is loaded once:
+
+    python stt-cli/benchmarks/bench_batching.py --model base --sessions 1,2,4,8 --audio utterance.wav
+
+--audio takes a 16 kHz mono PCM16 WAV file of one utterance (up to 30 s).
+Without it, 3 s of a synthetic vowel-like signal are used. Whisper
+produces little text for that, so the decoder costs less than with speech.
+
+Before timing, the texts of a batch (the utterance, its first half and
+silence) are compared with the texts of transcribing each on its own; the
+benchmark fails when they differ. Utterances that need the temperature
+fallback are sampled and can differ between any two runs.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+
+STT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, STT_DIR)
+
+import batching
+import stt_server
+
+
+def load_audio(path):
+    if path is None:
+        t = np.arange(3 * stt_server.SAMPLE_RATE) / stt_server.SAMPLE_RATE
+        voice = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((140, 280, 720, 1100)))
+        return (0.2 * voice * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))).astype(np.float32)
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != stt_server.SAMPLE_RATE or f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise SystemExit(f"{path} must be 16 kHz mono PCM16")
+        return stt_server.to_float(np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16))
+
+
+def check_equivalence(models, audio):
+    """Texts of batched and unbatched transcription of the same utterances."""
+    audios = [audio, audio[:len(audio) // 2], np.zeros_like(audio)]
+    batched = models.transcribe_batch(audios)
+    return [{"seconds": round(len(utterance) / stt_server.SAMPLE_RATE, 2), "unbatched": models.transcribe_one(utterance),
+             "batched": text} for utterance, text in zip(audios, batched)]
+
+
+def run_sessions(models, audio, sessions, utterances):
+    """Utterances per second of `sessions` threads transcribing at the same time."""
+    start = threading.Barrier(sessions + 1)
+
+    def session():
+        start.wait()
+        for _ in range(utterances):
+            models.transcribe(audio)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return round(sessions * utterances / (time.perf_counter() - started), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STT utterances/s with and without batched decoding")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma separated session counts")
+    parser.add_argument("--utterances", type=int, default=4, help="Transcriptions per session")
+    parser.add_argument("--audio", help="16 kHz mono PCM16 WAV of one utterance")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args, server_argv = parser.parse_known_args()
+    server_args = stt_server.parse_arguments(
+        ["--device", "cpu", "--compute-type", "int8", "--model", "base", "--realtime-model", "",
+         "--silero-sensitivity", "0", "--batch-size", "1"] + server_argv)
+    session_counts = [int(count) for count in args.sessions.split(",")]
+    server_args.max_sessions = max(session_counts)
+
+    audio = load_audio(args.audio)
+    models = stt_server.SharedModels(server_args)
+    if not models.batching_supported:
+        raise SystemExit(f"Batching needs faster-whisper {' or '.join(stt_server.BATCHING_VERSIONS)}")
+    models.transcribe(audio)  # warm up
+    equivalence = check_equivalence(models, audio)
+    for result in equivalence:
+        print(json.dumps(result), file=sys.stderr)
+    if any(result["batched"] != result["unbatched"] for result in equivalence):
+        raise SystemExit("Batched transcription differs from transcribing one by one")
+    scheduler = batching.TranscriptionScheduler(models, max(session_counts), 0.02)
+
+    report = {"model": server_args.model, "workers": server_args.workers, "audio_seconds": round(len(audio) / stt_server.SAMPLE_RATE, 2),
+              "equivalence": equivalence, "utterances_per_second": []}
+    for sessions in session_counts:
+        models.scheduler = None
+        unbatched = run_sessions(models, audio, sessions, args.utterances)
+        models.scheduler = scheduler
+        batched = run_sessions(models, audio, sessions, args.utterances)
+        report["utterances_per_second"].append({"sessions": sessions, "unbatched": unbatched, "batched": batched,
+                                                "speedup": round(batched / unbatched, 2)})
+        print(json.dumps(report["utterances_per_second"][-1]), file=sys.stderr)
+    report["batches"] = scheduler.stats
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+CPU cost and chunk boundary error of the STT server's resampling.
+
+Compares, per input rate, the former per-chunk FFT resampling
+(scipy.signal.resample on every websocket message) with the streaming
+polyphase resampler of resampling.py, on a synthetic voice-like signal
+sent in `--chunk` sample messages like stt_client does:
+
+    python stt-cli/benchmarks/bench_resampler.py --seconds 30 --rates 48000,44100,16000
+
+- "cpu_ms_per_audio_second": process time spent per second of audio.
+- "rms_error": RMS difference to resampling the whole recording at once
+  with scipy.signal.resample_poly, in int16 units.
+- "boundary_rms_error": the same over the 16 output samples around each
+  chunk boundary.
+- "samples_lost": output samples missing compared to the whole recording.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.signal import resample, resample_poly
+
+STT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, STT_DIR)
+
+from resampling import StreamingResampler
+
+TARGET_RATE = 16000
+
+
+def decode_and_resample(audio_data, original_sample_rate, target_sample_rate):
+    """The STT server's resampling before the streaming resampler."""
+    audio_np = np.frombuffer(audio_data, dtype=np.int16)
+    num_target_samples = int(len(audio_np) * target_sample_rate / original_sample_rate)
+    return resample(audio_np, num_target_samples).astype(np.int16).tobytes()
+
+
+def test_signal(rate, seconds, seed=0):
+    """Harmonics of a gliding pitch with a syllable-rate envelope and some noise, as int16."""
+    t = np.arange(int(rate * seconds)) / rate
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 30) if k * 160 < rate / 2)
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    noise = np.random.default_rng(seed).normal(0, 0.02, len(t))
+    return np.clip(6000 * voice * envelope + 32767 * noise, -32768, 32767).astype(np.int16)
+
+
+def errors(output, reference, boundaries):
+    length = min(len(output), len(reference))
+    difference = output[:length].astype(np.float64) - reference[:length]
+    near = np.unique(np.concatenate([np.arange(b - 8, b + 8) for b in boundaries]))
+    near = near[(near >= 0) & (near < length)]
+    return {
+        "rms_error": round(float(np.sqrt(np.mean(difference ** 2))), 2),
+        "boundary_rms_error": round(float(np.sqrt(np.mean(difference[near] ** 2))), 2),
+        "samples_lost": len(reference) - len(output),
+    }
+
+
+def measure(rate, seconds, chunk):
+    signal = test_signal(rate, seconds)
+    messages = [signal[i:i + chunk].tobytes() for i in range(0, len(signal), chunk)]
+    reference = np.rint(resample_poly(signal, TARGET_RATE, rate)).astype(np.int16)
+    boundaries = [round(i * TARGET_RATE / rate) for i in range(chunk, len(signal), chunk)]
+    report = {}
+
+    started = time.process_time()
+    fft = np.frombuffer(b"".join(decode_and_resample(m, rate, TARGET_RATE) for m in messages), dtype=np.int16)
+    fft_cpu = time.process_time() - started
+    # Its chunks are cut to whole samples, so its boundaries drift against the reference
+    fft_boundaries = np.cumsum([int(len(m) // 2 * TARGET_RATE / rate) for m in messages])[:-1]
+    report["fft_per_chunk"] = dict(cpu_ms_per_audio_second=round(fft_cpu * 1000 / seconds, 3), **errors(fft, reference, fft_boundaries))
+
+    resampler = StreamingResampler(rate, TARGET_RATE)
+    started = time.process_time()
+    streamed = np.concatenate([resampler.process(m) for m in messages])
+    streamed_cpu = time.process_time() - started
+    name = "passthrough" if resampler.passthrough else "streaming_polyphase"
+    report[name] = dict(cpu_ms_per_audio_second=round(streamed_cpu * 1000 / seconds, 3), **errors(streamed, reference, boundaries))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU cost and boundary error of STT input resampling")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Seconds of audio per rate")
+    parser.add_argument("--chunk", type=int, default=1024, help="Samples per websocket message")
+    parser.add_argument("--rates", default="48000,44100,16000", help="Comma separated input sample rates")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    report = {"chunk": args.chunk, "seconds": args.seconds,
+              "rates": {rate: measure(int(rate), args.seconds, args.chunk) for rate in args.rates.split(",")}}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
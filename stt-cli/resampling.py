@@ -0,0 +1,98 @@
+"""
+Streaming resampling of the PCM16 audio clients send to the STT server.
+
+StreamingResampler is a polyphase FIR resampler that carries its filter
+history from one chunk to the next, so a stream resampled chunk by chunk
+is the same as the whole recording resampled at once (it uses the filter
+of scipy.signal.resample_poly, and matches its output). Chunks already at
+the target rate are passed through without a copy.
+"""
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import firwin
+
+# Up to this upsampling factor (e.g. 1 for 48 kHz, 2 for 24 kHz and 8 kHz)
+# outputs are computed per phase on strided views; above it (160 for
+# 44.1 kHz) the windows are gathered for all outputs at once
+STRIDED_MAX_UP = 8
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(up: int, down: int):
+    """
+    The anti-aliasing filter of resample_poly for up/down, split into its
+    `up` phases of `taps` coefficients each, reversed so a phase applies to
+    a window of input samples in time order. Shared by all streams of a ratio.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+    taps = -(-len(h) // up)
+    h = np.concatenate([h, np.zeros(taps * up - len(h))])
+    phases = h.reshape(taps, up).T[:, ::-1].copy()
+    phases.flags.writeable = False
+    return phases, half_len
+
+
+class StreamingResampler:
+    """
+    Resamples a stream of int16 chunks from `original_rate` to
+    `target_rate`. Output sample m is the filter centred on input position
+    m * original_rate / target_rate, so each chunk's last few output samples
+    wait for the next chunk (half the filter, under 1 ms of audio).
+    """
+
+    def __init__(self, original_rate: int, target_rate: int):
+        self.original_rate = original_rate
+        self.target_rate = target_rate
+        divisor = gcd(original_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = original_rate // divisor
+        self.phases, self.delay = polyphase_filter(self.up, self.down)
+        self.taps = self.phases.shape[1]
+        # Input samples from global index self.start on; zeros before the stream
+        self.buffer = np.zeros(self.taps - 1, dtype=np.float64)
+        self.start = -(self.taps - 1)
+        self.received = 0
+        self.produced = 0
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == self.down
+
+    def process(self, chunk) -> np.ndarray:
+        """The int16 samples that the PCM16 chunk (any bytes-like) completes."""
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        if self.passthrough:
+            return samples
+        self.buffer = np.concatenate([self.buffer, samples])
+        self.received += len(samples)
+
+        # Outputs whose newest input sample, (m * down + delay) // up, has arrived
+        last = (self.received * self.up - 1 - self.delay) // self.down
+        outputs = np.arange(self.produced, last + 1)
+        if len(outputs) == 0:
+            return np.zeros(0, dtype=np.int16)
+        position = outputs * self.down + self.delay
+        rows = position // self.up - (self.taps - 1) - self.start
+        windows = sliding_window_view(self.buffer, self.taps)
+        if self.up <= STRIDED_MAX_UP:
+            # Every up-th output uses the same phase on a window `down`
+            # samples further: one product per phase on a strided view
+            result = np.empty(len(outputs))
+            for first in range(min(self.up, len(outputs))):
+                count = (len(outputs) - first + self.up - 1) // self.up
+                view = windows[rows[first]:rows[first] + (count - 1) * self.down + 1:self.down]
+                result[first::self.up] = view @ self.phases[position[first] % self.up]
+        else:
+            result = np.einsum("ij,ij->i", windows[rows], self.phases[position % self.up])
+        self.produced = last + 1
+
+        # Keep what the next output needs
+        keep_from = (self.produced * self.down + self.delay) // self.up - (self.taps - 1)
+        self.buffer = self.buffer[keep_from - self.start:]
+        self.start = keep_from
+        return np.clip(np.rint(result), -32768, 32767).astype(np.int16)
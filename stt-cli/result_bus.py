@@ -0,0 +1,94 @@
+"""
+Delivery of transcription results from the STT server's session threads
+to the websockets, which belong to the server's event loop.
+
+Session threads publish into a bounded outbox per session; the first
+message of an empty outbox wakes the event loop once with
+call_soon_threadsafe, and a task on the loop sends what has collected to
+the session's subscribers, in order. A realtime update that is still
+waiting when a newer one arrives is stale and dropped, so a slow client
+gets the latest partial text instead of a backlog.
+"""
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+Subscriber = Callable[[str], Awaitable[None]]
+
+
+class Outbox:
+    def __init__(self):
+        self.messages = deque()
+        self.subscribers: List[Subscriber] = []
+        self.scheduled = False  # the loop was woken and will send the messages
+
+
+class ResultBus:
+    """
+    Thread-safe fan-out of session results. publish() may be called from
+    any thread; subscribe(), unsubscribe() and the sending run on `loop`.
+    An outbox holds at most `limit` messages, beyond that the oldest one
+    is dropped.
+    """
+
+    def __init__(self, loop, limit: int = 32):
+        self.loop = loop
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.outboxes: Dict[Any, Outbox] = {}
+        self.stats = {"published": 0, "sent": 0, "stale": 0, "overflow": 0, "wakeups": 0}
+
+    def subscribe(self, session_id, send: Subscriber):
+        with self.lock:
+            outbox = self.outboxes.setdefault(session_id, Outbox())
+            outbox.subscribers.append(send)
+
+    def unsubscribe(self, session_id):
+        with self.lock:
+            self.outboxes.pop(session_id, None)
+
+    def publish(self, session_id, message_type: str, text: str):
+        message = {'type': message_type, 'text': text}
+        with self.lock:
+            outbox = self.outboxes.get(session_id)
+            if outbox is None:
+                return
+            self.stats["published"] += 1
+            if message_type == 'realtime':
+                waiting = len(outbox.messages)
+                outbox.messages = deque(m for m in outbox.messages if m['type'] != 'realtime')
+                self.stats["stale"] += waiting - len(outbox.messages)
+            if len(outbox.messages) >= self.limit:
+                outbox.messages.popleft()
+                self.stats["overflow"] += 1
+            outbox.messages.append(message)
+            if outbox.scheduled:
+                return
+            outbox.scheduled = True
+            self.stats["wakeups"] += 1
+        self.loop.call_soon_threadsafe(self._start_sending, outbox)
+
+    def _start_sending(self, outbox: Outbox):
+        self.loop.create_task(self._send(outbox))
+
+    async def _send(self, outbox: Outbox):
+        while True:
+            with self.lock:
+                if not outbox.messages:
+                    outbox.scheduled = False
+                    return
+                message = outbox.messages.popleft()
+                subscribers = list(outbox.subscribers)
+            data = json.dumps(message)
+            for send in subscribers:
+                try:
+                    await send(data)
+                except Exception:
+                    logger.exception("Sending a result failed")
+            # The session threads update the stats too
+            with self.lock:
+                self.stats["sent"] += 1
@@ -1,6 +1,5 @@
 import websocket
 import pyaudio
-import argparse
 import json
 import threading
 import time
@@ -8,21 +7,23 @@ import struct
 import os
 import sys
 import socket
-import subprocess
 import shutil
 from urllib.parse import urlparse
 from colorama import init, Fore, Style
 from queue import Queue
 
+from stt_entry import parse_arguments
+
 # Constants
 CHUNK = 1024
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
 RATE = 16000
-DEFAULT_SERVER_URL = "ws://localhost:8011"
+OPUS_FRAME = 960  # 60 ms, a frame length Opus accepts
+HANDSHAKE_TIMEOUT = 2  # seconds; servers without the handshake never answer it
 
 class STTWebSocketClient:
-    def __init__(self, server_url, debug=False, file_output=None, norealtime=False):
+    def __init__(self, server_url, debug=False, file_output=None, norealtime=False, codec="pcm", opus_bitrate=24000):
         self.server_url = server_url
         self.ws = None
         self.is_running = False
@@ -34,6 +35,10 @@ class STTWebSocketClient:
         self.recording_indicator = "🔴"
         self.norealtime = norealtime
         self.connection_established = threading.Event()
+        self.codec = codec
+        self.opus_bitrate = opus_bitrate
+        self.started = threading.Event()  # the server accepted the handshake
+        self.legacy = False  # the server is from before the handshake
         self.message_queue = Queue()
 
     def debug_print(self, message):
@@ -88,13 +93,28 @@ class STTWebSocketClient:
         self.debug_print("WebSocket connection opened.")
         self.is_running = True
         self.connection_established.set()
-        self.start_recording()
+        if not self.legacy:
+            handshake = {"type": "start", "sampleRate": RATE, "format": "s16le", "channels": CHANNELS, "codec": self.codec}
+            ws.send(json.dumps(handshake))
+        self.start_recording(ws)
 
     def on_error(self, ws, error):
         self.debug_print(f"WebSocket error: {error}")
 
     def on_close(self, ws, close_status_code, close_msg):
         self.debug_print(f"WebSocket connection closed: {close_status_code} - {close_msg}")
+        if ws is not self.ws:
+            return
+        if self.is_running and not self.started.is_set() and not self.legacy:
+            # A server from before the handshake fails on it and drops the connection
+            if self.codec == "pcm":
+                self.debug_print("Server closed the connection on the handshake, reconnecting without it.")
+                self.legacy = True
+                self.connection_established.clear()
+                if self.connect():
+                    return
+            else:
+                print(f"The STT server does not support --codec {self.codec}.", file=sys.stderr)
         self.is_running = False
 
     def is_server_running(self):
@@ -109,6 +129,7 @@ class STTWebSocketClient:
         return response == 'y' or response == 'yes'
 
     def start_server(self):
+        import subprocess
         if os.name == 'nt':  # Windows
             subprocess.Popen('start /min cmd /c stt-server', shell=True)
         else:  # Unix-like systems
@@ -155,6 +176,12 @@ class STTWebSocketClient:
                     self.finish_progress_bar()
                     print(f"{data['text']}")
                 self.stop()
+            elif data['type'] == 'started':
+                self.debug_print(f"Session started: {data}")
+                self.started.set()
+            elif data['type'] == 'error':
+                print(f"Error: {data['text']}", file=sys.stderr)
+                self.stop()
         except json.JSONDecodeError:
             self.debug_print(f"\nReceived non-JSON message: {message}")
 
@@ -228,36 +255,62 @@ class STTWebSocketClient:
             except json.JSONDecodeError:
                 self.debug_print(f"\nReceived non-JSON message: {message}")
 
-    def start_recording(self):
+    def start_recording(self, ws):
         self.show_initial_indicator()
-        threading.Thread(target=self.record_and_send_audio).start()
+        threading.Thread(target=self.record_and_send_audio, args=(ws,)).start()
 
-    def record_and_send_audio(self):
+    def make_encoder(self):
+        try:
+            import opuslib
+        except ImportError:
+            print("--codec opus needs the opuslib package and libopus (pip install opuslib)", file=sys.stderr)
+            return None
+        encoder = opuslib.Encoder(RATE, CHANNELS, opuslib.APPLICATION_VOIP)
+        encoder.bitrate = self.opus_bitrate
+        return encoder
+
+    def record_and_send_audio(self, ws):
+        encoder = None
+        framed = self.legacy
+        if not framed and not self.started.wait(timeout=HANDSHAKE_TIMEOUT):
+            if not self.is_running or self.ws is not ws:
+                return  # the server refused the handshake, or dropped it and we reconnected
+            if self.codec != "pcm":
+                print(f"The STT server does not support --codec {self.codec}.", file=sys.stderr)
+                self.stop()
+                return
+            # A server from before the handshake that skipped it: sample rate in every message
+            self.debug_print("No handshake answer, sending the sample rate with every message.")
+            framed = True
+        elif self.codec == "opus":
+            encoder = self.make_encoder()
+            if encoder is None:
+                self.stop()
+                return
+
+        chunk = OPUS_FRAME if encoder else CHUNK
         p = pyaudio.PyAudio()
         stream = p.open(format=FORMAT,
                         input_device_index=3,
                         channels=CHANNELS,
                         rate=RATE,
                         input=True,
-                        frames_per_buffer=CHUNK)
+                        frames_per_buffer=chunk)
 
         self.debug_print("Recording and sending audio...")
+        metadata_json = json.dumps({"sampleRate": RATE})
+        header = struct.pack('<I', len(metadata_json)) + metadata_json.encode('utf-8')
 
-        while self.is_running:
+        while self.is_running and self.ws is ws:
             try:
-                audio_data = stream.read(CHUNK)
-                
-                # Prepare metadata
-                metadata = {
-                    "sampleRate": RATE
-                }
-                metadata_json = json.dumps(metadata)
-                metadata_length = len(metadata_json)
-                
-                # Construct the message
-                message = struct.pack('<I', metadata_length) + metadata_json.encode('utf-8') + audio_data
-                
-                self.ws.send(message, opcode=websocket.ABNF.OPCODE_BINARY)
+                audio_data = stream.read(chunk)
+                if encoder:
+                    message = encoder.encode(audio_data, chunk)
+                elif framed:
+                    message = header + audio_data
+                else:
+                    message = audio_data
+                ws.send(message, opcode=websocket.ABNF.OPCODE_BINARY)
             except Exception as e:
                 self.debug_print(f"\nError sending audio data: {e}")
                 break
@@ -267,12 +320,9 @@ class STTWebSocketClient:
         stream.close()
         p.terminate()
 
-def main():
-    parser = argparse.ArgumentParser(description="STT Client")
-    parser.add_argument("--server", default=DEFAULT_SERVER_URL, help="STT WebSocket server URL")
-    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
-    parser.add_argument("-nort", "--norealtime", action="store_true", help="Disable real-time output")    
-    args = parser.parse_args()
+def main(args=None):
+    if args is None:
+        args = parse_arguments()
 
     # Check if output is being redirected
     if not os.isatty(sys.stdout.fileno()):
@@ -280,7 +330,7 @@ def main():
     else:
         file_output = None
     
-    client = STTWebSocketClient(args.server, args.debug, file_output, args.norealtime)
+    client = STTWebSocketClient(args.server, args.debug, file_output, args.norealtime, args.codec, args.opus_bitrate)
   
     def signal_handler(sig, frame):
         # print("\nInterrupted by user, shutting down...")
@@ -0,0 +1,36 @@
+"""
+Entry point of the `stt` command. cli_entry.run (cli-common) hands
+the invocation to a running cli-agent (see agent-cli) before stt_client
+and its dependencies are imported, and runs stt_client directly when
+there is none. Arguments are parsed here, after the handoff: without an
+agent, --help and usage errors exit before pyaudio, websocket-client or colorama are
+imported; with one, they first cost a round trip to the agent, which
+answers them with a fallback.
+"""
+import argparse
+import os
+
+TOOL = "stt"
+DEFAULT_SERVER_URL = "ws://localhost:8011"
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="STT Client")
+    parser.add_argument("--server", default=DEFAULT_SERVER_URL, help="STT WebSocket server URL")
+    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument("-nort", "--norealtime", action="store_true", help="Disable real-time output")    
+    parser.add_argument("--codec", choices=["pcm", "opus"], default="pcm", help="Audio sent to the server: raw PCM16 or Opus (needs opuslib)")
+    parser.add_argument("--opus-bitrate", type=int, default=24000, help="Opus bitrate in bit/s")
+    parser.add_argument("--profile-startup", action="store_true", help="Print an import-time breakdown of this invocation to stderr")
+    return parser.parse_args(argv)
+
+
+def main():
+    # Here, so the clients can import parse_arguments without cli-common
+    import cli_entry
+
+    cli_entry.run(TOOL, os.path.dirname(os.path.abspath(__file__)), parse_arguments, "stt_client")
+
+
+if __name__ == "__main__":
+    main()
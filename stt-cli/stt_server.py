@@ -1,115 +1,494 @@
-if __name__ == '__main__':
-    print("Starting server, please wait...")
+"""
+STT server. Clients start with a handshake of their audio settings and
+then stream raw PCM or Opus packets over a WebSocket (see audio_stream.py),
+and get {"type": "realtime", "text"} updates while they speak and
+{"type": "fullSentence", "text"} once they paused.
+
+Every connection is a session of its own, with its own voice activity
+detection, recording and results, so several people can use one server.
+The Whisper models and the Silero VAD model are loaded once and shared
+by all sessions; --max-sessions limits how many run at the same time.
+Transcriptions that sessions request at about the same time are decoded
+as one batch (see batching.py).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+import websockets
+
+import batching
+from audio_stream import AudioStream
+from result_bus import ResultBus
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+VAD_FRAME = 480  # 30 ms, one of the frame lengths webrtcvad accepts
+SILERO_WINDOW = 512  # samples per Silero call at 16 kHz
+SILERO_CONTEXT = 0.25  # seconds of audio Silero looks at to confirm speech
+STABLE_MATCH = 10  # characters that tie a new realtime text to the stable one
+# How WhisperModel.transcribe decodes. transcribe_batch reproduces it: the
+# first decoding at temperature 0 with the same options, then the same
+# thresholds to skip silence or to fall back to sampling
+TRANSCRIBE_OPTIONS = dict(
+    vad_filter=False, without_timestamps=True, temperature=[0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+    compression_ratio_threshold=2.4, log_prob_threshold=-1.0, no_speech_threshold=0.6)
+MAX_INITIAL_TIMESTAMP = 1.0  # seconds, transcribe's default
+# transcribe_batch uses faster-whisper internals; these releases were checked
+# to give the same texts as transcribe_one (requirements.txt pins the last)
+BATCHING_VERSIONS = ("1.1.1", "1.2.1")
+
+
+class SharedModels:
+    """
+    The models all sessions use. faster-whisper runs up to `workers`
+    transcriptions in parallel on one loaded model, so sessions share it
+    without a lock; the Silero model keeps state between calls and is used
+    by one session at a time.
+    """
+
+    def __init__(self, args):
+        import faster_whisper
+
+        logger.info(f"Loading Whisper model {args.model}")
+        self.model = faster_whisper.WhisperModel(
+            args.model, device=args.device, compute_type=args.compute_type, num_workers=args.workers)
+        if args.realtime_model and args.realtime_model != args.model:
+            logger.info(f"Loading realtime Whisper model {args.realtime_model}")
+            self.realtime_model = faster_whisper.WhisperModel(
+                args.realtime_model, device=args.device, compute_type=args.compute_type, num_workers=args.workers)
+        else:
+            self.realtime_model = self.model
+        self.language = args.language or None
+        self.beam_size = args.beam_size
+        self.beam_size_realtime = args.beam_size_realtime
+        # Realtime transcriptions run here, so a session's VAD never waits for
+        # them; one thread per session, so they can all join one batch
+        self.executor = ThreadPoolExecutor(max_workers=args.max_sessions, thread_name_prefix="stt-realtime")
+        self.scheduler = None
+        self.batching_supported = faster_whisper.__version__ in BATCHING_VERSIONS
+        if args.batch_size > 1:
+            if self.batching_supported:
+                self.scheduler = batching.TranscriptionScheduler(self, args.batch_size, args.batch_window)
+            else:
+                logger.warning(f"Batching is not checked with faster-whisper {faster_whisper.__version__} "
+                               f"(only {', '.join(BATCHING_VERSIONS)}), transcribing one by one")
+
+        self.silero = None
+        self.silero_lock = threading.Lock()
+        if args.silero_sensitivity > 0:
+            import torch
+            self.torch = torch
+            self.silero, _ = torch.hub.load(repo_or_dir="snakers4/silero-vad", model="silero_vad", verbose=False)
+
+    def transcribe(self, audio: np.ndarray, realtime: bool = False) -> str:
+        """Text of float32 16 kHz audio, batched with other sessions' requests when batching is on."""
+        if self.scheduler is not None:
+            return self.scheduler.transcribe(audio, realtime)
+        return self.transcribe_one(audio, realtime)
+
+    def transcribe_one(self, audio: np.ndarray, realtime: bool = False) -> str:
+        model = self.realtime_model if realtime else self.model
+        segments, _ = model.transcribe(
+            audio, language=self.language, beam_size=self.beam_size_realtime if realtime else self.beam_size,
+            **TRANSCRIBE_OPTIONS)
+        return " ".join(segment.text.strip() for segment in segments).strip()
 
-    from RealtimeSTT import AudioToTextRecorder
-    import asyncio
-    import websockets
-    import threading
-    import numpy as np
-    from scipy.signal import resample
-    import json
-
-    recorder = None
-    recorder_ready = threading.Event()
-    client_websocket = None
-
-    async def send_to_client(message):
-        if client_websocket:
-            await client_websocket.send(message)
-
-    def text_detected(text):
-        asyncio.new_event_loop().run_until_complete(
-            send_to_client(
-                json.dumps({
-                    'type': 'realtime',
-                    'text': text
-                })
-            )
+    def transcribe_batch(self, audios: List[np.ndarray], realtime: bool = False) -> List[str]:
+        """
+        Texts of several utterances, the same texts transcribe_one gives.
+        If faster-whisper's internals are not what decode_batch expects,
+        batching is turned off and the utterances are transcribed one by one.
+        """
+        if self.batching_supported:
+            try:
+                return self.decode_batch(audios, realtime)
+            except (ImportError, AttributeError, TypeError):
+                logger.exception("faster-whisper does not support batched decoding, transcribing one by one")
+                self.batching_supported = False
+                self.scheduler = None
+        return [self.transcribe_one(audio, realtime) for audio in audios]
+
+    def decode_batch(self, audios: List[np.ndarray], realtime: bool = False) -> List[str]:
+        """
+        Texts of several utterances with one encoder and one decoder run.
+        Utterances longer than Whisper's 30 s window need its seeking, and
+        utterances whose first decoding misses the thresholds need its
+        temperature fallback; both are transcribed by transcribe_one.
+        """
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_compression_ratio, get_suppressed_tokens
+
+        model = self.realtime_model if realtime else self.model
+        extractor = model.feature_extractor
+        texts = [None] * len(audios)
+        batch = []
+        segments = []
+        for index, audio in enumerate(audios):
+            # Cut like transcribe does, the extractor pads the audio by a frame
+            features = extractor(audio)
+            content_frames = features.shape[-1] - 1
+            if content_frames > extractor.nb_max_frames:
+                texts[index] = self.transcribe_one(audio, realtime)
+            else:
+                batch.append(index)
+                segments.append((features, pad_or_trim(features[:, :content_frames])))
+        if not batch:
+            return texts
+
+        if not model.model.is_multilingual:
+            languages = ["en"] * len(batch)
+        elif self.language:
+            languages = [self.language] * len(batch)
+        else:
+            languages = [model.detect_language(features=features)[0] for features, _ in segments]
+        encoder_output = model.encode(np.stack([segment for _, segment in segments]))
+        tokenizers = [Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+                      for language in languages]
+        results = model.model.generate(
+            encoder_output,
+            [model.get_prompt(tokenizer, [], without_timestamps=True) for tokenizer in tokenizers],
+            beam_size=self.beam_size_realtime if realtime else self.beam_size,
+            patience=1,
+            length_penalty=1,
+            repetition_penalty=1,
+            no_repeat_ngram_size=0,
+            max_length=model.max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=get_suppressed_tokens(tokenizers[0], [-1]),
+            max_initial_timestamp_index=int(round(MAX_INITIAL_TIMESTAMP / model.time_precision)),
         )
-        print(f"\r{text}", flush=True, end='')
-
-    recorder_config = {
-        'spinner': False,
-        'use_microphone': False,
-        'model': 'large-v2',
-        'silero_sensitivity': 0.4,
-        'silero_deactivity_detection': True,
-        'webrtc_sensitivity': 3,
-        'post_speech_silence_duration': 0.25,
-        'min_length_of_recording': 0,
-        'min_gap_between_recordings': 0,
-        'enable_realtime_transcription': True,
-        'realtime_processing_pause': 0,
-        'realtime_model_type': 'medium',
-        'on_realtime_transcription_stabilized': text_detected,
-    }
-
-    def _recorder_thread():
-        global recorder
-        print("Initializing RealtimeSTT...")
-        recorder = AudioToTextRecorder(**recorder_config)
-        print("RealtimeSTT initialized")
-        recorder_ready.set()
+        log_prob_threshold = TRANSCRIBE_OPTIONS["log_prob_threshold"]
+        for index, tokenizer, result in zip(batch, tokenizers, results):
+            tokens = result.sequences_ids[0]
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            text = tokenizer.decode(tokens).strip()
+            silence = result.no_speech_prob > TRANSCRIBE_OPTIONS["no_speech_threshold"]
+            missed = get_compression_ratio(text) > TRANSCRIBE_OPTIONS["compression_ratio_threshold"] or avg_logprob < log_prob_threshold
+            if missed and not (silence and avg_logprob < log_prob_threshold):
+                texts[index] = self.transcribe_one(audios[index], realtime)
+            elif silence and avg_logprob <= log_prob_threshold:
+                texts[index] = ""  # transcribe skips it
+            else:
+                texts[index] = text
+        return texts
+
+    def speech_probability(self, audio: np.ndarray) -> float:
+        """Highest Silero speech probability over the windows of float32 16 kHz audio."""
+        with self.silero_lock:
+            self.silero.reset_states()
+            probability = 0.0
+            for start in range(0, len(audio) - SILERO_WINDOW + 1, SILERO_WINDOW):
+                window = self.torch.from_numpy(audio[start:start + SILERO_WINDOW])
+                probability = max(probability, self.silero(window, SAMPLE_RATE).item())
+            return probability
+
+
+def to_float(samples: np.ndarray) -> np.ndarray:
+    return samples.astype(np.float32) / 32768.0
+
+
+def find_tail_match(stable: str, text: str) -> int:
+    """Position in `text` just after the last STABLE_MATCH characters of `stable`, -1 if they don't occur."""
+    if len(stable) < STABLE_MATCH or len(text) < STABLE_MATCH:
+        return -1
+    position = text.rfind(stable[-STABLE_MATCH:])
+    return -1 if position < 0 else position + STABLE_MATCH
+
+
+class RecorderSession:
+    """
+    Recording state of one connection, processed in the session's own
+    thread: webrtcvad (confirmed by Silero when enabled) starts a
+    recording, including the audio just before it, and post-speech silence
+    (heard by Silero with silero_deactivity_detection, else by webrtcvad)
+    ends it. No recording starts within min_gap_between_recordings of the
+    last one. While recording, transcriptions of the audio so far run on
+    the shared executor and come back through the audio queue, so the
+    session thread alone stabilizes them and sends them as "realtime"
+    updates; the final transcription is sent as "fullSentence".
+    Results go to `send(message_type, text)`, called from the session
+    thread.
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, models: SharedModels, args, send):
+        import webrtcvad
+
+        self.id = next(self.ids)
+        self.models = models
+        self.args = args
+        self.send = send
+        self.vad = webrtcvad.Vad(args.webrtc_sensitivity)
+        self.audio = queue.Queue()
+        self.pending = np.zeros(0, dtype=np.int16)  # samples short of a VAD frame
+        self.pre_recording = deque(maxlen=max(1, int(args.pre_recording_buffer * SAMPLE_RATE / VAD_FRAME)))
+        self.frames = []
+        self.recording = False
+        self.silent_frames = 0
+        self.gap_frames = 0  # frames left before a recording may start
+        self.utterance = 0
+        self.realtime_busy = False
+        self.last_realtime = 0.0
+        self.realtime_text = ""
+        self.realtime_texts = []  # realtime transcriptions of the current recording
+        self.stable_text = ""
+        self.thread = threading.Thread(target=self.run, name=f"stt-session-{self.id}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def feed_audio(self, chunk):
+        """Queue 16 kHz PCM16 audio (bytes-like), called from the server's event loop."""
+        self.audio.put(chunk)
+
+    def close(self):
+        self.audio.put(None)
+
+    def run(self):
         while True:
-            full_sentence = recorder.text()
-            asyncio.new_event_loop().run_until_complete(
-                send_to_client(
-                    json.dumps({
-                        'type': 'fullSentence',
-                        'text': full_sentence
-                    })
-                )
-            )
-            print(f"\rSentence: {full_sentence}")
-
-    def decode_and_resample(
-            audio_data,
-            original_sample_rate,
-            target_sample_rate):
-
-        # Decode 16-bit PCM data to numpy array
-        audio_np = np.frombuffer(audio_data, dtype=np.int16)
-
-        # Calculate the number of samples after resampling
-        num_original_samples = len(audio_np)
-        num_target_samples = int(num_original_samples * target_sample_rate /
-                                 original_sample_rate)
-
-        # Resample the audio
-        resampled_audio = resample(audio_np, num_target_samples)
-
-        return resampled_audio.astype(np.int16).tobytes()
-
-    async def echo(websocket, path):
-        print("Client connected")
-        global client_websocket
-        client_websocket = websocket
-        async for message in websocket:
-
-            if not recorder_ready.is_set():
-                print("Recorder not ready")
-                continue
-
-            metadata_length = int.from_bytes(message[:4], byteorder='little')
-            metadata_json = message[4:4+metadata_length].decode('utf-8')
-            metadata = json.loads(metadata_json)
-            sample_rate = metadata['sampleRate']
-            chunk = message[4+metadata_length:]
-            resampled_chunk = decode_and_resample(chunk, sample_rate, 16000)
-            recorder.feed_audio(resampled_chunk)
-
-
-    def main():            
-        # start_server = websockets.serve(echo, "0.0.0.0", 9001)
-        start_server = websockets.serve(echo, "localhost", 8011)
-
-        recorder_thread = threading.Thread(target=_recorder_thread)
-        recorder_thread.start()
-        recorder_ready.wait()
+            chunk = self.audio.get()
+            if chunk is None:
+                break
+            try:
+                if isinstance(chunk, tuple):
+                    self.realtime_result(*chunk)
+                else:
+                    self.process(chunk)
+            except Exception:
+                logger.exception(f"Session {self.id}: processing audio failed")
+
+    def process(self, chunk):
+        samples = np.concatenate([self.pending, np.frombuffer(chunk, dtype=np.int16)])
+        usable = len(samples) - len(samples) % VAD_FRAME
+        self.pending = samples[usable:]
+        for start in range(0, usable, VAD_FRAME):
+            self.process_frame(samples[start:start + VAD_FRAME])
+        if self.recording:
+            self.realtime_update()
+
+    def process_frame(self, frame: np.ndarray):
+        if not self.recording:
+            self.pre_recording.append(frame)
+            if self.gap_frames > 0:
+                self.gap_frames -= 1
+                return
+            if self.vad.is_speech(frame.tobytes(), SAMPLE_RATE) and self.confirm_speech():
+                self.recording = True
+                self.utterance += 1
+                self.frames = list(self.pre_recording)
+                self.pre_recording.clear()
+                self.silent_frames = 0
+                self.realtime_text = ""
+                self.realtime_texts = []
+                self.stable_text = ""
+            return
+
+        self.frames.append(frame)
+        if self.args.silero_deactivity_detection and self.models.silero is not None:
+            # Silero tells noise from speech where webrtcvad keeps a recording open
+            audio = to_float(np.concatenate(self.frames[-2:]))
+            speech = self.models.speech_probability(audio) > 1 - self.args.silero_sensitivity
+        else:
+            speech = self.vad.is_speech(frame.tobytes(), SAMPLE_RATE)
+        self.silent_frames = 0 if speech else self.silent_frames + 1
+        if self.silent_frames * VAD_FRAME >= self.args.post_speech_silence_duration * SAMPLE_RATE:
+            self.finish_recording()
+
+    def confirm_speech(self) -> bool:
+        if self.models.silero is None:
+            return True
+        context = int(SILERO_CONTEXT * SAMPLE_RATE / VAD_FRAME) + 1
+        audio = to_float(np.concatenate(list(self.pre_recording)[-context:]))
+        return self.models.speech_probability(audio) > 1 - self.args.silero_sensitivity
+
+    def finish_recording(self):
+        self.recording = False
+        self.gap_frames = int(self.args.min_gap_between_recordings * SAMPLE_RATE / VAD_FRAME)
+        audio = np.concatenate(self.frames)
+        self.frames = []
+        if len(audio) < self.args.min_length_of_recording * SAMPLE_RATE:
+            return
+        # In this thread, so the sentences of a session keep their order;
+        # audio arriving meanwhile waits in the queue
+        text = self.models.transcribe(to_float(audio))
+        if text:
+            self.send("fullSentence", text)
+
+    def realtime_update(self):
+        if not self.args.enable_realtime_transcription or self.realtime_busy:
+            return
+        now = time.monotonic()
+        if now - self.last_realtime < self.args.realtime_processing_pause:
+            return
+        self.realtime_busy = True
+        self.last_realtime = now
+        self.models.executor.submit(self.transcribe_realtime, self.utterance, to_float(np.concatenate(self.frames)))
+
+    def transcribe_realtime(self, utterance: int, audio: np.ndarray):
+        """Runs on the executor; the result goes back to the session thread through its queue."""
+        text = ""
+        try:
+            text = self.models.transcribe(audio, realtime=True)
+        except Exception:
+            logger.exception(f"Session {self.id}: realtime transcription failed")
+        finally:
+            self.audio.put((utterance, text))
+
+    def realtime_result(self, utterance: int, text: str):
+        self.realtime_busy = False
+        # Results of an utterance that ended meanwhile would come after its sentence
+        if not text or not self.recording or utterance != self.utterance:
+            return
+        text = self.stabilize(text)
+        if text != self.realtime_text:
+            self.realtime_text = text
+            self.send("realtime", text)
+
+    def stabilize(self, text: str) -> str:
+        """
+        Keep the start of the realtime text steady: the common start of the
+        last two transcriptions becomes stable, and later transcriptions only
+        change what follows it.
+        """
+        self.realtime_texts.append(text)
+        if len(self.realtime_texts) >= 2:
+            prefix = os.path.commonprefix(self.realtime_texts[-2:])
+            if len(prefix) >= len(self.stable_text):
+                self.stable_text = prefix
+        position = find_tail_match(self.stable_text, text)
+        if position < 0:
+            return self.stable_text or text
+        return self.stable_text + text[position:]
+
+
+class STTServer:
+    def __init__(self, models: SharedModels, args):
+        self.models = models
+        self.args = args
+        self.sessions = {}
+        self.bus = None  # created on the event loop, see serve()
 
+    def publish(self, session, message_type, text):
+        """Called from the session threads."""
+        if message_type == "fullSentence":
+            print(f"\r[{session.id}] Sentence: {text}")
+        self.bus.publish(session.id, message_type, text)
+
+    async def handle_client(self, websocket, path):
+        if len(self.sessions) >= self.args.max_sessions:
+            logger.warning(f"Rejected a client, all {self.args.max_sessions} sessions are in use")
+            await websocket.send(json.dumps({'type': 'error', 'text': f"Server is full ({self.args.max_sessions} sessions)"}))
+            await websocket.close(1013, "Server is full")
+            return
+
+        async def send(data):
+            try:
+                await websocket.send(data)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+        session = RecorderSession(self.models, self.args, lambda message_type, text: self.publish(session, message_type, text))
+        self.sessions[session.id] = session
+        self.bus.subscribe(session.id, send)
+        session.start()
+        print(f"Client connected, session {session.id} ({len(self.sessions)}/{self.args.max_sessions})")
+        stream = AudioStream(SAMPLE_RATE)
+        try:
+            async for message in websocket:
+                if isinstance(message, bytes):
+                    try:
+                        session.feed_audio(stream.decode(message))
+                    except (TypeError, ValueError, KeyError) as e:
+                        logger.warning(f"Session {session.id}: {e}")
+                        await send(json.dumps({'type': 'error', 'text': str(e)}))
+                        await websocket.close(1007, "Invalid audio")
+                        break
+                    continue
+                try:
+                    handshake = json.loads(message)
+                    if not isinstance(handshake, dict) or handshake.get('type') != 'start':
+                        continue
+                    settings = stream.start(handshake)
+                except ValueError as e:
+                    await send(json.dumps({'type': 'error', 'text': str(e)}))
+                    await websocket.close(1003, "Unsupported audio")
+                    break
+                logger.info(f"Session {session.id}: {settings['codec']} audio at {settings['sampleRate']} Hz")
+                await send(json.dumps({'type': 'started', **settings}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            session.close()
+            self.bus.unsubscribe(session.id)
+            del self.sessions[session.id]
+            print(f"Session {session.id} closed")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="STT server, one recording session per connection")
+    parser.add_argument("--host", default="localhost", help="Host to bind the server to")
+    parser.add_argument("--port", type=int, default=8011, help="Port for the WebSocket")
+    parser.add_argument("--max-sessions", type=int, default=4, help="Connections served at the same time")
+    parser.add_argument("--model", default="large-v2", help="Whisper model for the final transcription")
+    parser.add_argument("--realtime-model", default="medium", help="Whisper model for realtime updates")
+    parser.add_argument("--language", default="", help="Language code, empty to detect it")
+    parser.add_argument("--device", default="auto", help="Device for the Whisper models (cuda, cpu, auto)")
+    parser.add_argument("--compute-type", default="default", help="CTranslate2 compute type, e.g. float16 or int8")
+    parser.add_argument("--workers", type=int, default=2, help="Transcriptions the Whisper models run in parallel")
+    parser.add_argument("--batch-size", type=int, default=8, help="Transcriptions of different sessions decoded as one batch, 1 to disable batching")
+    parser.add_argument("--batch-window", type=float, default=0.02, help="Seconds a transcription waits for others to join its batch")
+    parser.add_argument("--beam-size", type=int, default=5, help="Beam size of the final transcription")
+    parser.add_argument("--beam-size-realtime", type=int, default=3, help="Beam size of realtime updates")
+    parser.add_argument("--silero-sensitivity", type=float, default=0.4, help="Silero VAD sensitivity, 0 to use webrtcvad alone")
+    parser.add_argument("--webrtc-sensitivity", type=int, default=3, choices=[0, 1, 2, 3], help="webrtcvad aggressiveness")
+    parser.add_argument("--post-speech-silence-duration", type=float, default=0.25, help="Seconds of silence that end a sentence")
+    parser.add_argument("--no-silero-deactivity-detection", dest="silero_deactivity_detection", action="store_false", help="End sentences by webrtcvad instead of Silero, faster but less robust to noise")
+    parser.add_argument("--min-length-of-recording", type=float, default=0.0, help="Shorter recordings are dropped (seconds)")
+    parser.add_argument("--min-gap-between-recordings", type=float, default=0.0, help="Seconds after a recording before the next one may start")
+    parser.add_argument("--pre-recording-buffer", type=float, default=1.0, help="Seconds of audio before the speech start that are transcribed too")
+    parser.add_argument("--no-realtime", dest="enable_realtime_transcription", action="store_false", help="Only send full sentences")
+    parser.add_argument("--realtime-processing-pause", type=float, default=0.0, help="Minimum seconds between realtime updates of a session")
+    parser.add_argument("--result-queue-size", type=int, default=32, help="Results waiting for a slow client before the oldest is dropped")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="Set the logging level")
+    return parser.parse_args(argv)
+
+
+async def serve(server: STTServer, args):
+    server.bus = ResultBus(asyncio.get_running_loop(), args.result_queue_size)
+    async with websockets.serve(server.handle_client, args.host, args.port, max_size=None):
         print("Server started. Press Ctrl+C to stop the server.")
-        asyncio.get_event_loop().run_until_complete(start_server)
-        asyncio.get_event_loop().run_forever()
+        await asyncio.Future()
 
-    main()
 
+def main():
+    args = parse_arguments()
+    logging.basicConfig(level=getattr(logging, args.log_level), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print("Starting server, please wait...")
+    models = SharedModels(args)
+    server = STTServer(models, args)
+    try:
+        asyncio.run(serve(server, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        models.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    main()
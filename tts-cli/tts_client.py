@@ -1,4 +1,3 @@
-import argparse
 import asyncio
 import sys
 import os
@@ -8,11 +7,10 @@ import pyaudio
 import json
 import logging
 import time
-import wave
 import io
-import numpy as np
 import socket
-import subprocess
+
+from tts_entry import parse_arguments
 
 
 class TTSClient:
@@ -73,6 +71,7 @@ class TTSClient:
         return response == 'y' or response == 'yes'
 
     def start_server(self):
+        import subprocess
         if os.name == 'nt':  # Windows
             subprocess.Popen('start /min cmd /c tts-server', shell=True)
         else:  # Unix-like systems
@@ -99,6 +98,7 @@ class TTSClient:
 
             # If file output is enabled, configure the WAV writer
             if self.file_output:
+                import wave
                 self.wav_writer = wave.open(self.wav_buffer, 'wb')
                 self.wav_writer.setnchannels(1)
                 self.wav_writer.setsampwidth(2)
@@ -175,6 +175,7 @@ class TTSClient:
             self.debug_print("Synthesis triggered, waiting for audio...")
 
     def float32_to_int16(self, float_audio):
+        import numpy as np
         float_audio = np.clip(float_audio, -1.0, 1.0)
         int16_audio = np.int16(float_audio * 32767)
         return int16_audio.tobytes()
@@ -197,6 +198,7 @@ class TTSClient:
                     self.stream.write(chunk)
                     if self.wav_writer:
                         if self.rvc:
+                            import numpy as np
                             chunk = self.float32_to_int16(
                                  np.frombuffer(chunk, dtype=np.float32))
 
@@ -375,16 +377,7 @@ class TTSClient:
         self.debug_print("TTS Client stopped")
 
 
-async def main_async():
-    parser = argparse.ArgumentParser(description="TTS Client")
-    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
-    parser.add_argument("--debugclean", action="store_true", help="Enable debug mode")
-    parser.add_argument("--control-server", default="ws://localhost:8000", help="Control WebSocket server URL")
-    parser.add_argument("--audio-server", default="ws://localhost:8001", help="Audio WebSocket server URL")
-    parser.add_argument("--rvc", action="store_true", help="Use RVC audio settings")    
-    parser.add_argument("input", nargs="*", help="Input text (optional)")
-    args = parser.parse_args()
-
+async def main_async(args):
     log_level = logging.DEBUG if args.debug else logging.INFO
     logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -458,13 +451,15 @@ async def main_async():
 
     logging.debug("Main async function completed")
 
-def main():
+def main(args=None):
+    if args is None:
+        args = parse_arguments()
     if sys.platform.startswith('win'):
         # On Windows, use ProactorEventLoop
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
     
     loop = asyncio.get_event_loop()
-    main_task = asyncio.ensure_future(main_async())
+    main_task = asyncio.ensure_future(main_async(args))
 
     def signal_handler(sig, frame):
         logging.info(f"Received exit signal {sig}, cancelling tasks...")
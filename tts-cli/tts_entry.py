@@ -0,0 +1,36 @@
+"""
+Entry point of the `tts` command. cli_entry.run (cli-common) hands
+the invocation to a running cli-agent (see agent-cli) before tts_client
+and its dependencies are imported, and runs tts_client directly when
+there is none. Arguments are parsed here, after the handoff: without an
+agent, --help and usage errors exit before asyncio, websockets, pyaudio or numpy are
+imported; with one, they first cost a round trip to the agent, which
+answers them with a fallback.
+"""
+import argparse
+import os
+
+TOOL = "tts"
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="TTS Client")
+    parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument("--debugclean", action="store_true", help="Enable debug mode")
+    parser.add_argument("--control-server", default="ws://localhost:8000", help="Control WebSocket server URL")
+    parser.add_argument("--audio-server", default="ws://localhost:8001", help="Audio WebSocket server URL")
+    parser.add_argument("--rvc", action="store_true", help="Use RVC audio settings")    
+    parser.add_argument("--profile-startup", action="store_true", help="Print an import-time breakdown of this invocation to stderr")
+    parser.add_argument("input", nargs="*", help="Input text (optional)")
+    return parser.parse_args(argv)
+
+
+def main():
+    # Here, so the clients can import parse_arguments without cli-common
+    import cli_entry
+
+    cli_entry.run(TOOL, os.path.dirname(os.path.abspath(__file__)), parse_arguments, "tts_client")
+
+
+if __name__ == "__main__":
+    main()
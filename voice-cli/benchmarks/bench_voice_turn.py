@@ -0,0 +1,238 @@
+"""
+Time to first audio of voice turns through voice_server.py.
+
+Runs the voice server against emulated STT and TTS servers and a real
+llm_server on the offline fake provider (llm-cli/benchmarks/fake_provider.py):
+
+- the fake STT server answers every utterance (a burst of audio frames)
+  with a "realtime" partial and, `--stt-final` seconds after its last
+  frame, the "fullSentence", like the STT server after the post-speech silence;
+- the fake TTS server sends the first audio chunk of a text fragment
+  `--tts-latency` seconds after it arrived and one chunk per further
+  `--chars-per-chunk` characters, and drops its queue on "cancel".
+
+Reports the per-stage latencies of the voice server's "latency" events as
+JSON, along with "whole_answer_first_audio_ms": the time to first audio if
+TTS only got the answer once the LLM finished. A last turn is interrupted
+after its first audio chunk to check that barge-in stops the audio:
+
+    python voice-cli/benchmarks/bench_voice_turn.py --turns 10 --ttft 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import struct
+import sys
+import time
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+VOICE_DIR = os.path.join(ROOT, "voice-cli")
+LLM_DIR = os.path.join(ROOT, "llm-cli")
+sys.path.insert(0, os.path.join(LLM_DIR, "benchmarks"))
+sys.path.insert(0, LLM_DIR)
+
+import fake_provider
+from load_test import free_port, wait_for_port
+
+UTTERANCE_FRAMES = 8
+AUDIO_CHUNK = b"\0" * 4096
+
+
+class FakeSTT:
+    def __init__(self, final_delay: float):
+        self.final_delay = final_delay
+        self.utterances = 0
+
+    async def handle(self, websocket, path):
+        frames = 0
+        final = None
+        async for message in websocket:
+            frames += 1
+            if frames == 1:
+                await websocket.send(json.dumps({"type": "realtime", "text": "what is"}))
+            if final is not None:
+                final.cancel()
+            if frames >= UTTERANCE_FRAMES:
+                frames = 0
+                final = asyncio.create_task(self.finish(websocket))
+
+    async def finish(self, websocket):
+        await websocket.send(json.dumps({"type": "realtime", "text": "what is quantum computing"}))
+        await asyncio.sleep(self.final_delay)
+        self.utterances += 1
+        await websocket.send(json.dumps({"type": "fullSentence", "text": "What is quantum computing?"}))
+
+
+class FakeTTS:
+    def __init__(self, latency: float, chars_per_chunk: int):
+        self.latency = latency
+        self.chars_per_chunk = chars_per_chunk
+        self.listeners = set()
+        self.synthesis = None
+        self.fragments = asyncio.Queue()
+
+    async def handle_control(self, websocket, path):
+        async for message in websocket:
+            data = json.loads(message)
+            if data["type"] == "text":
+                await websocket.send(json.dumps({"type": "text_received"}))
+                self.fragments.put_nowait(data["content"])
+                if self.synthesis is None or self.synthesis.done():
+                    self.synthesis = asyncio.create_task(self.synthesize())
+            elif data["type"] == "cancel":
+                if self.synthesis is not None:
+                    self.synthesis.cancel()
+                self.fragments = asyncio.Queue()
+            elif data["type"] == "synthesize":
+                await websocket.send(json.dumps({"type": "synthesize_received"}))
+
+    async def handle_audio(self, websocket, path):
+        self.listeners.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.listeners.discard(websocket)
+
+    async def synthesize(self):
+        while not self.fragments.empty():
+            fragment = self.fragments.get_nowait()
+            await asyncio.sleep(self.latency)
+            for _ in range(max(1, len(fragment) // self.chars_per_chunk)):
+                websockets.broadcast(self.listeners, AUDIO_CHUNK)
+                await asyncio.sleep(0.01)
+
+
+def summarize(samples):
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return None
+    return {"median": round(statistics.median(samples), 1), "max": round(max(samples), 1)}
+
+
+async def run_turn(websocket, frame, barge_in=False):
+    """One spoken turn; returns its latency event, or whether audio stopped after barge-in."""
+    for _ in range(UTTERANCE_FRAMES):
+        await websocket.send(frame)
+    latency = None
+    ended = False
+    while latency is None or not ended:
+        message = await asyncio.wait_for(websocket.recv(), 30)
+        if isinstance(message, bytes):
+            if barge_in:
+                await websocket.send(json.dumps({"type": "cancel"}))
+                return await audio_after_barge_in(websocket)
+            continue
+        event = json.loads(message)
+        if event["type"] == "latency":
+            latency = event
+        elif event["type"] == "turn_end":
+            ended = True
+        elif event["type"] == "error":
+            raise RuntimeError(event["error"])
+    return latency
+
+
+async def audio_after_barge_in(websocket):
+    """Audio chunks that still arrived later than 0.3s after the barge_in event."""
+    stopped_at = None
+    late_chunks = 0
+    deadline = time.monotonic() + 2.0
+    while time.monotonic() < deadline:
+        try:
+            message = await asyncio.wait_for(websocket.recv(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            break
+        if isinstance(message, bytes):
+            if stopped_at is not None and time.monotonic() - stopped_at > 0.3:
+                late_chunks += 1
+        elif json.loads(message)["type"] == "barge_in":
+            stopped_at = time.monotonic()
+    return {"barge_in_event": stopped_at is not None, "late_audio_chunks": late_chunks}
+
+
+async def main_async(args):
+    provider = fake_provider.from_arguments(args)
+    provider_port = free_port()
+    provider_server = await provider.start("localhost", provider_port)
+    stt = FakeSTT(args.stt_final)
+    tts = FakeTTS(args.tts_latency, args.chars_per_chunk)
+    stt_port, control_port, audio_port = free_port(), free_port(), free_port()
+    fakes = [
+        await websockets.serve(stt.handle, "localhost", stt_port),
+        await websockets.serve(tts.handle_control, "localhost", control_port),
+        await websockets.serve(tts.handle_audio, "localhost", audio_port),
+    ]
+
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "offline")
+    # voice_server imports llm_connection from llm-cli
+    env["PYTHONPATH"] = os.pathsep.join(path for path in [LLM_DIR, env.get("PYTHONPATH")] if path)
+    llm_port, voice_port = free_port(), free_port()
+    llm_command = [sys.executable, os.path.join(LLM_DIR, "llm_server.py"), "--port", str(llm_port),
+                   "--metrics-port", "0", "--log-level", "WARNING"]
+    for override in fake_provider.endpoint_overrides("localhost", provider_port):
+        llm_command += ["--endpoint", override]
+    voice_command = [sys.executable, os.path.join(VOICE_DIR, "voice_server.py"), "--port", str(voice_port),
+                     "--stt-url", f"ws://localhost:{stt_port}", "--llm-url", f"ws://localhost:{llm_port}",
+                     "--tts-control-url", f"ws://localhost:{control_port}", "--tts-audio-url", f"ws://localhost:{audio_port}",
+                     "--provider", args.provider, "--log-level", "WARNING"]
+    processes = []
+    try:
+        processes.append(await asyncio.create_subprocess_exec(*llm_command, env=env, stdout=asyncio.subprocess.DEVNULL))
+        await wait_for_port("localhost", llm_port)
+        processes.append(await asyncio.create_subprocess_exec(*voice_command, env=env, stdout=asyncio.subprocess.DEVNULL))
+        await wait_for_port("localhost", voice_port)
+
+        metadata = json.dumps({"sampleRate": 16000}).encode("utf-8")
+        frame = struct.pack('<I', len(metadata)) + metadata + b"\0" * 2048
+        async with websockets.connect(f"ws://localhost:{voice_port}", max_size=None) as websocket:
+            json.loads(await websocket.recv())  # ready
+            turns = [await run_turn(websocket, frame) for _ in range(args.turns)]
+            barge_in = await run_turn(websocket, frame, barge_in=True)
+
+        stages = [name for name in turns[0] if name.endswith("_ms")]
+        report = {
+            "turns": args.turns,
+            "provider_ttft": args.ttft,
+            "stt_final": args.stt_final,
+            "tts_latency": args.tts_latency,
+            "latency": {name: summarize([turn[name] for turn in turns]) for name in stages},
+            "whole_answer_first_audio_ms": summarize([
+                turn["stt_final_ms"] + turn["llm_total_ms"] + args.tts_latency * 1000 for turn in turns]),
+            "barge_in": barge_in,
+        }
+        return report
+    finally:
+        for process in processes:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+        for server in fakes:
+            server.close()
+        provider_server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first audio of voice turns through the voice server")
+    parser.add_argument("--turns", type=int, default=5, help="Spoken turns to measure")
+    parser.add_argument("--provider", default="openai", help="Provider to request")
+    parser.add_argument("--stt-final", type=float, default=0.1, help="Seconds from the last partial to the full sentence")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="Seconds from a text fragment to its first audio chunk")
+    parser.add_argument("--chars-per-chunk", type=int, default=10, help="Characters of text per emulated audio chunk")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    fake_provider.add_arguments(parser)
+    parser.set_defaults(ttft=0.2, tokens=60, token_rate=30.0, sentence_words=8)
+    args = parser.parse_args()
+    report = asyncio.run(main_async(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
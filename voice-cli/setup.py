@@ -0,0 +1,13 @@
+from setuptools import setup, find_packages
+
+setup(
+    name="voice-cli",
+    version="0.1",
+    packages=find_packages(),
+    entry_points={
+        'console_scripts': [
+            'voice=voice_client:main',
+            'voice-server=voice_server:main',
+        ],
+    },
+)
@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import json
+import queue
+import struct
+import sys
+import threading
+
+import pyaudio
+import websockets
+
+# Microphone format expected by the STT server
+CHUNK = 1024
+FORMAT = pyaudio.paInt16
+CHANNELS = 1
+RATE = 16000
+
+PLAYBACK_FORMATS = {"int16": pyaudio.paInt16, "float32": pyaudio.paFloat32}
+
+
+class Player:
+    """Plays the received audio chunks in a thread; clear() drops what is buffered (barge-in)."""
+
+    def __init__(self, p):
+        self.p = p
+        self.stream = None
+        self.audio_format = None
+        self.chunks = queue.Queue()
+        self.thread = threading.Thread(target=self.play, daemon=True)
+        self.thread.start()
+
+    def open(self, audio_format):
+        if audio_format == self.audio_format:
+            return
+        self.chunks.put(audio_format)
+
+    def play(self):
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                break
+            if isinstance(item, dict):
+                if self.stream is not None:
+                    self.stream.close()
+                self.audio_format = item
+                self.stream = self.p.open(format=PLAYBACK_FORMATS[item["format"]], channels=1, rate=item["sample_rate"], output=True)
+            elif self.stream is not None:
+                self.stream.write(item)
+
+    def clear(self):
+        try:
+            while True:
+                item = self.chunks.get_nowait()
+                if isinstance(item, dict):
+                    self.chunks.put(item)
+                    break
+        except queue.Empty:
+            pass
+
+    def close(self):
+        self.chunks.put(None)
+        self.thread.join(timeout=2)
+        if self.stream is not None:
+            self.stream.close()
+
+
+class VoiceClient:
+    def __init__(self, args):
+        self.args = args
+        self.p = pyaudio.PyAudio()
+        self.player = Player(self.p)
+        self.recording = threading.Event()
+        self.answer_open = False
+
+    def debug_print(self, message):
+        if self.args.debug:
+            print(message, file=sys.stderr)
+
+    def record(self, loop, outgoing):
+        stream = self.p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
+        metadata = json.dumps({"sampleRate": RATE}).encode("utf-8")
+        header = struct.pack('<I', len(metadata)) + metadata
+        try:
+            while self.recording.is_set():
+                audio_data = stream.read(CHUNK, exception_on_overflow=False)
+                loop.call_soon_threadsafe(outgoing.put_nowait, header + audio_data)
+        finally:
+            stream.stop_stream()
+            stream.close()
+
+    async def send_audio(self, websocket, outgoing):
+        while True:
+            await websocket.send(await outgoing.get())
+
+    async def send_typed(self, websocket):
+        """--text: every line from stdin is one user turn."""
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                await asyncio.Future()  # keep listening to the answer
+            if line.strip():
+                await websocket.send(json.dumps({"type": "text", "text": line.strip()}))
+
+    def end_answer(self):
+        if self.answer_open:
+            print()
+            self.answer_open = False
+
+    async def receive(self, websocket):
+        async for message in websocket:
+            if isinstance(message, bytes):
+                self.player.chunks.put(message)
+                continue
+            event = json.loads(message)
+            kind = event.get("type")
+            if kind == "ready":
+                self.player.open(event["audio"])
+                self.debug_print(f"Session {event.get('session')}, audio {event['audio']}")
+            elif kind == "transcript" and event["final"]:
+                self.end_answer()
+                print(f"> {event['text']}")
+            elif kind == "transcript":
+                self.debug_print(f"  ... {event['text']}")
+            elif kind == "reply":
+                print(event["text"], end="", flush=True)
+                self.answer_open = True
+            elif kind == "turn_end":
+                self.end_answer()
+            elif kind == "barge_in":
+                self.player.clear()
+                self.end_answer()
+                self.debug_print(f"Turn {event['turn']} interrupted ({event['reason']})")
+            elif kind == "latency":
+                self.debug_print("Latency: " + ", ".join(f"{name[:-3]} {value:.0f}ms" for name, value in event.items() if name.endswith("_ms") and value is not None))
+            elif kind == "error":
+                self.end_answer()
+                print(f"Error: {event['error']}", file=sys.stderr)
+
+    async def run(self):
+        args = self.args
+        async with websockets.connect(args.server, max_size=None) as websocket:
+            config = {key: getattr(args, key) for key in ("system", "provider", "model") if getattr(args, key)}
+            if config or args.rvc:
+                await websocket.send(json.dumps(dict(config, type="config", rvc=args.rvc)))
+
+            tasks = [asyncio.create_task(self.receive(websocket))]
+            if args.text:
+                tasks.append(asyncio.create_task(self.send_typed(websocket)))
+            else:
+                outgoing = asyncio.Queue()
+                self.recording.set()
+                threading.Thread(target=self.record, args=(asyncio.get_running_loop(), outgoing), daemon=True).start()
+                tasks.append(asyncio.create_task(self.send_audio(websocket, outgoing)))
+                print("Listening, press Ctrl+C to stop.", file=sys.stderr)
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.recording.clear()
+                for task in tasks:
+                    task.cancel()
+
+    def close(self):
+        self.recording.clear()
+        self.player.close()
+        self.p.terminate()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Talk to the LLM through the voice server: microphone in, speech out")
+    parser.add_argument("--server", default="ws://localhost:8020", help="Voice server WebSocket URL")
+    parser.add_argument("--provider", help="LLM provider")
+    parser.add_argument("--model", help="LLM model")
+    parser.add_argument("--system", help="System message")
+    parser.add_argument("--rvc", action="store_true", help="Use RVC voice conversion")
+    parser.add_argument("--text", action="store_true", help="Type the turns on stdin instead of speaking them")
+    parser.add_argument("-D", "--debug", action="store_true", help="Print partial transcripts and per-turn latency")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_arguments()
+    client = VoiceClient(args)
+    try:
+        asyncio.run(client.run())
+    except KeyboardInterrupt:
+        pass
+    except (OSError, websockets.exceptions.InvalidHandshake) as e:
+        print(f"Could not connect to the voice server at {args.server}: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
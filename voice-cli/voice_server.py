@@ -0,0 +1,393 @@
+"""
+Voice turn orchestrator: chains the STT, LLM and TTS servers on the server
+side, so a voice conversation needs one WebSocket connection that carries
+microphone audio in and synthesized speech out.
+
+For every `fullSentence` of the STT server a turn starts: the sentence goes
+to llm_server, the streamed answer is cut into sentence fragments that are
+pushed to the TTS server as soon as they are complete, and the TTS audio
+chunks are forwarded to the client while the LLM is still generating.
+Speech of the user while the answer is playing (barge-in) cancels the turn
+in the LLM and TTS servers.
+
+Client to server:
+    binary                  microphone audio, framed like stt_client does
+                            (u32 LE metadata length, {"sampleRate"}, PCM16)
+    {"type": "text"}        a typed user turn, {"text": ...}
+    {"type": "cancel"}      stop the current turn
+    {"type": "config"}      change system, provider, model or rvc
+
+Server to client:
+    binary                  audio chunks in the format of the "ready" event
+    {"type": "ready"}       {"audio": {"format", "sample_rate"}}
+    {"type": "transcript"}  {"text", "final"}: STT results
+    {"type": "turn"}        {"turn", "text"}: a turn started
+    {"type": "reply"}       {"turn", "text"}: answer text as it streams
+    {"type": "barge_in"}    {"turn", "reason"}: the turn was cancelled, drop
+                            buffered audio
+    {"type": "turn_end"}    {"turn"}: the whole answer went to TTS
+    {"type": "latency"}     {"turn", ...}: per-stage latencies in ms
+    {"type": "error"}       {"error"}
+
+The LLM requests go through llm_connection.MultiplexedConnection, so llm-cli
+has to be installed (or on PYTHONPATH) next to voice-cli.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import websockets
+
+from llm_connection import MultiplexedConnection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STT_URL = "ws://localhost:8011"
+DEFAULT_LLM_URL = "ws://localhost:5000"
+DEFAULT_TTS_CONTROL_URL = "ws://localhost:8000"
+DEFAULT_TTS_AUDIO_URL = "ws://localhost:8001"
+
+# Format of the TTS server's audio chunks without and with RVC
+TTS_AUDIO_FORMATS = {
+    False: {"format": "int16", "sample_rate": 24000},
+    True: {"format": "float32", "sample_rate": 40000},
+}
+
+# A turn counts as speaking, and can be interrupted, until this many
+# seconds after its last audio chunk
+AUDIO_TAIL = 1.0
+
+
+class SentenceFragmenter:
+    """
+    Cuts streamed LLM text into fragments for TTS: at sentence ends once a
+    fragment has min_chars, at clause ends (, ; :) once it has clause_chars,
+    and at the last space before max_chars when there is neither. The first
+    fragment may end at a clause with just min_chars, so the first audio
+    does not wait for a whole sentence.
+    """
+
+    SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+    CLAUSE_END = re.compile(r"[,;:–—]\s+")
+
+    def __init__(self, min_chars: int = 8, clause_chars: int = 40, max_chars: int = 250):
+        self.min_chars = min_chars
+        self.clause_chars = clause_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.count = 0
+
+    def _cut(self) -> Optional[int]:
+        clause_chars = self.min_chars if self.count == 0 else self.clause_chars
+        cuts = [m.end() for m in self.SENTENCE_END.finditer(self.buffer) if m.end() >= self.min_chars]
+        cuts += [m.end() for m in self.CLAUSE_END.finditer(self.buffer) if m.end() >= clause_chars]
+        if cuts:
+            return min(cuts)
+        if len(self.buffer) > self.max_chars:
+            space = self.buffer.rfind(" ", 0, self.max_chars)
+            return space + 1 if space > 0 else self.max_chars
+        return None
+
+    def push(self, text: str) -> List[str]:
+        """Add streamed text, return the fragments it completed."""
+        self.buffer += text
+        fragments = []
+        while (cut := self._cut()) is not None:
+            fragment = self.buffer[:cut].strip()
+            self.buffer = self.buffer[cut:]
+            if fragment:
+                fragments.append(fragment)
+                self.count += 1
+        return fragments
+
+    def flush(self) -> Optional[str]:
+        """The rest of the text once the stream ended."""
+        fragment = self.buffer.strip()
+        self.buffer = ""
+        if fragment:
+            self.count += 1
+        return fragment or None
+
+
+class Turn:
+    """One user utterance and the answer to it, with the times of its stages."""
+
+    def __init__(self, turn_id: int, text: str, speech_end: float):
+        self.id = turn_id
+        self.text = text
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+        self.last_audio = None
+        self.marks = {"speech_end": speech_end, "sentence": time.monotonic()}
+        self.reported = False
+
+    def mark(self, stage: str):
+        self.marks.setdefault(stage, time.monotonic())
+
+    def speaking(self) -> bool:
+        if self.cancelled:
+            return False
+        if self.task is not None and not self.task.done():
+            return True
+        return self.last_audio is not None and time.monotonic() - self.last_audio < AUDIO_TAIL
+
+    def latency(self) -> Dict[str, float]:
+        """Milliseconds of each stage, from the end of speech (the last partial transcript) on."""
+        marks = self.marks
+
+        def between(start, end):
+            if start in marks and end in marks:
+                return round((marks[end] - marks[start]) * 1000, 1)
+            return None
+
+        return {
+            "stt_final_ms": between("speech_end", "sentence"),
+            "llm_first_token_ms": between("sentence", "llm_first_token"),
+            "first_fragment_ms": between("sentence", "first_fragment"),
+            "tts_first_audio_ms": between("first_fragment", "first_audio"),
+            "llm_total_ms": between("sentence", "llm_done"),
+            "time_to_first_audio_ms": between("speech_end", "first_audio"),
+        }
+
+
+class VoiceSession:
+    """
+    One client connection and its own connections to the STT, LLM and TTS
+    servers. The TTS server serves one user at a time, so only one session
+    runs at a time (see VoiceServer).
+    """
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.options = {"system": args.system, "provider": args.provider, "model": args.model, "rvc": args.rvc}
+        self.session_id = f"voice-{uuid.uuid4().hex}"
+        self.turn_ids = itertools.count(1)
+        self.llm_ids = itertools.count(1)
+        self.turn: Optional[Turn] = None
+        self.last_partial = None
+        self.stt = self.llm = self.tts_control = self.tts_audio = None
+
+    async def send_event(self, event_type: str, **fields):
+        try:
+            await self.client.send(json.dumps(dict(fields, type=event_type)))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def run(self):
+        args = self.args
+        async with websockets.connect(args.stt_url, max_size=None) as self.stt, \
+                websockets.connect(args.llm_url, max_size=None) as llm, \
+                websockets.connect(args.tts_control_url) as self.tts_control, \
+                websockets.connect(args.tts_audio_url, max_size=None) as self.tts_audio:
+            self.llm = MultiplexedConnection(llm)
+            await self.send_event("ready", audio=TTS_AUDIO_FORMATS[bool(self.options["rvc"])], session=self.session_id)
+            tasks = [asyncio.create_task(coroutine) for coroutine in (
+                self.read_client(), self.read_stt(), self.llm.read_frames(), self.read_tts_control(), self.read_tts_audio())]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None and not isinstance(task.exception(), websockets.exceptions.ConnectionClosed):
+                        raise task.exception()
+            finally:
+                await self.cancel_turn("disconnect", notify=False)
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Inputs
+
+    async def read_client(self):
+        async for message in self.client:
+            if isinstance(message, bytes):
+                await self.stt.send(message)
+                continue
+            try:
+                data = json.loads(message)
+            except json.JSONDecodeError:
+                await self.send_event("error", error="Invalid JSON")
+                continue
+            if data.get("type") == "text" and data.get("text", "").strip():
+                await self.start_turn(data["text"].strip(), time.monotonic())
+            elif data.get("type") == "cancel":
+                await self.cancel_turn("cancel")
+            elif data.get("type") == "config":
+                self.options.update({key: data[key] for key in self.options if key in data})
+                await self.send_event("ready", audio=TTS_AUDIO_FORMATS[bool(self.options["rvc"])], session=self.session_id)
+
+    async def read_stt(self):
+        async for message in self.stt:
+            data = json.loads(message)
+            text = data.get("text", "").strip()
+            if data.get("type") == "realtime":
+                self.last_partial = time.monotonic()
+                await self.send_event("transcript", text=text, final=False)
+                if text and self.args.barge_in and self.turn is not None and self.turn.speaking():
+                    await self.cancel_turn("barge_in")
+            elif data.get("type") == "fullSentence" and text:
+                await self.send_event("transcript", text=text, final=True)
+                await self.start_turn(text, self.last_partial or time.monotonic())
+                self.last_partial = None
+
+    async def read_tts_control(self):
+        async for message in self.tts_control:
+            logger.debug(f"TTS: {message}")  # acks of the text and synthesize messages
+
+    async def read_tts_audio(self):
+        async for chunk in self.tts_audio:
+            turn = self.turn
+            if turn is None or turn.cancelled:
+                continue  # left over from a cancelled turn
+            turn.last_audio = time.monotonic()
+            if "first_audio" not in turn.marks:
+                turn.mark("first_audio")
+                await self.report_latency(turn)
+            await self.client.send(chunk)
+
+    # Turns
+
+    async def start_turn(self, text: str, speech_end: float):
+        await self.cancel_turn("new_turn")
+        turn = Turn(next(self.turn_ids), text, speech_end)
+        self.turn = turn
+        await self.send_event("turn", turn=turn.id, text=text)
+        turn.task = asyncio.create_task(self.answer(turn))
+
+    async def cancel_turn(self, reason: str, notify: bool = True):
+        turn = self.turn
+        if turn is None or turn.cancelled:
+            return
+        was_speaking = turn.speaking()
+        turn.cancelled = True
+        if turn.task is not None and not turn.task.done():
+            turn.task.cancel()
+        if was_speaking:
+            try:
+                await self.tts_control.send(json.dumps({"type": "cancel"}))
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            logger.info(f"Turn {turn.id} cancelled ({reason})")
+            if notify:
+                await self.send_event("barge_in", turn=turn.id, reason=reason)
+
+    async def answer(self, turn: Turn):
+        """Stream the LLM answer of a turn into the TTS server, fragment by fragment."""
+        fragmenter = SentenceFragmenter(self.args.min_chars, self.args.clause_chars)
+        request = {
+            "user": turn.text,
+            "system": self.options["system"],
+            "provider": self.options["provider"],
+            "model": self.options["model"],
+            "session": self.session_id,
+        }
+
+        async def on_frame(frame):
+            if "delta" not in frame:
+                return
+            turn.mark("llm_first_token")
+            await self.send_event("reply", turn=turn.id, text=frame["delta"])
+            for fragment in fragmenter.push(frame["delta"]):
+                await self.speak(turn, fragment)
+
+        try:
+            # Cancelling the turn cancels the request in llm_server too
+            end = await self.llm.request(next(self.llm_ids), request, on_frame, self.args.llm_timeout)
+            if "error" in end:
+                await self.send_event("error", turn=turn.id, error=end["error"])
+                return
+            turn.mark("llm_done")
+            rest = fragmenter.flush()
+            if rest:
+                await self.speak(turn, rest)
+            await self.tts_control.send(json.dumps({"type": "synthesize"}))
+            await self.send_event("turn_end", turn=turn.id)
+            await self.report_latency(turn)
+        except asyncio.TimeoutError:
+            await self.send_event("error", turn=turn.id, error=f"No answer from the LLM server for {self.args.llm_timeout:g}s")
+
+    async def speak(self, turn: Turn, fragment: str):
+        # Not waiting for the acks: the TTS server queues the fragments in order
+        turn.mark("first_fragment")
+        logger.debug(f"Turn {turn.id} fragment: {fragment}")
+        await self.tts_control.send(json.dumps({"type": "text", "content": fragment, "rvc": bool(self.options["rvc"])}))
+
+    async def report_latency(self, turn: Turn):
+        """Send the stage latencies once the first audio arrived and the LLM finished."""
+        if turn.reported or "first_audio" not in turn.marks or "llm_done" not in turn.marks:
+            return
+        turn.reported = True
+        latency = turn.latency()
+        logger.info(f"Turn {turn.id} latency: {latency}")
+        await self.send_event("latency", turn=turn.id, **latency)
+
+
+class VoiceServer:
+    def __init__(self, args):
+        self.args = args
+        self.active: Optional[VoiceSession] = None
+
+    async def handle_client(self, websocket, path):
+        if self.active is not None:
+            await websocket.send(json.dumps({"type": "error", "error": "Another voice session is active"}))
+            return
+        session = VoiceSession(websocket, self.args)
+        self.active = session
+        logger.info(f"Voice session {session.session_id} started")
+        try:
+            await session.run()
+        except (OSError, websockets.exceptions.InvalidHandshake, websockets.exceptions.InvalidURI) as e:
+            logger.error(f"Could not reach the STT, LLM or TTS server: {e}")
+            await session.send_event("error", error=f"Could not reach the STT, LLM or TTS server: {e}")
+        finally:
+            self.active = None
+            logger.info(f"Voice session {session.session_id} ended")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Voice turn orchestrator chaining the STT, LLM and TTS servers")
+    parser.add_argument("--host", default="localhost", help="Host to bind the server to")
+    parser.add_argument("--port", type=int, default=8020, help="Port for the voice WebSocket")
+    parser.add_argument("--stt-url", default=DEFAULT_STT_URL, help="STT server WebSocket URL")
+    parser.add_argument("--llm-url", default=DEFAULT_LLM_URL, help="LLM server WebSocket URL")
+    parser.add_argument("--tts-control-url", default=DEFAULT_TTS_CONTROL_URL, help="TTS server control WebSocket URL")
+    parser.add_argument("--tts-audio-url", default=DEFAULT_TTS_AUDIO_URL, help="TTS server audio WebSocket URL")
+    parser.add_argument("--provider", default="lmstudio", help="LLM provider")
+    parser.add_argument("--model", help="LLM model")
+    parser.add_argument("--system", default="You are a voice assistant. Answer briefly, in plain spoken sentences.", help="System message")
+    parser.add_argument("--rvc", action="store_true", help="Use RVC voice conversion in the TTS server")
+    parser.add_argument("--no-barge-in", dest="barge_in", action="store_false", help="Do not cancel answers when the user starts speaking")
+    parser.add_argument("--min-chars", type=int, default=8, help="Shortest text fragment sent to TTS")
+    parser.add_argument("--clause-chars", type=int, default=40, help="Shortest fragment cut at a comma or semicolon (the first fragment uses --min-chars)")
+    parser.add_argument("--llm-timeout", type=float, default=30.0, help="Max seconds between two LLM frames")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="Set the logging level")
+    return parser.parse_args(argv)
+
+
+async def main_async(args):
+    server = VoiceServer(args)
+    async with websockets.serve(server.handle_client, args.host, args.port, max_size=None):
+        print(f"Voice server started on ws://{args.host}:{args.port}")
+        await asyncio.Future()
+
+
+def main():
+    args = parse_arguments()
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format='%(asctime)s.%(msecs)03d - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()